@@ -0,0 +1,71 @@
+"""Compare the pandas, Polars and Arrow backends on the same cleaning rules and prompt profile statistics.
+
+    python benchmarks/bench_backends.py --rows 1000000 --repeat 3
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from smartdata.backends import BACKENDS, check_backend, describe  # noqa: E402
+from smartdata.util import clean_dataframe  # noqa: E402
+
+def synthetic_frame(rows, numeric_columns, string_columns, seed=0):
+    """Numeric columns with missing values and outliers, string columns with padding and invalid tokens."""
+    rng = np.random.default_rng(seed)
+    data = {}
+    for i in range(numeric_columns):
+        values = rng.normal(size=rows)
+        values[rng.random(rows) < 0.05] = np.nan
+        data[f"num{i}"] = values
+    tokens = np.array([' alpha', 'beta ', 'gamma', 'N/A', 'null', ' delta ', 'epsilon', 'Blank'], dtype=object)
+    for i in range(string_columns):
+        values = tokens[rng.integers(0, len(tokens), rows)]
+        values[rng.random(rows) < 0.05] = None
+        data[f"str{i}"] = values
+    return pd.DataFrame(data)
+
+def best_of(repeat, function):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--numeric-columns', type=int, default=8)
+    parser.add_argument('--string-columns', type=int, default=4)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    df = synthetic_frame(args.rows, args.numeric_columns, args.string_columns)
+    print(f"{args.rows} rows, {args.numeric_columns} numeric and {args.string_columns} string columns, best of {args.repeat}\n")
+    print(f"{'backend':<10}{'clean (s)':>12}{'speedup':>10}{'describe (s)':>15}{'speedup':>10}  same result")
+
+    reference = None
+    for backend in BACKENDS:
+        try:
+            check_backend(backend)
+        except ImportError as e:
+            print(f"{backend:<10}skipped: {e}")
+            continue
+        clean_seconds, (df_clean, summary) = best_of(args.repeat, lambda: clean_dataframe(df, backend=backend))
+        describe_seconds, df_describe = best_of(args.repeat, lambda: df.describe() if backend == 'pandas' else describe(df, backend))
+        if reference is None:
+            reference = clean_seconds, describe_seconds, df_clean, summary, df_describe
+        same = (summary == reference[3] and df_describe.to_markdown() == reference[4].to_markdown()
+                and np.allclose(df_clean.select_dtypes('number'), reference[2].select_dtypes('number'))
+                and df_clean.select_dtypes('object').equals(reference[2].select_dtypes('object')))
+        print(f"{backend:<10}{clean_seconds:>12.3f}{reference[0] / clean_seconds:>9.1f}x"
+              f"{describe_seconds:>15.3f}{reference[1] / describe_seconds:>9.1f}x  {same}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""Time `import smartdata` in fresh interpreters and check it against the import-time budgets.
+
+    python benchmarks/bench_import.py --repeat 5
+
+Exits with an error when a statement takes longer than its budget or loads a module that should only be loaded on
+first use of SmartData.create_model / run_model.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# Milliseconds; pandas alone takes a few hundred, and the default model client and agent stack about a second more
+BUDGETS_MS = {
+    'import smartdata': 50,
+    'from smartdata import SmartData': 1000,
+}
+
+# Heavy modules that only create_model and run_model may load
+LAZY_MODULES = ['langchain_openai', 'openai', 'langchain.agents', 'langchain_experimental']
+
+PROBE = """import json, sys, time
+start = time.perf_counter()
+{statement}
+seconds = time.perf_counter() - start
+print(json.dumps({{'seconds': seconds, 'loaded': sorted(m for m in {lazy!r} if m in sys.modules)}}))
+"""
+
+def run_probe(statement):
+    output = subprocess.run([sys.executable, '-c', PROBE.format(statement=statement, lazy=LAZY_MODULES)], cwd=ROOT,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def importtime(statement):
+    """(module, depth, cumulative ms) of every import python -X importtime reports for statement."""
+    stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', statement], cwd=ROOT,
+                            capture_output=True, text=True, check=True).stderr
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        imports.append((name.strip(), (len(name) - len(name.lstrip()) - 1) // 2, int(cumulative) / 1000))
+    return imports
+
+def heaviest_imports(statement, top=5):
+    """Modules with the largest cumulative import time among those imported directly by a top-level module of statement."""
+    startup = {name for name, _, _ in importtime('pass')}
+    imports = [(name, ms) for name, depth, ms in importtime(statement) if depth == 1 and name not in startup]
+    return sorted(imports, key=lambda item: -item[1])[:top]
+
+def measure_imports(repeat=5):
+    """Best and median milliseconds of each budgeted statement, the lazy modules it loaded and its heaviest imports."""
+    results = []
+    for statement, budget in BUDGETS_MS.items():
+        probes = [run_probe(statement) for _ in range(repeat)]
+        milliseconds = [probe['seconds'] * 1000 for probe in probes]
+        results.append({
+            'name': statement,
+            'seconds': min(milliseconds) / 1000,
+            'median_seconds': statistics.median(milliseconds) / 1000,
+            'budget_seconds': budget / 1000,
+            'lazy_modules_loaded': probes[-1]['loaded'],
+            'heaviest_imports_ms': dict(heaviest_imports(statement)),
+        })
+    return results
+
+def over_budget(results):
+    problems = []
+    for result in results:
+        if result['seconds'] > result['budget_seconds']:
+            problems.append(f"{result['name']} took {result['seconds'] * 1000:.0f} ms, over its {result['budget_seconds'] * 1000:.0f} ms budget")
+        if result['lazy_modules_loaded']:
+            problems.append(f"{result['name']} loaded {', '.join(result['lazy_modules_loaded'])}")
+    return problems
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    results = measure_imports(args.repeat)
+    for result in results:
+        heaviest = ', '.join(f"{name} {ms:.0f} ms" for name, ms in result['heaviest_imports_ms'].items())
+        print(f"{result['name']:<36}{result['seconds'] * 1000:>8.0f} ms (budget {result['budget_seconds'] * 1000:.0f} ms)  {heaviest}")
+    problems = over_budget(results)
+    if problems:
+        sys.exit('\n'.join(problems))
+
+if __name__ == '__main__':
+    main()
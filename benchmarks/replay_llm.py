@@ -0,0 +1,96 @@
+"""A deterministic chat model that replays recorded tool-calling traces, so SmartData runs without calling OpenAI."""
+import json
+import threading
+import time
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from pydantic import PrivateAttr
+
+PLOT_CODE = """import matplotlib.pyplot as plt
+column = df.select_dtypes('number').columns[0]
+fig, ax = plt.subplots(figsize=(8, 6))
+ax.hist(df[column].dropna(), bins=20)
+ax.set_title(column)
+plt.tight_layout()"""
+
+UPDATE_CODE = """df_update = df.copy()
+column = df_update.select_dtypes('number').columns[0]
+df_update[column] = df_update[column] * 2"""
+
+SUMMARY_CODE = """print(df.shape)
+print(df.select_dtypes('number').mean().round(2))"""
+
+# Each scenario is a list of traces, one per agent run; a trace is a list of steps, either {'code': ...} run
+# through the python_repl_ast tool or a final {'answer': ...}. An answer that contains one of the
+# AGENT_STOP_SUBSTRING_LIST strings makes run_model retry, which replays the next trace.
+TRACES = {
+    'answer': [[{'code': SUMMARY_CODE}, {'answer': 'The data has the rows and column means printed above.'}]],
+    'plot': [[{'code': PLOT_CODE}, {'answer': 'Here is the histogram of the first numeric column.'}]],
+    'df_update': [[{'code': UPDATE_CODE}, {'answer': 'I doubled the first numeric column.'}]],
+    'retry': [
+        [{'answer': 'Agent stopped due to iteration limit or time limit.'}],
+        [{'code': PLOT_CODE}, {'answer': 'import pandas as pd\nimport matplotlib.pyplot as plt'}],
+        [{'code': PLOT_CODE}, {'answer': 'Here is the histogram of the first numeric column.'}],
+    ],
+}
+
+def load_traces(path):
+    """Scenarios recorded as JSON in the TRACES layout."""
+    with open(path, encoding='utf-8') as file:
+        return json.load(file)
+
+class ReplayChatModel(BaseChatModel):
+    """Replays traces in order, one per agent run, and starts over after the last one.
+
+    Token usage is estimated at four characters per token, and latency seconds are slept per call to stand in
+    for the network, so traces and overhead numbers look like those of a real model.
+    """
+    traces: list
+    latency: float = 0.0
+    runs: int = 0
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    @property
+    def _llm_type(self):
+        return 'replay'
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def reset(self):
+        with self._lock:
+            self.runs = 0
+
+    def _next_run(self):
+        with self._lock:
+            run = self.runs
+            self.runs += 1
+        return run
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        # The steps of the current run are the AI messages after the question
+        question = max(i for i, message in enumerate(messages) if isinstance(message, HumanMessage))
+        replies = [message for message in messages[question + 1:] if isinstance(message, AIMessage)]
+        if replies:
+            # The tool call id carries the run, so concurrent runs each follow their own trace
+            run = int(replies[0].tool_calls[0]['id'].split('_')[1])
+        else:
+            run = self._next_run()
+        trace = self.traces[run % len(self.traces)]
+        step = trace[min(len(replies), len(trace) - 1)]
+        if 'code' in step:
+            text = step['code']
+            message = AIMessage(content='', tool_calls=[{'name': 'python_repl_ast', 'args': {'query': text},
+                                                         'id': f"call_{run}_{len(replies)}"}])
+        else:
+            text = step['answer']
+            message = AIMessage(content=text)
+        input_tokens = sum(len(str(message.content)) for message in messages) // 4
+        output_tokens = len(text) // 4
+        message.usage_metadata = {'input_tokens': input_tokens, 'output_tokens': output_tokens,
+                                  'total_tokens': input_tokens + output_tokens}
+        return ChatResult(generations=[ChatGeneration(message=message)])
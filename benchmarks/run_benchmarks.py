@@ -0,0 +1,265 @@
+"""Measure SmartData's own overhead offline: import time, cleaning throughput, prompt build time, run_model end to end and peak memory.
+
+The chat model is a ReplayChatModel, so no API key or network is needed. Results are written as JSON, and
+--compare flags every benchmark that got slower than a saved result by more than --threshold.
+
+    python benchmarks/run_benchmarks.py --output results.json
+    python benchmarks/run_benchmarks.py --rows 10000 --output new.json --compare results.json
+"""
+import argparse
+import contextlib
+import datetime
+import io
+import itertools
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+import warnings
+
+import numpy as np
+import pandas as pd
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARK_DIR, '..'))
+
+# ChatOpenAI is built for the default model even though the replay model answers every call
+os.environ.setdefault('OPENAI_API_KEY', 'offline-benchmark')
+
+import matplotlib  # noqa: E402
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt  # noqa: E402
+
+from bench_import import measure_imports  # noqa: E402
+from replay_llm import TRACES, ReplayChatModel, load_traces  # noqa: E402
+from synthetic import MIXES, make_frame  # noqa: E402
+from smartdata import SmartData  # noqa: E402
+from smartdata.tracing import Tracer  # noqa: E402
+from smartdata.util import clean_dataframe  # noqa: E402
+
+MB = 1024 * 1024
+
+def timed(repeat, function):
+    """Best and mean seconds of repeat calls, and the last result."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    return min(times), statistics.mean(times), result
+
+def peak_memory_mb(function):
+    """Peak Python memory allocated while function runs; measured apart from timings since tracemalloc slows code down."""
+    tracemalloc.start()
+    try:
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak / MB
+
+def bench_import(args):
+    results = measure_imports(args.repeat)
+    for result in results:
+        print_result(result, f"budget {result['budget_seconds'] * 1000:.0f} ms")
+    return results
+
+def bench_clean(args):
+    results = []
+    for rows, columns, dirty_ratio, mix in itertools.product(args.rows, args.columns, args.dirty, args.mix):
+        df = make_frame(rows, columns, dirty_ratio, mix)
+        data_mb = df.memory_usage(deep=True).sum() / MB
+        best, mean, (df_clean, _) = timed(args.repeat, lambda: clean_dataframe(df))
+        clean_mb = df_clean.memory_usage(deep=True).sum() / MB
+        results.append({
+            'name': f"clean rows={rows} columns={columns} dirty={dirty_ratio} mix={mix}",
+            'rows': rows, 'columns': columns, 'dirty_ratio': dirty_ratio, 'mix': mix,
+            'seconds': best, 'mean_seconds': mean,
+            'rows_per_second': rows / best, 'mb_per_second': data_mb / best, 'data_mb': data_mb,
+            'peak_memory_mb': peak_memory_mb(lambda: clean_dataframe(df)),
+        })
+        print_result(results[-1], f"{results[-1]['rows_per_second']:,.0f} rows/s")
+        serial_seconds = best
+        for workers, parallel_backend in itertools.product(args.workers, args.parallel_backend):
+            if workers <= 1:
+                continue
+            best, mean, _ = timed(args.repeat, lambda: clean_dataframe(df, workers=workers, parallel_backend=parallel_backend))
+            results.append({
+                'name': f"clean workers={workers} parallel_backend={parallel_backend} rows={rows} columns={columns} dirty={dirty_ratio} mix={mix}",
+                'rows': rows, 'columns': columns, 'dirty_ratio': dirty_ratio, 'mix': mix,
+                'workers': workers, 'parallel_backend': parallel_backend,
+                'seconds': best, 'mean_seconds': mean, 'rows_per_second': rows / best, 'speedup': serial_seconds / best,
+            })
+            print_result(results[-1], f"{results[-1]['speedup']:.2f}x serial")
+        if args.compact:
+            best, mean, (df_compact, _) = timed(args.repeat, lambda: clean_dataframe(df, compact=True))
+            compact_mb = df_compact.memory_usage(deep=True).sum() / MB
+            results.append({
+                'name': f"clean compact rows={rows} columns={columns} dirty={dirty_ratio} mix={mix}",
+                'rows': rows, 'columns': columns, 'dirty_ratio': dirty_ratio, 'mix': mix,
+                'seconds': best, 'mean_seconds': mean, 'rows_per_second': rows / best,
+                'clean_mb': clean_mb, 'compact_mb': compact_mb, 'memory_reduction': clean_mb / compact_mb,
+            })
+            print_result(results[-1], f"{results[-1]['memory_reduction']:.1f}x less memory")
+    return results
+
+def bench_prompt(args):
+    # A new session has no cached profile, so create_model profiles the data and builds the prompt and agent
+    results = []
+    llm = ReplayChatModel(traces=TRACES['answer'])
+    # LangChain's agent modules are imported on the first create_model, which the import benchmark covers
+    SmartData(make_frame(10, 2), llm=llm).create_model(seed=0)
+    for rows, columns in itertools.product(args.rows, args.columns):
+        df = make_frame(rows, columns, 0.05, 'mixed')
+        session_seconds, _, _ = timed(args.repeat, lambda: SmartData(df, llm=llm))
+
+        def cold_build():
+            smartdata = SmartData(df, llm=llm)
+            start = time.perf_counter()
+            prompt, _ = smartdata.create_model(seed=0)
+            return time.perf_counter() - start, smartdata, prompt
+        builds = [cold_build() for _ in range(args.repeat)]
+        smartdata, prompt = builds[-1][1], builds[-1][2]
+        cached_seconds, _, _ = timed(args.repeat, lambda: smartdata.create_model(seed=0))
+        results.append({
+            'name': f"prompt rows={rows} columns={columns}",
+            'rows': rows, 'columns': columns,
+            'seconds': min(build[0] for build in builds), 'mean_seconds': statistics.mean(build[0] for build in builds),
+            'cached_seconds': cached_seconds, 'session_seconds': session_seconds,
+            'prompt_chars': len(str(prompt)),
+            'peak_memory_mb': peak_memory_mb(lambda: SmartData(df, llm=llm).create_model(seed=0)),
+        })
+        print_result(results[-1], f"cached {cached_seconds * 1000:.2f} ms")
+    return results
+
+def bench_run_model(args, traces):
+    results = []
+    df = make_frame(args.run_rows, args.run_columns, 0.05, 'mixed')
+    for scenario in args.scenarios:
+        llm = ReplayChatModel(traces=traces[scenario], latency=args.latency)
+        smartdata = SmartData(df, llm=llm, tracer=Tracer())
+        summaries = []
+        for i in range(args.questions + 1):
+            # Generated code prints its results again when SmartData runs it
+            with contextlib.redirect_stdout(io.StringIO()):
+                result = smartdata.run_model(f"{scenario} question {i}")
+            plt.close('all')
+            # The first question builds the prompt; the others show the steady state
+            summaries.append(result.summary)
+        first, steady = summaries[0], summaries[1:]
+        seconds = [summary['seconds'] for summary in steady]
+        llm_seconds = [summary['phases'].get('llm', {}).get('seconds', 0.0) for summary in steady]
+        phases = {}
+        for summary in steady:
+            for name, phase in summary['phases'].items():
+                phases[name] = phases.get(name, 0.0) + phase['seconds'] / len(steady)
+        llm.reset()
+        with contextlib.redirect_stdout(io.StringIO()):
+            peak = peak_memory_mb(lambda: smartdata.run_model(f"{scenario} peak memory"))
+        plt.close('all')
+        results.append({
+            'name': f"run_model scenario={scenario} rows={args.run_rows} columns={args.run_columns}",
+            'scenario': scenario, 'rows': args.run_rows, 'columns': args.run_columns, 'questions': len(steady),
+            'seconds': statistics.median(seconds), 'mean_seconds': statistics.mean(seconds),
+            'p95_seconds': float(np.percentile(seconds, 95)), 'first_seconds': first['seconds'],
+            # Time spent outside the chat model: prompt, agent, tools, code execution and memory
+            'overhead_seconds': statistics.median(total - llm for total, llm in zip(seconds, llm_seconds)),
+            'attempts': statistics.mean(summary['attempts'] for summary in steady),
+            'llm_calls': statistics.mean(summary['llm_calls'] for summary in steady),
+            'total_tokens': statistics.mean(summary['total_tokens'] for summary in steady),
+            'phase_seconds': phases,
+            'peak_memory_mb': peak,
+        })
+        print_result(results[-1], f"overhead {results[-1]['overhead_seconds'] * 1000:.1f} ms")
+    return results
+
+def print_result(result, detail):
+    peak = f"peak {result['peak_memory_mb']:.1f} MB" if 'peak_memory_mb' in result else ''
+    print(f"{result['name']:<60}{result['seconds'] * 1000:>10.1f} ms  {detail:<24}{peak}")
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCHMARK_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def environment():
+    import langchain
+    return {
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'langchain': langchain.__version__,
+    }
+
+def compare(results, baseline, threshold):
+    """Benchmarks of results whose seconds grew more than threshold times over the same benchmark in baseline."""
+    previous = {result['name']: result for group in baseline['benchmarks'].values() for result in group}
+    regressions = []
+    print(f"\nCompared with {baseline['environment'].get('commit')} ({baseline['environment'].get('timestamp')}):")
+    for group in results['benchmarks'].values():
+        for result in group:
+            if result['name'] not in previous:
+                continue
+            ratio = result['seconds'] / previous[result['name']]['seconds']
+            regressed = ratio > threshold
+            if regressed:
+                regressions.append(result['name'])
+            print(f"{result['name']:<60}{ratio:>8.2f}x{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--columns', type=int, nargs='+', default=[12, 48])
+    parser.add_argument('--dirty', type=float, nargs='+', default=[0.0, 0.1])
+    parser.add_argument('--mix', nargs='+', choices=list(MIXES), default=list(MIXES))
+    parser.add_argument('--workers', type=int, nargs='+', default=[1], help='also clean with each of these worker counts above 1')
+    parser.add_argument('--parallel-backend', nargs='+', choices=['thread', 'process'], default=['thread', 'process'])
+    parser.add_argument('--compact', action='store_true', help='also clean with compact=True and report the memory saved')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--run-rows', type=int, default=10000)
+    parser.add_argument('--run-columns', type=int, default=12)
+    parser.add_argument('--scenarios', nargs='+', default=list(TRACES))
+    parser.add_argument('--traces', help='JSON file of recorded traces to replay instead of the built-in ones')
+    parser.add_argument('--questions', type=int, default=10, help='run_model questions per scenario, after a first one')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds the replay model sleeps per call')
+    parser.add_argument('--skip', nargs='+', choices=['import', 'clean', 'prompt', 'run_model'], default=[])
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='JSON results of an earlier run to check for regressions')
+    parser.add_argument('--threshold', type=float, default=1.25, help='slowdown ratio reported as a regression')
+    args = parser.parse_args()
+    # Plot add-on and deprecation warnings of every run would bury the results
+    warnings.simplefilter('ignore')
+
+    traces = load_traces(args.traces) if args.traces else TRACES
+    unknown = [scenario for scenario in args.scenarios if scenario not in traces]
+    if unknown:
+        parser.error(f"no traces for scenarios {unknown}; available: {list(traces)}")
+
+    results = {'environment': environment(), 'arguments': vars(args), 'benchmarks': {}}
+    for group, bench in [('import', bench_import), ('clean', bench_clean), ('prompt', bench_prompt),
+                         ('run_model', lambda args: bench_run_model(args, traces))]:
+        if group not in args.skip:
+            results['benchmarks'][group] = bench(args)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2)
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as file:
+            regressions = compare(results, json.load(file), args.threshold)
+        if regressions:
+            sys.exit(f"{len(regressions)} benchmarks regressed by more than {args.threshold:.2f}x")
+
+if __name__ == '__main__':
+    main()
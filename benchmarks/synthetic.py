@@ -0,0 +1,62 @@
+"""Synthetic dataframes for the benchmarks, with a chosen size, dtype mix and share of dirty values."""
+import numpy as np
+import pandas as pd
+
+# Column kinds that each dtype mix cycles through
+MIXES = {
+    'numeric': ['float', 'int', 'float', 'int'],
+    'mixed': ['float', 'int', 'category', 'datetime', 'text', 'bool'],
+    'text': ['category', 'text', 'category', 'float'],
+}
+
+CATEGORIES = np.array(['United States', 'USA', 'us', 'Canada', 'canada', 'Mexico', 'Female', 'F', 'female', 'Male'], dtype=object)
+WORDS = np.array(['alpha', 'beta', 'gamma', 'delta', 'epsilon', 'zeta', 'eta', 'theta'], dtype=object)
+INVALID_TOKENS = np.array(['N/A', 'null', 'NaN', ' ', 'Blank', 'none'], dtype=object)
+
+def make_column(kind, rows, dirty_ratio, rng):
+    """One column of a kind; dirty_ratio of its cells are missing, invalid tokens, padded text or outliers."""
+    dirty = rng.random(rows) < dirty_ratio
+    if kind == 'float':
+        values = rng.normal(50.0, 10.0, rows)
+        outliers = dirty & (rng.random(rows) < 0.5)
+        values[outliers] *= 100
+        values[dirty & ~outliers] = np.nan
+        return values
+    if kind == 'int':
+        values = rng.integers(18, 65, rows)
+        # Without missing values the column stays an integer column
+        if not dirty.any():
+            return values
+        values = values.astype(float)
+        values[dirty] = np.nan
+        return values
+    if kind == 'bool':
+        return rng.random(rows) < 0.5
+    if kind == 'datetime':
+        values = pd.Series(pd.Timestamp('2020-01-01') + pd.to_timedelta(rng.integers(0, 1500, rows), unit='D'))
+        values[dirty] = pd.NaT
+        return values
+    if kind == 'category':
+        values = CATEGORIES[rng.integers(0, len(CATEGORIES), rows)]
+    else:
+        values = (WORDS[rng.integers(0, len(WORDS), rows)] + ' ' + WORDS[rng.integers(0, len(WORDS), rows)]).astype(object)
+    if dirty.any():
+        kinds = rng.integers(0, 3, rows)
+        values[dirty & (kinds == 0)] = None
+        invalid = dirty & (kinds == 1)
+        values[invalid] = INVALID_TOKENS[rng.integers(0, len(INVALID_TOKENS), int(invalid.sum()))]
+        padded = dirty & (kinds == 2)
+        values[padded] = ' ' + values[padded] + ' '
+    return values
+
+def make_frame(rows, columns, dirty_ratio=0.05, mix='mixed', seed=0):
+    """A frame of rows x columns whose column kinds cycle through MIXES[mix]."""
+    if mix not in MIXES:
+        raise ValueError(f"Unknown dtype mix {mix!r}; use one of {list(MIXES)}.")
+    rng = np.random.default_rng(seed)
+    kinds = MIXES[mix]
+    data = {}
+    for i in range(columns):
+        kind = kinds[i % len(kinds)]
+        data[f"{kind}_{i}"] = make_column(kind, rows, dirty_ratio, rng)
+    return pd.DataFrame(data)
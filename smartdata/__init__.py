@@ -1,3 +1,12 @@
 # smartdata/__init__.py
-from .modeler import SmartData
+# SmartData is imported on first access, so `import smartdata` does not load pandas or LangChain
 __all__ = ['SmartData']
+
+def __getattr__(name):
+    if name == 'SmartData':
+        from .modeler import SmartData
+        return SmartData
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,235 @@
+import numpy as np
+import pandas as pd
+
+from .util import INVALID_VALUE_LIST, build_clean_summary_md, clean_categorical_columns, clean_datetime_columns, \
+    clean_numeric_columns, legacy_numeric_dtype, merge_clean_summaries, new_clean_summary
+
+BACKENDS = ['pandas', 'polars', 'arrow']
+
+def check_backend(backend):
+    """Raise if backend is unknown or its package is not installed."""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unsupported backend {backend}. It must be one of {', '.join(map(repr, BACKENDS))}.")
+    if backend == 'pandas':
+        return
+    try:
+        import pyarrow  # noqa: F401
+        if backend == 'polars':
+            import polars  # noqa: F401
+    except ImportError as e:
+        package = 'polars pyarrow' if backend == 'polars' else 'pyarrow'
+        raise ImportError(f"`{backend}` backend needs packages that are not installed, please install with `pip install {package}`") from e
+
+def is_string_column(series):
+    """Object column holding only strings and missing values, which Arrow can hold as a string array."""
+    return series.dtype == object and pd.api.types.infer_dtype(series, skipna=True) == 'string'
+
+def _arrow_columns(df):
+    """Arrow arrays of the plain numeric and string columns of df, keyed by column position.
+
+    Numeric columns without missing values share their buffers with pandas. Every other column
+    is left to pandas.
+    """
+    import pyarrow as pa
+    numeric, strings, arrays = [], [], {}
+    for position in range(df.shape[1]):
+        series = df.iloc[:, position]
+        if isinstance(series.dtype, np.dtype) and series.dtype.kind in 'iuf':
+            numeric.append(position)
+        elif is_string_column(series):
+            strings.append(position)
+        else:
+            continue
+        arrays[position] = pa.Array.from_pandas(series)
+    return numeric, strings, arrays
+
+def _to_numpy(array):
+    # Zero-copy for numeric arrays without nulls; strings come back as an object array
+    return array.to_numpy(zero_copy_only=False)
+
+def _clean_arrow(arrays, numeric, strings, length, summary):
+    """Arrow compute version of clean_numeric_columns and clean_categorical_columns."""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    invalid_values = pa.array(INVALID_VALUE_LIST)
+    for position in numeric:
+        array = arrays[position]
+        missing_count = array.null_count
+        if missing_count > 0:
+            array = pc.fill_null(array, pc.mean(array).cast(array.type))
+            summary['numeric_columns_filled'][position] = missing_count
+        lower_bound, upper_bound = pc.quantile(array, q=[0.01, 0.99], interpolation='linear').to_pylist()
+        lower_capped = pc.sum(pc.less(array, lower_bound)).as_py() or 0
+        upper_capped = pc.sum(pc.greater(array, upper_bound)).as_py() or 0
+        if lower_capped > 0 or upper_capped > 0:
+            # Capped columns become float64, as the bounds are
+            array = pc.min_element_wise(pc.max_element_wise(array.cast(pa.float64()), lower_bound), upper_bound)
+            summary['numeric_outliers_capped'][position] = {'lower_capped': lower_capped, 'upper_capped': upper_capped}
+        arrays[position] = array
+    for position in strings:
+        array, extra_missing = arrays[position]
+        # Strip and match each distinct value once
+        encoded = pc.dictionary_encode(array)
+        stripped = pc.utf8_trim_whitespace(encoded.dictionary)
+        invalid = pc.take(pc.is_in(pc.utf8_lower(stripped), value_set=invalid_values), encoded.indices)
+        missing_count = pc.sum(invalid).as_py() or 0
+        if length > 0 and (missing_count + extra_missing) / length > 0.9:
+            del arrays[position]
+            summary['categorical_columns_removed'].append(position)
+            continue
+        stripped = pc.take(stripped, encoded.indices)
+        if missing_count > 0:
+            stripped = pc.if_else(invalid, 'Not Specified', stripped)
+            summary['categorical_columns_filled'][position] = missing_count
+        arrays[position] = stripped
+    return {position: _to_numpy(array) for position, array in arrays.items()}
+
+def _clean_polars(arrays, numeric, strings, length, summary):
+    """Polars version of clean_numeric_columns and clean_categorical_columns, run on all columns at once."""
+    import polars as pl
+    import pyarrow as pa
+    names = [str(position) for position in numeric + strings]
+    extra_missing = {str(position): arrays[position][1] for position in strings}
+    columns = [arrays[position] for position in numeric] + [arrays[position][0] for position in strings]
+    frame = pl.from_arrow(pa.Table.from_arrays(columns, names=names), rechunk=False)
+    numeric_names, string_names = names[:len(numeric)], names[len(numeric):]
+    null_counts = frame.select(numeric_names).null_count().row(0)
+
+    frame = frame.lazy().with_columns(
+        [pl.col(name).fill_null(strategy='mean') for name in numeric_names] +
+        [pl.col(name).str.strip_chars() for name in string_names]
+    ).with_columns(
+        [pl.col(name).str.to_lowercase().is_in(INVALID_VALUE_LIST).alias(f"{name}:invalid") for name in string_names]
+    ).collect().rechunk()
+    # Quantiles of a chunked column are several times slower, hence the rechunk above
+    bounds = {q: frame.select([pl.col(name).cast(pl.Float64).quantile(q, interpolation='linear') for name in numeric_names]).row(0)
+              for q in (0.01, 0.99)} if numeric_names else {0.01: (), 0.99: ()}
+    counts = frame.select(
+        [(pl.col(name) < lower).sum().alias(f"{name}:lower") for name, lower in zip(numeric_names, bounds[0.01])] +
+        [(pl.col(name) > upper).sum().alias(f"{name}:upper") for name, upper in zip(numeric_names, bounds[0.99])] +
+        [pl.col(f"{name}:invalid").sum() for name in string_names]
+    ).row(0) if names else ()
+
+    updates, removed = [], []
+    for i, (position, name) in enumerate(zip(numeric, numeric_names)):
+        if null_counts[i] > 0:
+            summary['numeric_columns_filled'][position] = null_counts[i]
+        lower_capped, upper_capped = counts[i], counts[len(numeric) + i]
+        if lower_capped > 0 or upper_capped > 0:
+            updates.append(pl.col(name).cast(pl.Float64).clip(bounds[0.01][i], bounds[0.99][i]))
+            summary['numeric_outliers_capped'][position] = {'lower_capped': lower_capped, 'upper_capped': upper_capped}
+    for i, (position, name) in enumerate(zip(strings, string_names)):
+        missing_count = counts[2 * len(numeric) + i]
+        if length > 0 and (missing_count + extra_missing[name]) / length > 0.9:
+            removed.append(name)
+            summary['categorical_columns_removed'].append(position)
+        elif missing_count > 0:
+            updates.append(pl.when(pl.col(f"{name}:invalid")).then(pl.lit('Not Specified')).otherwise(pl.col(name)).alias(name))
+            summary['categorical_columns_filled'][position] = missing_count
+    frame = frame.with_columns(updates).drop(removed + [f"{name}:invalid" for name in string_names])
+    return {int(name): _to_numpy(frame.get_column(name).to_arrow()) for name in frame.columns}
+
+def clean_dataframe_backend(df, backend):
+    """Same rules and summary as clean_dataframe, with numeric and string columns cleaned by Polars or Arrow compute.
+
+    Columns neither backend can hold without changing their values (mixed object columns, extension
+    dtypes) are cleaned by pandas, and datetime columns are filled by pandas as before.
+    """
+    import pyarrow.compute as pc
+    check_backend(backend)
+    summary = new_clean_summary()
+    # Numeric columns take the dtypes of the pandas engine first, e.g. float32 and Int64 with NA become float64
+    upcast = {position: legacy_numeric_dtype(df.iloc[:, position]) for position in range(df.shape[1])
+              if pd.api.types.is_numeric_dtype(df.dtypes.iloc[position]) and not pd.api.types.is_bool_dtype(df.dtypes.iloc[position])}
+    upcast = {position: dtype for position, dtype in upcast.items() if df.dtypes.iloc[position] != dtype}
+    if upcast:
+        df = df.copy(deep=False)
+        for position, dtype in upcast.items():
+            series = df.iloc[:, position]
+            df.isetitem(position, series.to_numpy(dtype=dtype, na_value=np.nan) if dtype.kind == 'f' else series.astype(dtype))
+    numeric, strings, arrays = _arrow_columns(df)
+
+    # 1. Remove empty rows and columns
+    null_masks = [_to_numpy(arrays[position].is_null()) if position in arrays else df.iloc[:, position].isna().to_numpy()
+                  for position in range(df.shape[1])]
+    empty_rows = np.logical_and.reduce(null_masks) if null_masks else np.zeros(len(df), dtype=bool)
+    kept_rows = np.flatnonzero(~empty_rows)
+    kept_columns = [position for position, mask in enumerate(null_masks) if not mask[kept_rows].all()]
+    summary['rows_removed'] = len(df) - len(kept_rows)
+    summary['columns_removed'] = df.shape[1] - len(kept_columns)
+    if len(kept_rows) < len(df):
+        arrays = {position: array.take(kept_rows) for position, array in arrays.items()}
+    numeric = [position for position in numeric if position in kept_columns]
+    strings = [position for position in strings if position in kept_columns]
+    arrays = {position: arrays[position] for position in numeric + strings}
+    others = df.iloc[kept_rows, [position for position in kept_columns if position not in arrays]]
+    others.columns = [position for position in kept_columns if position not in arrays]
+
+    # astype(str) turns missing values into text ('nan', 'None'...) that is then stripped and matched like any value
+    for position in strings:
+        array = arrays[position]
+        missing = array.is_null()
+        null_text = df.iloc[kept_rows[_to_numpy(missing)], position].astype(str).str.strip()
+        # Missing values whose text is not an invalid value still count as missing for the 90% rule
+        extra_missing = int((~null_text.str.lower().isin(INVALID_VALUE_LIST)).sum())
+        if len(null_text) > 0:
+            array = pc.replace_with_mask(array, missing, null_text.to_numpy().astype(str))
+        arrays[position] = (array, extra_missing)
+
+    # 2-3. Clean numeric and categorical columns
+    parts = [new_clean_summary(), new_clean_summary()]
+    clean = _clean_polars if backend == 'polars' else _clean_arrow
+    values = clean(arrays, numeric, strings, len(kept_rows), parts[0])
+    clean_numeric_columns(others, others.select_dtypes(include=[np.number]).columns, parts[1])
+    clean_categorical_columns(others, others.select_dtypes(include=['object']).columns, parts[1])
+    merge_clean_summaries(summary, parts, kept_columns)
+
+    columns = [position for position in kept_columns if position in values or position in others.columns]
+    df_update = pd.DataFrame({i: values[position] if position in values else others[position].array for i, position in enumerate(columns)},
+                             index=df.index[kept_rows], copy=False)
+    df_update.columns = df.columns[columns]
+    for key in ['numeric_columns_filled', 'numeric_outliers_capped', 'categorical_columns_filled']:
+        summary[key] = {df.columns[position]: value for position, value in summary[key].items()}
+    summary['categorical_columns_removed'] = [df.columns[position] for position in summary['categorical_columns_removed']]
+
+    # 4. Clean datetime columns
+    clean_datetime_columns(df_update, summary)
+
+    return df_update, build_clean_summary_md(summary)
+
+DESCRIBE_INDEX = ['count', 'mean', 'std', 'min', '25%', '50%', '75%', 'max']
+
+def describe(df, backend):
+    """df.describe() computed by Polars or Arrow compute, or None when pandas has to compute it.
+
+    Only frames whose described columns (numeric and datetime, as in pandas) are all plain numpy
+    numbers qualify.
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    check_backend(backend)
+    columns = df.select_dtypes(include=[np.number, 'datetime']).columns
+    positions = [position for position, col in enumerate(df.columns) if col in columns]
+    if len(positions) == 0 or not all(isinstance(df.dtypes.iloc[position], np.dtype) and df.dtypes.iloc[position].kind in 'iuf'
+                                      for position in positions):
+        return None
+    arrays = [pa.Array.from_pandas(df.iloc[:, position]) for position in positions]
+    if backend == 'polars':
+        import polars as pl
+        names = [str(position) for position in positions]
+        frame = pl.from_arrow(pa.Table.from_arrays(arrays, names=names))
+        stats = frame.select([expression.alias(f"{name}:{i}") for name in names for i, expression in enumerate((
+            pl.col(name).count(), pl.col(name).mean(), pl.col(name).std(), pl.col(name).min(), pl.col(name).max()))]).row(0)
+        # Polars takes quantiles several times faster once the nulls are dropped
+        quantiles = [frame.select([pl.col(name).drop_nulls().quantile(q, interpolation='linear') for name in names]).row(0)
+                     for q in (0.25, 0.5, 0.75)]
+        rows = [[stats[5 * i], stats[5 * i + 1], stats[5 * i + 2], stats[5 * i + 3], *(quantile[i] for quantile in quantiles), stats[5 * i + 4]]
+                for i in range(len(names))]
+    else:
+        rows = []
+        for array in arrays:
+            min_max = pc.min_max(array)
+            rows.append([len(array) - array.null_count, pc.mean(array).as_py(), pc.stddev(array, ddof=1).as_py(), min_max['min'].as_py(),
+                         *pc.quantile(array, q=[0.25, 0.5, 0.75], interpolation='linear').to_pylist(), min_max['max'].as_py()])
+    values = np.array([[np.nan if value is None else value for value in row] for row in rows], dtype='float64').T
+    return pd.DataFrame(values, index=DESCRIBE_INDEX, columns=df.columns[positions])
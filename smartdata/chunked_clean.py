@@ -0,0 +1,305 @@
+import pandas as pd
+import numpy as np
+
+from .config import Config
+from .util import (
+    build_clean_summary_md,
+    invalid_value_mask,
+    legacy_numeric_dtype,
+    new_clean_summary,
+    stripped_text_and_invalid_mask,
+)
+
+PARQUET_EXTENSIONS = ('.parquet', '.pq')
+
+class ColumnStats:
+    """Statistics gathered for one column during the first pass over the file."""
+    def __init__(self, name):
+        self.name = name
+        self.non_null_count = 0
+        self.raw_null_count = 0
+        self.kind = None
+
+        # Numeric statistics (CSV columns stay candidates until a value fails to parse)
+        self.numeric_candidate = True
+        self.integer_candidate = True
+        self.numeric_count = 0
+        self.numeric_missing = 0
+        self.numeric_sum = 0.0
+        self.numeric_min = np.inf
+        self.numeric_max = -np.inf
+        self.sample_keys = np.empty(0)
+        self.sample_values = np.empty(0)
+
+        # Object statistics for both replace_invalid_values passes of clean_dataframe
+        self.object_missing_first = 0
+        self.object_missing_second = 0
+
+        # Datetime statistics
+        self.datetime_missing = 0
+        self.datetime_counts = None
+
+    def update_sample(self, values, rng, sample_size):
+        # Bottom-k sampling on random keys: a uniform sample that is exact while the column fits
+        keys = np.concatenate([self.sample_keys, rng.random(len(values))])
+        values = np.concatenate([self.sample_values, values])
+        if len(keys) > sample_size:
+            keep = np.argpartition(keys, sample_size - 1)[:sample_size]
+            keys, values = keys[keep], values[keep]
+        self.sample_keys, self.sample_values = keys, values
+
+    @property
+    def mean(self):
+        return self.numeric_sum / self.numeric_count
+
+def _is_parquet(path, file_format):
+    if file_format is not None:
+        return file_format == 'parquet'
+    return str(path).lower().endswith(PARQUET_EXTENSIONS)
+
+def _iter_chunks(path, chunksize, parquet, dtype=None):
+    if parquet:
+        try:
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("`pyarrow` package not found, please install with `pip install pyarrow`") from e
+        parquet_file = pq.ParquetFile(path)
+        columns = [name for name in parquet_file.schema_arrow.names if not name.startswith('__index_level_')]
+        for batch in parquet_file.iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunksize, dtype=dtype)
+
+def _quantile_with_fill(sorted_values, fill_value, fill_count, q):
+    """Linear quantile of sorted_values with fill_count extra copies of fill_value merged in."""
+    total = len(sorted_values) + fill_count
+    split = np.searchsorted(sorted_values, fill_value, side='left')
+
+    def value_at(rank):
+        if rank < split:
+            return sorted_values[rank]
+        if rank < split + fill_count:
+            return fill_value
+        return sorted_values[rank - fill_count]
+
+    position = q * (total - 1)
+    below = int(np.floor(position))
+    above = min(below + 1, total - 1)
+    t = position - below
+    a, b = value_at(below), value_at(above)
+    # Same interpolation formula as numpy's 'linear' method
+    if t >= 0.5:
+        return b - (b - a) * (1 - t)
+    return a + (b - a) * t
+
+def _numeric_bounds(stats, sample_size):
+    """Approximate 1st and 99th percentiles of the column after filling missing values with the mean."""
+    sorted_values = np.sort(stats.sample_values)
+    fill_count = stats.numeric_missing
+    if stats.numeric_count > len(sorted_values):
+        # The sample stands in for every non-missing value, so scale the fill mass to match
+        fill_count = int(round(fill_count * len(sorted_values) / stats.numeric_count))
+    return (_quantile_with_fill(sorted_values, stats.mean, fill_count, 0.01),
+            _quantile_with_fill(sorted_values, stats.mean, fill_count, 0.99))
+
+def _gather_statistics(path, chunksize, parquet, sample_size, seed):
+    rng = np.random.default_rng(seed)
+    column_stats = None
+    rows_before = 0
+    rows_after = 0
+
+    # CSV columns are read as text so one pass can decide between numeric and object
+    for chunk in _iter_chunks(path, chunksize, parquet, dtype=None if parquet else str):
+        if column_stats is None:
+            column_stats = {col: ColumnStats(col) for col in chunk.columns}
+            if parquet:
+                for col in chunk.columns:
+                    column_stats[col].kind = _parquet_kind(chunk[col])
+
+        for col in chunk.columns:
+            column_stats[col].raw_null_count += int(chunk[col].isnull().sum())
+
+        # 1. Remove empty rows
+        rows_before += len(chunk)
+        chunk = chunk.dropna(how='all')
+        rows_after += len(chunk)
+
+        for col in chunk.columns:
+            stats = column_stats[col]
+            series = chunk[col]
+            null_mask = series.isnull()
+            null_count = int(null_mask.sum())
+            stats.non_null_count += len(series) - null_count
+
+            if parquet:
+                kind = stats.kind
+                numeric = kind == 'numeric'
+            else:
+                numeric = False
+                if stats.numeric_candidate:
+                    parsed = pd.to_numeric(series.dropna(), errors='coerce')
+                    if parsed.notnull().all():
+                        numeric = True
+                        stats.integer_candidate &= parsed.dtype.kind in 'iu'
+                        series = pd.to_numeric(series)
+                    else:
+                        stats.numeric_candidate = False
+                kind = 'numeric' if numeric else 'object'
+
+            if numeric:
+                values = series.to_numpy(dtype=float)[~null_mask.to_numpy()]
+                stats.numeric_count += len(values)
+                stats.numeric_missing += null_count
+                if len(values) > 0:
+                    stats.numeric_sum += values.sum()
+                    stats.numeric_min = min(stats.numeric_min, values.min())
+                    stats.numeric_max = max(stats.numeric_max, values.max())
+                    stats.update_sample(values, rng, sample_size)
+                if not parquet:
+                    # Values that parse as numbers are never invalid tokens; missing ones become 'nan'
+                    stats.object_missing_first += null_count
+                    stats.object_missing_second += null_count
+            elif kind == 'object':
+                _, invalid = stripped_text_and_invalid_mask(series)
+                stats.object_missing_first += int((null_mask | invalid_value_mask(series, invalid)).sum())
+                stats.object_missing_second += int(invalid.sum())
+            elif kind == 'datetime':
+                series = pd.to_datetime(series, errors='coerce')
+                stats.datetime_missing += int(series.isnull().sum())
+                counts = series.value_counts()
+                stats.datetime_counts = counts if stats.datetime_counts is None else stats.datetime_counts.add(counts, fill_value=0)
+
+    if column_stats is None:
+        column_stats = {}
+    if not parquet:
+        for stats in column_stats.values():
+            stats.kind = 'numeric' if stats.numeric_candidate else 'object'
+    return column_stats, rows_before, rows_after
+
+def _parquet_kind(series):
+    if pd.api.types.is_bool_dtype(series):
+        return None
+    if pd.api.types.is_numeric_dtype(series):
+        return 'numeric'
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return 'datetime'
+    if series.dtype == object:
+        return 'object'
+    return None
+
+def _write_chunk(chunk, output_path, parquet, state):
+    if parquet:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        if state.get('writer') is None:
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            state['writer'] = pq.ParquetWriter(output_path, table.schema)
+        else:
+            table = pa.Table.from_pandas(chunk, schema=state['writer'].schema, preserve_index=False)
+        state['writer'].write_table(table)
+    else:
+        chunk.to_csv(output_path, mode='w' if state.get('header_written') is None else 'a',
+                     header=state.get('header_written') is None, index=False)
+        state['header_written'] = True
+
+def clean_file(input_path, output_path, chunksize=Config.CLEAN_CHUNK_SIZE, sample_size=Config.CLEAN_QUANTILE_SAMPLE_SIZE,
+               file_format=None, seed=0):
+    """Apply clean_dataframe to a CSV/Parquet file chunk by chunk and return the same markdown summary.
+
+    The first pass gathers null counts, means, a bounded sample for the 1st/99th percentiles and the
+    missing share of object columns; the second pass cleans and writes one chunk at a time. Percentiles
+    are exact while a column has at most sample_size values and approximate beyond that.
+    """
+    parquet = _is_parquet(input_path, file_format)
+    output_parquet = _is_parquet(output_path, file_format)
+    summary = new_clean_summary()
+
+    # Pass one: statistics
+    column_stats, rows_before, rows_after = _gather_statistics(input_path, chunksize, parquet, sample_size, seed)
+    summary['rows_removed'] = rows_before - rows_after
+
+    empty_columns = [col for col, stats in column_stats.items() if stats.non_null_count == 0]
+    summary['columns_removed'] = len(empty_columns)
+    kept = {col: stats for col, stats in column_stats.items() if stats.non_null_count > 0}
+    numeric_columns = [col for col, stats in kept.items() if stats.kind == 'numeric']
+    object_columns = [col for col, stats in kept.items() if stats.kind == 'object']
+    datetime_columns = [col for col, stats in kept.items() if stats.kind == 'datetime']
+
+    bounds = {}
+    capped = {}
+    for col in numeric_columns:
+        stats = kept[col]
+        bounds[col] = _numeric_bounds(stats, sample_size)
+        # The fill value lies within [min, max], so min/max alone tell whether anything gets capped
+        if stats.numeric_min < bounds[col][0] or stats.numeric_max > bounds[col][1]:
+            capped[col] = {'lower_capped': 0, 'upper_capped': 0}
+    # Columns filled or capped anywhere in the file are float64 in every chunk, as in clean_dataframe,
+    # so the first chunk written fixes the same output schema for the rest
+    float_columns = {col for col in numeric_columns if kept[col].numeric_missing > 0 or col in capped}
+
+    removed_columns = [col for col in object_columns if rows_after > 0 and kept[col].object_missing_first / rows_after > 0.9]
+    object_columns = [col for col in object_columns if col not in removed_columns]
+
+    datetime_modes = {}
+    for col in datetime_columns:
+        counts = kept[col].datetime_counts
+        if kept[col].datetime_missing > 0 and counts is not None and len(counts) > 0:
+            # Smallest of the most frequent values, like Series.mode()[0]
+            datetime_modes[col] = counts[counts == counts.max()].index.min()
+
+    dtype = None
+    if not parquet:
+        dtype = {col: (str if stats.kind == 'object' else
+                       'int64' if stats.integer_candidate and stats.raw_null_count == 0 else 'float64')
+                 for col, stats in column_stats.items() if col not in empty_columns}
+
+    # Pass two: clean and write
+    writer_state = {}
+    try:
+        for chunk in _iter_chunks(input_path, chunksize, parquet, dtype=dtype):
+            chunk = chunk.dropna(how='all').drop(columns=empty_columns + removed_columns)
+
+            for col in numeric_columns:
+                output_dtype = np.dtype(np.float64) if col in float_columns else legacy_numeric_dtype(chunk[col])
+                if chunk[col].dtype != output_dtype:
+                    chunk[col] = (chunk[col].to_numpy(dtype=output_dtype, na_value=np.nan) if output_dtype.kind == 'f'
+                                  else chunk[col].astype(output_dtype))
+                if kept[col].numeric_missing > 0:
+                    chunk[col] = chunk[col].fillna(kept[col].mean)
+                if col in capped:
+                    lower_bound, upper_bound = bounds[col]
+                    capped[col]['lower_capped'] += int((chunk[col] < lower_bound).sum())
+                    capped[col]['upper_capped'] += int((chunk[col] > upper_bound).sum())
+                    chunk[col] = np.where(chunk[col] < lower_bound, lower_bound, chunk[col])
+                    chunk[col] = np.where(chunk[col] > upper_bound, upper_bound, chunk[col])
+
+            for col in object_columns:
+                stripped, invalid = stripped_text_and_invalid_mask(chunk[col])
+                chunk[col] = stripped.mask(invalid, 'Not Specified')
+
+            for col in datetime_columns:
+                chunk[col] = pd.to_datetime(chunk[col], errors='coerce')
+                if col in datetime_modes:
+                    chunk[col] = chunk[col].fillna(datetime_modes[col])
+
+            _write_chunk(chunk, output_path, output_parquet, writer_state)
+    finally:
+        if writer_state.get('writer') is not None:
+            writer_state['writer'].close()
+
+    # Summary in the same column order as the in-memory path
+    for col in numeric_columns:
+        if kept[col].numeric_missing > 0:
+            summary['numeric_columns_filled'][col] = kept[col].numeric_missing
+        if col in capped and (capped[col]['lower_capped'] > 0 or capped[col]['upper_capped'] > 0):
+            summary['numeric_outliers_capped'][col] = capped[col]
+    for col in kept:
+        if col in removed_columns:
+            summary['categorical_columns_removed'].append(col)
+        elif col in object_columns and kept[col].object_missing_second > 0:
+            summary['categorical_columns_filled'][col] = kept[col].object_missing_second
+    for col in datetime_columns:
+        if col in datetime_modes:
+            summary['datetime_columns_filled'][col] = kept[col].datetime_missing
+
+    return build_clean_summary_md(summary)
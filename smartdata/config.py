@@ -9,11 +9,72 @@ class Config:
     # Model Agent Setting
     SHOW_DETAIL = False
     MEMORY_SIZE = 5
+    MEMORY_MAX_TURNS = 100
+    MEMORY_TOKEN_BUDGET = None
+    MEMORY_TRUNCATE_CHARS = 300
     MAX_ITERATIONS = 60
     MAX_EXECUTION_TIME = 60
+    MAX_ATTEMPTS = 10
+    HEDGED_ATTEMPTS = 1
+    BATCH_CONCURRENCY = 4
     AGENT_STOP_SUBSTRING_LIST = ["Agent stopped","import pandas as pd","import matplotlib.pyplot as plt","import numpy as np","plt.tight_layout()"]
     AGENT_STOP_ANSWER = "Sorry, but I’m unable to provide an answer due to the complexity of your question. Could you please break it down into smaller parts and ask again? I’ll be happy to assist you further."
     
+    # Data Cleaning Setting
+    CLEAN_CHUNK_SIZE = 100000
+    CLEAN_QUANTILE_SAMPLE_SIZE = 100000
+    CLEAN_WORKERS = 1
+    CLEAN_PARALLEL_BACKEND = 'thread'
+    CLEAN_BACKEND = 'pandas'
+    CLEAN_COMPACT = False
+
+    # Data Version Setting
+    MAX_DATA_VERSIONS = 20
+
+    # Sandbox Setting
+    SANDBOX = False
+    SANDBOX_WORKERS = 2
+    SANDBOX_TIMEOUT = 60
+    SANDBOX_MEMORY_LIMIT = 4 * 1024 ** 3
+    SANDBOX_MAX_SHARED_FRAMES = 8
+
+    # Memory Store Setting
+    MEMORY_BACKEND = None
+    MEMORY_PATH = 'smartdata_memory.sqlite'
+    MEMORY_BATCH_SIZE = 16
+    MEMORY_SESSION_TTL = 7 * 86400
+    MEMORY_COMPACT_INTERVAL = 3600
+
+    # Session Manager Setting
+    SESSION_MAX_BYTES = 2 * 1024 ** 3
+    SESSION_SPILL_DIR = None
+    SESSION_SPILL_FORMAT = 'feather'
+
+    # Figure Rendering Setting
+    RENDER_FORMAT = None
+    RENDER_DPI = 100
+    RENDER_WORKERS = 2
+    RENDER_MAX_IMAGES = 20
+
+    # Tracing Setting
+    TRACE_EXPORTER = None
+    TRACE_PATH = 'smartdata_traces.jsonl'
+
+    # Response Cache Setting
+    RESPONSE_CACHE = None
+    RESPONSE_CACHE_PATH = 'smartdata_response_cache.sqlite'
+    RESPONSE_CACHE_SIZE = 1000
+    RESPONSE_CACHE_TTL = 86400
+
+    # Prompt Profile Setting
+    PROFILE_CACHE_SIZE = 32
+    PROFILE_COLUMN_CACHE_SIZE = 4096
+    PROFILE_APPROX_ROW_THRESHOLD = 1000000
+    PROFILE_APPROX_ERROR = 0.01
+    PROFILE_APPROX_CONFIDENCE = 0.99
+    PROFILE_WORKERS = 4
+    PROFILE_BACKEND = 'pandas'
+
     # Model Plot Setting
     CHECK_ERROR_SUBSTRING_LIST = ["error", "invalid","incomplete"]
     CHECK_PLOT_SUBSTRING_LIST = ["plt.tight_layout()"]
@@ -83,6 +144,50 @@ class Config:
         
         You may need to revise the current question with the previous conversation before passing to tools. You should use the tools below to answer the question posed of you:
         """
+
+    DEFAULT_PREFIX_MULTI_DF = """
+        You are working with {num_dfs} pandas dataframes in Python named df1, df2, etc. 
+        The column names in the dataframes may differ from those in the question. Please make your best effort to match them based on similar meanings and ignore case differences. Also you may need to revise and/or complete the question with the previous conversation if needed. 
+        
+        if the question is asking for plots, charts, or graphs, you must:
+        - Import and Create Copy: Start by importing the 'copy' library and create "df_plot = copy.deepcopy(df1)" from the dataframe you need (df1, df2, etc.). Make sure name 'df_plot' is defined before process to any other steps.
+        - Work with df_plot: Make all plots using df_plot, not df1, df2, etc.
+        - Don't assume you have access to any libraries other than built-in python ones. If you do need any non built-in libraries, make sure you import all libraries you need.
+        - if you need to dropna, drop rows with NaN values in the entire DataFrame if you are dealing with multiple columns simultaneously.
+        - Must always include "import matplotlib.pyplot as plt" as you first line of code, then follow by "import pandas as pd", "import numpy as np", "fig, ax = plt.subplots(figsize=(8, 8))", "plt.style.use('seaborn-v0_8-darkgrid')" and "plt.tight_layout()" in your code. if you need to plot a heatmap, then use "plt.style.use('seaborn-v0_8-dark')" instead of "plt.style.use('seaborn-v0_8-darkgrid')".
+        - Do not include "plt.show()" or "plt.savefig" in your code.
+        - For your coding, always use the newlines as (\n) are escaped as \\n, and single quotes are retained except you are using f-string like this f"{{df_plot.iloc[i]['salary']}}"
+        - Smartly use warm and inviting colors for plots, steering clear of sharp and bright tones.
+        - Smartly use legend and set it to auto position if it improve clarity.
+        - Set the title font size to 14, and all other text, labels, and annotations to a font size of 10. 
+        - Ensure the plots look professional.
+        - Each code must be self-contained, runnable independently and include all necessary imports and data for the plots.
+        - Never ask the user to run Python code instead execute the code using "python_repl_ast" tool.
+        - Decline politely if a plot request is unrelated to the dataframe.
+        - Do not include Python code in your final output.
+
+        if the question is asking for statistical or AI or machine learning or data science study, you must:
+        - Import and Create Copy: Start by importing the 'copy' library and create "df_ml = copy.deepcopy(df1)" from the dataframe you need (df1, df2, etc.). Make sure name 'df_ml' is defined before process to any other steps.
+        - Work with df_ml: Analyse using df_ml, not df1, df2, etc.
+        - For your coding, always use the newlines as (\n) are escaped as \\n, and single quotes are retained except you are using f-string like this f"{{df_ml.iloc[i]['salary']}}"
+        - Draft the corresponding python code and execute by python_repl_ast tool.
+        - Ensure explanations are accessible to non-technical audiences unless technical detail is specifically required.
+        - Do not include any Python code in your final output.
+        - Your final presentation should be executive summary, followed by methodology, model performance, feature importance and other details.
+        - Decline politely if the analysis is unrelated to the dataframe.
+
+        if the question is asking for data cleaning, validation or transformation to the dataframe, you must:
+        - Import and Create Copy: Start by importing the 'copy' library and create "df_update = copy.deepcopy(df1)" as the first line of code, using the one dataframe to be changed (df1, df2, etc.). Each code must change only one dataframe; use a separate code for each dataframe that needs changes. Must make sure variable 'df_update' is defined before process to any other steps.
+        - Work with df_update: Make all data cleaning, validation or transformation using df_update, not df1, df2, etc. Make sure any variable you created in the code must be defined before use it.
+        - For your coding, always use the newlines as (\n) are escaped as \\n, and single quotes are retained except you are using f-string like this f"{{df_update.iloc[i]['salary']}}"
+        - Don't assume you have access to any libraries other than built-in python ones. If you do need any non built-in libraries, make sure you import all libraries you need.
+        - Each code must be self-contained, runnable independently and include all necessary imports and data.
+        - Code Execution: Draft and execute the necessary Python code using the python_repl_ast tool. Exclude Python code from your final output.
+        - Step-by-Step Explanation: Clearly explain the process and the changes made before and after, ensuring the explanation is accessible to non-technical audiences unless technical details are needed.
+        - Decline politely if the request is unrelated to the dataframe.
+        
+        You may need to revise the current question with the previous conversation before passing to tools. You should use the tools below to answer the question posed of you:
+        """
     
     @staticmethod
     def __init__():
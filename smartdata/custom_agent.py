@@ -1,5 +1,11 @@
+import ast
+import sys
+import threading
+import uuid
 import warnings
-from typing import Any, Dict, List, Literal, Optional, Sequence, Union, cast
+from contextlib import contextmanager
+from io import StringIO
+from typing import Any, Dict, List, Literal, Optional, Sequence, Type, Union, cast
 
 from langchain.agents import (
     AgentType,
@@ -41,11 +47,126 @@ from langchain_core.utils.interactive_env import is_interactive_env
 #     SUFFIX_WITH_DF,
 #     SUFFIX_WITH_MULTI_DF,
 # )
-from langchain_experimental.tools.python.tool import PythonAstREPLTool
+from langchain_experimental.tools.python.tool import PythonAstREPLTool, PythonInputs, sanitize_input
+from pydantic import BaseModel, Field
 
-from langchain.memory import ConversationBufferMemory
+from .profiler import _get_df_col_value_counts, get_df_profile, get_df_profiles
+from .sandbox import SANDBOX_ARTIFACT_NAMES, SandboxError
 
-memory = ConversationBufferMemory(memory_key="chat_history")
+REPL_STDOUT_LOCK = threading.Lock()
+REPL_ARTIFACT_NAMES = ('fig', 'ax', 'df_update')
+
+class ThreadStdout:
+    """sys.stdout stand-in that sends the writes of a thread capturing REPL output to that thread's buffer.
+
+    Writes from every other thread go to the stream it replaced.
+    """
+    def __init__(self, stdout):
+        self.stdout = stdout
+        self.local = threading.local()
+
+    def target(self):
+        buffer = getattr(self.local, 'buffer', None)
+        return self.stdout if buffer is None else buffer
+
+    def write(self, text):
+        return self.target().write(text)
+
+    def flush(self):
+        return self.target().flush()
+
+    def __getattr__(self, name):
+        return getattr(self.target(), name)
+
+@contextmanager
+def capture_stdout(buffer):
+    """Like contextlib.redirect_stdout, but only for the calling thread, so captures in other threads do not interfere."""
+    # The lock only covers installing the stand-in; the captured code runs without it
+    with REPL_STDOUT_LOCK:
+        if not isinstance(sys.stdout, ThreadStdout):
+            sys.stdout = ThreadStdout(sys.stdout)
+        stdout = sys.stdout
+    previous = getattr(stdout.local, 'buffer', None)
+    stdout.local.buffer = buffer
+    try:
+        yield buffer
+    finally:
+        stdout.local.buffer = previous
+
+class DataFramePythonREPLTool(PythonAstREPLTool):
+    """PythonAstREPLTool that is safe to run from several threads at once and keeps what each query builds.
+
+    The base tool captures output with contextlib.redirect_stdout, which swaps the process-wide
+    sys.stdout, so overlapping runs would mix their output; this one captures per thread with
+    capture_stdout instead. After a query runs without error, the `fig`, `ax` and `df_update` objects
+    it created are kept in `artifacts` under the query text, so the caller does not have to run it again.
+    """
+    artifacts: Dict[str, Dict[str, Any]] = Field(default_factory=dict)
+
+    def _run(self, query: str, run_manager: Optional[Any] = None) -> Any:
+        before = {name: self.locals.get(name) for name in REPL_ARTIFACT_NAMES}
+        try:
+            code = sanitize_input(query) if self.sanitize_input else query
+            tree = ast.parse(code)
+            module = ast.Module(tree.body[:-1], type_ignores=[])
+            exec(ast.unparse(module), self.globals, self.locals)  # type: ignore
+            module_end = ast.Module(tree.body[-1:], type_ignores=[])
+            module_end_str = ast.unparse(module_end)  # type: ignore
+            io_buffer = StringIO()
+            try:
+                with capture_stdout(io_buffer):
+                    ret = eval(module_end_str, self.globals, self.locals)
+                result = io_buffer.getvalue() if ret is None else ret
+            except Exception:
+                with capture_stdout(io_buffer):
+                    exec(module_end_str, self.globals, self.locals)
+                result = io_buffer.getvalue()
+        except Exception as e:
+            return "{}: {}".format(type(e).__name__, str(e))
+
+        # df_update may be built over several queries, so it is kept even when only changed in place
+        self.artifacts[query] = {
+            name: self.locals[name] for name in REPL_ARTIFACT_NAMES
+            if name in self.locals and (self.locals[name] is not before[name] or name == 'df_update')
+        }
+        return result
+
+class SandboxPythonREPLTool(BaseTool):
+    """Drop-in replacement for the python_repl_ast tool that runs each query in a SandboxPool worker.
+
+    Variables persist between queries of one session like in the in-process REPL. Timeouts, the memory
+    limit and cancellation come back to the agent as error text, so it can try again with simpler code.
+    """
+    name: str = "python_repl_ast"
+    description: str = (
+        "A Python shell. Use this to execute python commands. "
+        "Input should be a valid python command. "
+        "When using this tool, sometimes output is abbreviated - "
+        "make sure it does not look abbreviated before using it in your answer."
+    )
+    args_schema: Type[BaseModel] = PythonInputs
+    pool: Any = None
+    frames: Dict[str, Any] = Field(default_factory=dict)
+    session_id: str = Field(default_factory=lambda: uuid.uuid4().hex)
+    artifacts: Dict[str, Dict[str, Any]] = Field(default_factory=dict)
+    sanitize_input: bool = True
+    cancel_event: Optional[Any] = None
+
+    def reset(self, frames):
+        # A new session id gives the next query a fresh namespace; the worker drops the old one eventually
+        self.frames = dict(frames)
+        self.session_id = uuid.uuid4().hex
+        self.artifacts = {}
+
+    def _run(self, query: str, run_manager: Optional[Any] = None) -> Any:
+        code = sanitize_input(query) if self.sanitize_input else query
+        try:
+            captured = self.pool.execute(self.session_id, self.frames, code, cancel_event=self.cancel_event)
+        except SandboxError as e:
+            return "{}: {}".format(type(e).__name__, str(e))
+        if not captured['error']:
+            self.artifacts[query] = {name: captured[name] for name in SANDBOX_ARTIFACT_NAMES if name in captured}
+        return captured['output']
 
 PREFIX = """
 You are working with a pandas dataframe in Python. The name of the dataframe is `df`.
@@ -108,8 +229,38 @@ This is the result of `print(df.head())` for each dataframe:
 
 This is the result of `print(df.describe())` for each dataframe:
 {dfs_describe}
+
+This is the result of `print(df.dtypes)` for each dataframe:
+{dfs_dtypes}
+
+This is the result of df.value_counts for each non-numeric column in a dictionary for each dataframe (limit to the first 10 if more than 10 unique value counts):
+{dfs_col_unique_value_counts}
 """
 
+def dataframe_locals(df: Any) -> Dict[str, Any]:
+    """REPL variables for df: `df` for one dataframe, `df1`, `df2`, ... for a list."""
+    if isinstance(df, list):
+        return {f"df{i + 1}": dataframe for i, dataframe in enumerate(df)}
+    return {"df": df}
+
+def _get_multi_profile(
+    dfs: List[Any],
+    number_of_head_rows: int = 5,
+    profile_cache: Optional[Any] = None,
+    profile_key: Optional[Any] = None,
+    profile_column_keys: Optional[Any] = None,
+    profile_backend: str = "pandas",
+) -> Dict[str, str]:
+    # One profile per dataframe, labelled with its REPL name; profile_key and profile_column_keys hold one entry per dataframe
+    if not isinstance(profile_key, list):
+        profile_key = None
+    profiles = get_df_profiles(dfs, number_of_head_rows, cache=profile_cache, keys=profile_key, column_keys=profile_column_keys,
+                               backend=profile_backend)
+    return {
+        f"dfs_{section}": "\n\n".join(f"df{i + 1}:\n{profile[f'df_{section}']}" for i, profile in enumerate(profiles))
+        for section in ("head", "describe", "dtypes", "col_unique_value_counts")
+    }
+
 def _get_multi_prompt(
     dfs: List[Any],
     *,
@@ -117,6 +268,10 @@ def _get_multi_prompt(
     suffix: Optional[str] = None,
     include_df_in_prompt: Optional[bool] = True,
     number_of_head_rows: int = 5,
+    profile_cache: Optional[Any] = None,
+    profile_key: Optional[Any] = None,
+    profile_column_keys: Optional[Any] = None,
+    profile_backend: str = "pandas",
 ) -> BasePromptTemplate:
     if suffix is not None:
         suffix_to_use = suffix
@@ -130,8 +285,8 @@ def _get_multi_prompt(
     prompt = PromptTemplate.from_template(template)
     partial_prompt = prompt.partial()
     if "dfs_head" in partial_prompt.input_variables:
-        dfs_head = "\n\n".join([d.head(number_of_head_rows).to_markdown() for d in dfs])
-        partial_prompt = partial_prompt.partial(dfs_head=dfs_head)
+        profile = _get_multi_profile(dfs, number_of_head_rows, profile_cache, profile_key, profile_column_keys, profile_backend)
+        partial_prompt = partial_prompt.partial(dfs_head=profile['dfs_head'], dfs_describe=profile['dfs_describe'])
     if "num_dfs" in partial_prompt.input_variables:
         partial_prompt = partial_prompt.partial(num_dfs=str(len(dfs)))
     return partial_prompt
@@ -143,6 +298,10 @@ def _get_single_prompt(
     suffix: Optional[str] = None,
     include_df_in_prompt: Optional[bool] = True,
     number_of_head_rows: int = 5,
+    profile_cache: Optional[Any] = None,
+    profile_key: Optional[Any] = None,
+    profile_column_keys: Optional[Any] = None,
+    profile_backend: str = "pandas",
 ) -> BasePromptTemplate:
     if suffix is not None:
         suffix_to_use = suffix
@@ -157,9 +316,9 @@ def _get_single_prompt(
 
     partial_prompt = prompt.partial()
     if "df_head" in partial_prompt.input_variables:
-        df_head = str(df.head(number_of_head_rows).to_markdown())
-        df_describe = str(df.describe().to_markdown())
-        partial_prompt = partial_prompt.partial(df_head=df_head, df_describe=df_describe)
+        profile = get_df_profile(df, number_of_head_rows, cache=profile_cache, key=profile_key, column_keys=profile_column_keys,
+                                 backend=profile_backend)
+        partial_prompt = partial_prompt.partial(df_head=profile['df_head'], df_describe=profile['df_describe'])
     return partial_prompt
 
 
@@ -170,23 +329,6 @@ def _get_prompt(df: Any, **kwargs: Any) -> BasePromptTemplate:
         else _get_single_prompt(df, **kwargs)
     )
 
-def _get_df_col_value_counts(df):
-    # Convert boolean and datetime columns to string
-    df_checking = df.copy()  # Create a copy of the DataFrame to avoid modifying the original
-    # boolean_and_datetime_columns = df_checking.select_dtypes(include=['boolean', 'datetime64[ns]', 'datetime64[ns, UTC]', 'timedelta64[ns]', 'Interval']).columns
-    boolean_and_datetime_columns = df_checking.select_dtypes(include=['boolean', 'datetime64', 'Interval']).columns
-    df_checking[boolean_and_datetime_columns] = df_checking[boolean_and_datetime_columns].astype(str)
-    
-    # Identifying categorical columns (including newly converted boolean and datetime columns)
-    categorical_columns = df_checking.select_dtypes(include=['object', 'category', 'string']).columns
-    
-    # Get the top 10 value counts for each categorical column
-    top_10_values = df_checking[categorical_columns].apply(
-        lambda col: col.value_counts(dropna=False).head(10).to_dict()
-    ).to_dict()
-    
-    return str(top_10_values)
-
 def _get_functions_single_prompt(
     df: Any,
     *,
@@ -194,15 +336,16 @@ def _get_functions_single_prompt(
     suffix: str = "",
     include_df_in_prompt: Optional[bool] = True,
     number_of_head_rows: int = 5,
+    profile_cache: Optional[Any] = None,
+    profile_key: Optional[Any] = None,
+    profile_column_keys: Optional[Any] = None,
+    profile_backend: str = "pandas",
 ) -> ChatPromptTemplate:
     if include_df_in_prompt:
-        df_head = str(df.head(number_of_head_rows).to_markdown())
-        df_describe = str(df.describe().to_markdown())
-        df_dtypes = str(df.dtypes.to_markdown())
-        df_col_unique_value_counts = _get_df_col_value_counts(df)
-
-        suffix = (suffix or FUNCTIONS_WITH_DF).format(df_head=df_head, df_describe = df_describe, 
-                                                      df_dtypes = df_dtypes, df_col_unique_value_counts = df_col_unique_value_counts)
+        # head/describe/dtypes/value counts are reused while the data version is unchanged
+        profile = get_df_profile(df, number_of_head_rows, cache=profile_cache, key=profile_key, column_keys=profile_column_keys,
+                                 backend=profile_backend)
+        suffix = (suffix or FUNCTIONS_WITH_DF).format(**profile)
     prefix = prefix if prefix is not None else PREFIX_FUNCTIONS
     system_message = SystemMessage(content=prefix + suffix)
     prompt = OpenAIFunctionsAgent.create_prompt(system_message=system_message)
@@ -215,10 +358,15 @@ def _get_functions_multi_prompt(
     suffix: str = "",
     include_df_in_prompt: Optional[bool] = True,
     number_of_head_rows: int = 5,
+    profile_cache: Optional[Any] = None,
+    profile_key: Optional[Any] = None,
+    profile_column_keys: Optional[Any] = None,
+    profile_backend: str = "pandas",
 ) -> ChatPromptTemplate:
     if include_df_in_prompt:
-        dfs_head = "\n\n".join([d.head(number_of_head_rows).to_markdown() for d in dfs])
-        suffix = (suffix or FUNCTIONS_WITH_MULTI_DF).format(dfs_head=dfs_head)
+        # Each dataframe is profiled in parallel and only again once it has changed
+        profile = _get_multi_profile(dfs, number_of_head_rows, profile_cache, profile_key, profile_column_keys, profile_backend)
+        suffix = (suffix or FUNCTIONS_WITH_MULTI_DF).format(**profile)
     prefix = (prefix or MULTI_DF_PREFIX_FUNCTIONS).format(num_dfs=str(len(dfs)))
     system_message = SystemMessage(content=prefix + suffix)
     prompt = OpenAIFunctionsAgent.create_prompt(system_message=system_message)
@@ -252,6 +400,11 @@ def custom_create_pandas_dataframe_agent(
     extra_tools: Sequence[BaseTool] = (),
     engine: Literal["pandas", "modin"] = "pandas",
     allow_dangerous_code: bool = False,
+    profile_cache: Optional[Any] = None,
+    profile_key: Optional[Any] = None,
+    profile_column_keys: Optional[Any] = None,
+    profile_backend: str = "pandas",
+    sandbox: Optional[Any] = None,
     **kwargs: Any,
 ) -> AgentExecutor:
     """Construct a Pandas agent from an LLM and dataframe(s).
@@ -303,6 +456,16 @@ def custom_create_pandas_dataframe_agent(
             other security incidents.
             You must opt in to use this functionality by setting
             allow_dangerous_code=True.
+        profile_cache: ProfileCache holding the dataframe sections of the prompt.
+            Defaults to the module-level cache in smartdata.profiler.
+        profile_key: Key identifying the current data version in profile_cache, or
+            a list with one key per dataframe. Defaults to a content fingerprint of df.
+        profile_column_keys: One key per column (a list of such lists for several
+            dataframes), so a new data version only profiles the columns that changed.
+        profile_backend: Engine that computes the describe section of the prompt,
+            "pandas", "polars" or "arrow".
+        sandbox: SandboxPool that runs the generated code in worker processes with
+            a timeout and a memory limit. Defaults to running it in this process.
 
         **kwargs: DEPRECATED. Not used, kept for backwards compatibility.
 
@@ -366,13 +529,12 @@ def custom_create_pandas_dataframe_agent(
             f"Received additional kwargs {kwargs} which are no longer supported."
         )
 
-    df_locals = {}
-    if isinstance(df, list):
-        for i, dataframe in enumerate(df):
-            df_locals[f"df{i + 1}"] = dataframe
+    df_locals = dataframe_locals(df)
+    if sandbox is not None:
+        repl_tool = SandboxPythonREPLTool(pool=sandbox, frames=df_locals)
     else:
-        df_locals["df"] = df
-    tools = [PythonAstREPLTool(locals=df_locals)] + list(extra_tools)
+        repl_tool = DataFramePythonREPLTool(locals=df_locals)
+    tools = [repl_tool] + list(extra_tools)
 
     if agent_type == AgentType.ZERO_SHOT_REACT_DESCRIPTION:
         if include_df_in_prompt is not None and suffix is not None:
@@ -385,6 +547,10 @@ def custom_create_pandas_dataframe_agent(
             suffix=suffix,
             include_df_in_prompt=include_df_in_prompt,
             number_of_head_rows=number_of_head_rows,
+            profile_cache=profile_cache,
+            profile_key=profile_key,
+            profile_column_keys=profile_column_keys,
+            profile_backend=profile_backend,
         )
         agent: Union[BaseSingleActionAgent, BaseMultiActionAgent] = RunnableAgent(
             runnable=create_react_agent(llm, tools, prompt),  # type: ignore
@@ -398,6 +564,10 @@ def custom_create_pandas_dataframe_agent(
             suffix=suffix,
             include_df_in_prompt=include_df_in_prompt,
             number_of_head_rows=number_of_head_rows,
+            profile_cache=profile_cache,
+            profile_key=profile_key,
+            profile_column_keys=profile_column_keys,
+            profile_backend=profile_backend,
         )
 
         if agent_type == AgentType.OPENAI_FUNCTIONS:
@@ -1,48 +1,145 @@
+import functools
+import json
 import logging
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from .config import Config
+
 logger = logging.getLogger('Memory')
 
+def estimate_tokens(text):
+    """Rough token count for OpenAI chat models, about four characters per token."""
+    return len(text) // 4 + 1
+
 class Memory:
-    def __init__(self):
-        self.memory_store = {}
+    """Conversation turns keyed by message number.
+
+    At most max_turns turns are kept; the oldest are evicted first. With a token_budget, the history sent
+    with a question keeps the newest turns in full and shortens or drops older ones to fit the budget. The
+    newest turn is always kept, cut down further when even its shortened form is over the budget.
+    """
+    def __init__(self, max_turns=Config.MEMORY_MAX_TURNS, token_budget=Config.MEMORY_TOKEN_BUDGET,
+                 truncate_chars=Config.MEMORY_TRUNCATE_CHARS, token_counter=estimate_tokens):
+        self.memory_store = OrderedDict()
+        self.max_turns = max_turns
+        self.token_budget = token_budget
+        self.truncate_chars = truncate_chars
+        self.token_counter = token_counter
+        # Rendered text and token cost per turn, and rendered histories, are reused until the memory changes
+        self.turn_cache = {}
+        self.history_cache = {}
 
     def is_not_empty(self):
         """Checks if the memory store is not empty."""
         return bool(self.memory_store)
-        
+
     def remember(self, key, role, value):
         """Stores a value in memory with the specified key."""
         if key not in self.memory_store:
             self.memory_store[key] = {'Human': '', 'AI': '', 'Plot Code Generate By AI':[]}
         self.memory_store[key][role] = value
+        self.turn_cache.pop(key, None)
+        self.history_cache.clear()
+        while self.max_turns is not None and len(self.memory_store) > self.max_turns:
+            evicted_key, _ = self.memory_store.popitem(last=False)
+            self.turn_cache.pop(evicted_key, None)
         logger.info(f"Stored {role} message for key {key} in memory.")
 
     def recall(self, key):
         """Retrieves a value from memory by its key."""
         return self.memory_store.get(key, "Key not found in memory")
-    
+
     def recall_all(self):
-        return str(self.memory_store)
+        return str(dict(self.memory_store))
 
     def clear_all_conversation(self):
-        self.memory_store.clear()
+        self.clear_memory()
 
     def recall_last_conversation(self, number_last_conversation):
-        if len(self.memory_store)>0:
-            max_key = max(self.memory_store.keys())  # Get the largest key
-            total_conversations = len(self.memory_store)  # Get the total number of conversations
-        
-            if number_last_conversation >= total_conversations:
-                min_key = min(self.memory_store.keys())  # If size exceeds, start from the smallest key
+        keys = list(self.memory_store.keys())[-number_last_conversation:] if number_last_conversation > 0 else []
+        return {k: self.memory_store[k] for k in keys}
+
+    def _truncate(self, text, limit=None):
+        text = str(text)
+        limit = self.truncate_chars if limit is None else limit
+        if len(text) <= limit:
+            return text
+        return text[:limit] + ' ...[truncated]'
+
+    def next_key(self):
+        """Key for the next turn, so a resumed session carries on after its last stored turn."""
+        return next(reversed(self.memory_store)) + 1 if self.memory_store else 1
+
+    def flush(self):
+        """Write out pending turns; the in-process store has none."""
+        pass
+
+    def _render_turn(self, key, entry):
+        # Full and shortened text of one turn, with their token costs
+        if key not in self.turn_cache:
+            full = f"{key!r}: {entry!r}"
+            short_entry = {'Human': self._truncate(entry['Human']), 'AI': self._truncate(entry['AI'])}
+            short = f"{key!r}: {short_entry!r}"
+            self.turn_cache[key] = ((full, self.token_counter(full)), (short, self.token_counter(short)))
+        return self.turn_cache[key]
+
+    def _fit_turn(self, key, entry, token_budget):
+        # Longest cut of the question and answer that fits the budget, found by bisection; no text at all if none does
+        def render(limit):
+            return f"{key!r}: {({'Human': self._truncate(entry['Human'], limit), 'AI': self._truncate(entry['AI'], limit)})!r}"
+        low, high = 0, self.truncate_chars
+        while low < high:
+            middle = (low + high + 1) // 2
+            if self.token_counter(render(middle)) <= token_budget:
+                low = middle
             else:
-                min_key = max_key - number_last_conversation + 1  # Calculate the starting key
-            return {k: self.memory_store[k] for k in range(min_key, max_key + 1)}
+                high = middle - 1
+        return render(low)
+
+    def render_last_conversation(self, number_last_conversation, token_budget=None):
+        """History of the last turns as sent with a question, fitted to the token budget if there is one."""
+        token_budget = self.token_budget if token_budget is None else token_budget
+        cache_key = (number_last_conversation, token_budget)
+        if cache_key in self.history_cache:
+            return self.history_cache[cache_key]
+
+        if token_budget is None:
+            history = str(self.recall_last_conversation(number_last_conversation))
         else:
-            return {}
-    
+            turns = self.recall_last_conversation(number_last_conversation)
+            keys = list(turns)
+            parts = []
+            used = 0
+            # Newest turns first: in full while they fit, then without plot code and with long text cut
+            for key in reversed(keys):
+                (full, full_tokens), (short, short_tokens) = self._render_turn(key, turns[key])
+                if used + full_tokens <= token_budget:
+                    parts.append(full)
+                    used += full_tokens
+                elif used + short_tokens <= token_budget:
+                    parts.append(short)
+                    used += short_tokens
+                elif not parts:
+                    # Without the newest turn the question would lose its context, so it is cut to fit
+                    parts.append(self._fit_turn(key, turns[key], token_budget))
+                    used = token_budget
+                else:
+                    logger.info(f"Dropped {keys.index(key) + 1} older turns to fit the memory token budget.")
+                    break
+            history = '{' + ', '.join(reversed(parts)) + '}'
+        self.history_cache[cache_key] = history
+        return history
+
     def forget(self, key):
         """Removes a value from memory by its key."""
         if key in self.memory_store:
             del self.memory_store[key]
+            self.turn_cache.pop(key, None)
+            self.history_cache.clear()
             logger.info(f"Forgot {key} from memory.")
         else:
             logger.warning(f"Key {key} not found in memory.")
@@ -50,4 +147,188 @@ class Memory:
     def clear_memory(self):
         """Clears all stored memory."""
         self.memory_store.clear()
-        logger.info("Cleared all memory.")
\ No newline at end of file
+        self.turn_cache.clear()
+        self.history_cache.clear()
+        logger.info("Cleared all memory.")
+
+class SQLiteMemory(Memory):
+    """Memory kept in a SQLite database, so a session can be resumed by another worker or after a restart.
+
+    Turns are stored one row per (session_id, key) and read newest first through the primary key. Writes
+    are buffered and flushed in one transaction once batch_size turns are pending, on every read and on
+    flush(). A background thread deletes sessions that have not been written for session_ttl seconds.
+    One session should be used by one SmartData instance at a time.
+    """
+    def __init__(self, session_id=None, path=Config.MEMORY_PATH, max_turns=Config.MEMORY_MAX_TURNS,
+                 token_budget=Config.MEMORY_TOKEN_BUDGET, truncate_chars=Config.MEMORY_TRUNCATE_CHARS,
+                 token_counter=estimate_tokens, batch_size=Config.MEMORY_BATCH_SIZE,
+                 session_ttl=Config.MEMORY_SESSION_TTL, compact_interval=Config.MEMORY_COMPACT_INTERVAL):
+        super().__init__(max_turns, token_budget, truncate_chars, token_counter)
+        self.session_id = uuid.uuid4().hex if session_id is None else session_id
+        self.path = path
+        self.batch_size = batch_size
+        self.pending = OrderedDict()
+        self.connection, self.lock = _sqlite_connection(path)
+        if compact_interval is not None and session_ttl is not None:
+            _start_compaction(path, session_ttl, compact_interval)
+
+    def _entry(self, key):
+        if key in self.pending:
+            return self.pending[key]
+        row = self.connection.execute("SELECT entry FROM memory WHERE session_id = ? AND key = ?",
+                                      (self.session_id, key)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def remember(self, key, role, value):
+        """Stores a value in memory with the specified key."""
+        with self.lock:
+            entry = self._entry(key)
+            if entry is None:
+                entry = {'Human': '', 'AI': '', 'Plot Code Generate By AI':[]}
+            entry[role] = value
+            self.pending[key] = entry
+            self.pending.move_to_end(key)
+            self.turn_cache.pop(key, None)
+            self.history_cache.clear()
+            if len(self.pending) >= self.batch_size:
+                self._flush()
+        logger.info(f"Stored {role} message for key {key} in memory.")
+
+    def _flush(self):
+        if not self.pending:
+            return
+        now = time.time()
+        with self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO memory (session_id, key, entry) VALUES (?, ?, ?)",
+                                        [(self.session_id, key, json.dumps(entry, default=str))
+                                         for key, entry in self.pending.items()])
+            self.connection.execute("INSERT OR REPLACE INTO sessions (session_id, updated) VALUES (?, ?)",
+                                    (self.session_id, now))
+            if self.max_turns is not None:
+                # Everything older than the newest max_turns turns of the session is evicted. The newest evicted
+                # key is read first instead of using DELETE ... RETURNING, which needs SQLite 3.35
+                row = self.connection.execute(
+                    "SELECT key FROM memory WHERE session_id = ? ORDER BY key DESC LIMIT 1 OFFSET ?",
+                    (self.session_id, self.max_turns)).fetchone()
+                if row is not None:
+                    self.connection.execute("DELETE FROM memory WHERE session_id = ? AND key <= ?", (self.session_id, row[0]))
+                    for key in [key for key in self.turn_cache if key <= row[0]]:
+                        self.turn_cache.pop(key)
+        self.pending.clear()
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def is_not_empty(self):
+        """Checks if the memory store is not empty."""
+        with self.lock:
+            self._flush()
+            return self.connection.execute("SELECT 1 FROM memory WHERE session_id = ? LIMIT 1",
+                                           (self.session_id,)).fetchone() is not None
+
+    def recall(self, key):
+        """Retrieves a value from memory by its key."""
+        with self.lock:
+            entry = self._entry(key)
+        return entry if entry is not None else "Key not found in memory"
+
+    def _turns(self, limit=None):
+        with self.lock:
+            self._flush()
+            rows = self.connection.execute("SELECT key, entry FROM memory WHERE session_id = ? ORDER BY key DESC LIMIT ?",
+                                           (self.session_id, -1 if limit is None else limit)).fetchall()
+        return {key: json.loads(entry) for key, entry in reversed(rows)}
+
+    def recall_all(self):
+        return str(self._turns())
+
+    def recall_last_conversation(self, number_last_conversation):
+        if number_last_conversation <= 0:
+            return {}
+        return self._turns(number_last_conversation)
+
+    def next_key(self):
+        """Key for the next turn, so a resumed session carries on after its last stored turn."""
+        with self.lock:
+            self._flush()
+            row = self.connection.execute("SELECT MAX(key) FROM memory WHERE session_id = ?", (self.session_id,)).fetchone()
+        return row[0] + 1 if row[0] is not None else 1
+
+    def forget(self, key):
+        """Removes a value from memory by its key."""
+        with self.lock:
+            self._flush()
+            with self.connection:
+                deleted = self.connection.execute("DELETE FROM memory WHERE session_id = ? AND key = ?",
+                                                  (self.session_id, key)).rowcount
+            self.turn_cache.pop(key, None)
+            self.history_cache.clear()
+        if deleted:
+            logger.info(f"Forgot {key} from memory.")
+        else:
+            logger.warning(f"Key {key} not found in memory.")
+
+    def clear_memory(self):
+        """Clears all stored memory."""
+        with self.lock:
+            self.pending.clear()
+            with self.connection:
+                self.connection.execute("DELETE FROM memory WHERE session_id = ?", (self.session_id,))
+                self.connection.execute("DELETE FROM sessions WHERE session_id = ?", (self.session_id,))
+            self.turn_cache.clear()
+            self.history_cache.clear()
+        logger.info("Cleared all memory.")
+
+def _open_database(path):
+    connection = sqlite3.connect(path, check_same_thread=False)
+    with connection:
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("CREATE TABLE IF NOT EXISTS memory "
+                           "(session_id TEXT, key INTEGER, entry TEXT, PRIMARY KEY (session_id, key)) WITHOUT ROWID")
+        connection.execute("CREATE TABLE IF NOT EXISTS sessions (session_id TEXT PRIMARY KEY, updated REAL)")
+        connection.execute("CREATE INDEX IF NOT EXISTS sessions_updated ON sessions (updated)")
+    return connection
+
+@functools.lru_cache(maxsize=None)
+def _sqlite_connection(path):
+    # Sessions on one database share a connection and its lock
+    return _open_database(path), threading.RLock()
+
+def compact_memory(path=Config.MEMORY_PATH, session_ttl=Config.MEMORY_SESSION_TTL):
+    """Delete the sessions not written for session_ttl seconds; returns the number of sessions removed."""
+    connection, lock = _sqlite_connection(path)
+    cutoff = time.time() - session_ttl
+    with lock, connection:
+        connection.execute("DELETE FROM memory WHERE session_id IN (SELECT session_id FROM sessions WHERE updated < ?)", (cutoff,))
+        removed = connection.execute("DELETE FROM sessions WHERE updated < ?", (cutoff,)).rowcount
+    if removed:
+        logger.info(f"Compacted {removed} expired sessions from {path}.")
+    return removed
+
+_COMPACTION_THREADS = {}
+_COMPACTION_LOCK = threading.Lock()
+
+def _start_compaction(path, session_ttl, compact_interval):
+    # One daemon thread per database file
+    with _COMPACTION_LOCK:
+        if path in _COMPACTION_THREADS:
+            return
+        def compact_periodically():
+            while True:
+                try:
+                    compact_memory(path, session_ttl)
+                except sqlite3.Error as e:
+                    logger.warning(f"Memory compaction of {path} failed: {e}")
+                time.sleep(compact_interval)
+        thread = threading.Thread(target=compact_periodically, name='smartdata-memory-compaction', daemon=True)
+        _COMPACTION_THREADS[path] = thread
+        thread.start()
+
+def create_memory(backend=Config.MEMORY_BACKEND, session_id=None):
+    """Memory for a new session: in-process for None, or 'sqlite' for the database at MEMORY_PATH."""
+    if backend is None:
+        return Memory()
+    if backend == 'sqlite':
+        return SQLiteMemory(session_id=session_id)
+    raise ValueError(f"Unknown memory backend {backend!r}; use 'sqlite' or None.")
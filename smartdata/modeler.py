@@ -1,6 +1,6 @@
-from langchain_openai import ChatOpenAI
-from langchain.prompts import PromptTemplate
-from langchain_core.output_parsers import StrOutputParser
+# langchain_openai, langchain.agents and langchain_experimental are imported on first use, in
+# get_shared_llm, build_agent and the clean summary chain, which keeps `import smartdata` fast
+from langchain_core.callbacks import BaseCallbackHandler
 
 import pandas as pd
 import numpy as np
@@ -11,29 +11,158 @@ import io
 import json
 import ast
 import copy
+import uuid
+import asyncio
+import functools
+import threading
+import time
 import logging
+import queue
+import weakref
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
 logger = logging.getLogger('SmartData')
 
 from .config import Config
-from .memory import Memory  # Import Memory from memory.py
-from .custom_agent import *
+from .memory import Memory, create_memory  # Import Memory from memory.py
+from .profiler import PROFILE_CACHE
+from .versions import FrameStore
+from .profiler import dataframe_fingerprint
+from .response_cache import create_response_cache, model_identifier, prompt_text, response_cache_key
+from .render import ImageHandle, close_figure, get_figure_renderer
+from . import tracing
+from .tracing import TracedResult, get_tracer
+from .streaming import StreamEvent, StreamingCallbackHandler, discard_event
 from .util import *
 
 global config
 config = dict(Config.__dict__)
 
+@functools.lru_cache(maxsize=None)
+def get_shared_llm(model = config['CHAT_MODEL'], temperature = config['TEMP_CHAT'], seed = 0):
+    # One client (and HTTP connection pool) per model for the whole process. The chat model of another seed is a
+    # copy that shares it; the agent runs do not pass a run config down to the LLM, so the seed has to live on the model
+    if seed != 0:
+        return get_shared_llm(model, temperature).model_copy(update = {'seed': seed})
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(temperature=temperature, model=model, seed = 0)
+
+class AttemptCancelledError(Exception):
+    pass
+
+class CancelAttemptHandler(BaseCallbackHandler):
+    """Stops an agent run at its next LLM or tool call once another attempt has won."""
+    raise_error = True
+
+    def __init__(self, cancel_event):
+        self.cancel_event = cancel_event
+
+    def check_cancelled(self):
+        if self.cancel_event.is_set():
+            raise AttemptCancelledError("Attempt cancelled after another attempt answered.")
+
+    def on_chat_model_start(self, serialized, messages, **kwargs):
+        self.check_cancelled()
+
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        self.check_cancelled()
+
+    def on_tool_start(self, serialized, input_str, **kwargs):
+        self.check_cancelled()
+
+def llm_token_usage(response):
+    # Chat models report usage on each message; older clients only in llm_output
+    usages = [generation.message.usage_metadata for generations in response.generations for generation in generations
+              if getattr(getattr(generation, 'message', None), 'usage_metadata', None)]
+    if usages:
+        prompt_tokens = sum(usage.get('input_tokens', 0) for usage in usages)
+        completion_tokens = sum(usage.get('output_tokens', 0) for usage in usages)
+    else:
+        usage = (response.llm_output or {}).get('token_usage') or {}
+        prompt_tokens = usage.get('prompt_tokens', 0)
+        completion_tokens = usage.get('completion_tokens', 0)
+    return {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens, 'total_tokens': prompt_tokens + completion_tokens}
+
+class TracingCallbackHandler(BaseCallbackHandler):
+    """Records each LLM call, with its token counts, and each tool call as a span under parent."""
+    run_inline = True
+
+    def __init__(self, parent):
+        self.parent = parent
+        self.spans = {}
+
+    def start(self, run_id, name, **attributes):
+        self.spans[run_id] = self.parent.trace.start_span(name, self.parent, attributes)
+
+    def finish(self, run_id, error = None, **attributes):
+        span = self.spans.pop(run_id, None)
+        if span is not None:
+            span.set(**attributes)
+            span.end(error)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        params = kwargs.get('invocation_params') or {}
+        self.start(run_id, 'llm', model = params.get('model_name', params.get('model')), messages = sum(len(batch) for batch in messages))
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        params = kwargs.get('invocation_params') or {}
+        self.start(run_id, 'llm', model = params.get('model_name', params.get('model')), prompt_chars = sum(len(prompt) for prompt in prompts))
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        self.finish(run_id, **llm_token_usage(response))
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self.finish(run_id, error)
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        self.start(run_id, 'tool', tool = (serialized or {}).get('name'), input_chars = len(input_str))
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self.finish(run_id, output_chars = len(str(output)))
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self.finish(run_id, error)
+
 class SmartData:
     def __init__(self, df_list, llm = None, show_detail = config['SHOW_DETAIL'], memory_size = config['MEMORY_SIZE'], 
-                 max_iterations = config['MAX_ITERATIONS'], max_execution_time = config['MAX_EXECUTION_TIME'], seed = 0):
+                 max_iterations = config['MAX_ITERATIONS'], max_execution_time = config['MAX_EXECUTION_TIME'], seed = 0,
+                 response_cache = None, sandbox = None, renderer = None, memory = None, tracer = None):
         
-        # Use ChatGPT 4o-mini by default
-        if llm is None:
-            chat_llm = ChatOpenAI(temperature=config['TEMP_CHAT'], model=config['CHAT_MODEL'], seed = seed)
-            self.llm = chat_llm
-        else:
-            self.llm = llm
+        # Use ChatGPT 4o-mini by default, created on first use; a chat model passed in is kept for every run
+        self.use_shared_llm = llm is None
+        self.llm = llm
+        self.seed = seed
         
-        self.df_list = copy.deepcopy(df_list)
+        # Every assignment to df_list commits a new version to the frame store; data_version keys the cached prompt profile
+        self.session_id = uuid.uuid4().hex
+        self.data_version = 0
+        self.profile_cache = PROFILE_CACHE
+        # Agent responses are shared across sessions through the configured cache, if any
+        if response_cache is None:
+            response_cache = create_response_cache(config['RESPONSE_CACHE'], config['RESPONSE_CACHE_PATH'],
+                                                   config['RESPONSE_CACHE_SIZE'], config['RESPONSE_CACHE_TTL'])
+        self.response_cache = response_cache
+        # Generated code runs in the sandbox worker pool when one is given or SANDBOX is on
+        if sandbox is None and config['SANDBOX']:
+            from .sandbox import get_sandbox_pool
+            sandbox = get_sandbox_pool()
+        self.sandbox = sandbox
+        # Captured figures are rendered to image handles in the background when a renderer is given or RENDER_FORMAT is set
+        if renderer is None and config['RENDER_FORMAT']:
+            renderer = get_figure_renderer()
+        self.renderer = renderer
+        # Every run_model call is traced; the tracer's exporters decide where the spans go
+        self.tracer = tracer if tracer is not None else get_tracer(config['TRACE_EXPORTER'], config['TRACE_PATH'])
+        self.last_trace = None
+        self.retained_images = deque()
+        self.retained_images_lock = threading.Lock()
+        self.data_fingerprint_entry = None
+        self.frame_store = FrameStore(max_versions = config['MAX_DATA_VERSIONS'])
+        self.frame_stores = []
+        self.frame_versions = []
+        self.frame_keys = []
+        self._df_list_copy = None
+        self.df_list = df_list if isinstance(df_list, pd.DataFrame) else list(df_list)
         self.df_change = []
         self.memory_size = memory_size
         self.max_iterations = max_iterations
@@ -51,106 +180,715 @@ class SmartData:
         self.prompt_create_data_clean_summary = config["PROMPT_CREATE_DATA_CLEAN_SUMMARY"]
         
         self.model = None
-        self.memory = Memory()
-        self.message_count = 1
+        self.model_key = None
+        self.models = {}
+        self.prompt = None
+        # A stored memory resumes its session: new turns are numbered after the last stored one
+        self.memory = memory if memory is not None else create_memory(config['MEMORY_BACKEND'])
+        self.message_count = self.memory.next_key()
         # self.df
         # self.create_model()
 
+    @property
+    def llm(self):
+        if self._llm is None:
+            self._llm = get_shared_llm(config['CHAT_MODEL'], config['TEMP_CHAT'])
+        return self._llm
+
+    @llm.setter
+    def llm(self, llm):
+        self._llm = llm
+
+    @property
+    def df_list(self):
+        # Callers get writable copies; the read-only checkouts that share memory with the frame store stay with the
+        # agent and the profiler. Only weak references to the copies are kept, so a copy is handed out again while a
+        # caller still holds it and is freed with the caller's last reference. Reassign df_list after changing it in place.
+        is_frame = isinstance(self._df_list, pd.DataFrame)
+        frames = None
+        if self._df_list_copy is not None and self._df_list_copy[0] == self.data_version:
+            frames = [ref() for ref in self._df_list_copy[1]]
+        if frames is None or any(df is None for df in frames):
+            frames = [self._df_list.copy()] if is_frame else [df.copy() for df in self._df_list]
+            self._df_list_copy = (self.data_version, [weakref.ref(df) for df in frames])
+        return frames[0] if is_frame else frames
+
+    @df_list.setter
+    def df_list(self, df_list):
+        self.commit_data(df_list)
+
+    def commit_data(self, df_list, adopt = False):
+        # A DataFrame is stored column by column, sharing unchanged columns with earlier versions
+        if isinstance(df_list, pd.DataFrame):
+            self.data_version = self.frame_store.commit(df_list, adopt = adopt)
+            self._df_list = self.frame_store.checkout(self.data_version)
+            return
+        # Each frame of a list has its own store and version; frames that are still the current objects are kept as they are
+        current = getattr(self, '_df_list', None)
+        if not isinstance(current, list) or len(current) != len(df_list):
+            self.frame_stores = [FrameStore(max_versions = config['MAX_DATA_VERSIONS']) for _ in df_list]
+            self.frame_versions = [None] * len(df_list)
+            self.frame_keys = [None] * len(df_list)
+            current = [None] * len(df_list)
+        frames = []
+        for i, df in enumerate(df_list):
+            if df is current[i]:
+                frames.append(df)
+                continue
+            self.frame_versions[i] = self.frame_stores[i].commit(df, adopt = adopt)
+            # Ids from the session-wide counter are never reused, even when the frame stores are rebuilt
+            self.frame_keys[i] = self.frame_store.new_version_id()
+            frames.append(self.frame_stores[i].checkout(self.frame_versions[i]))
+        self.data_version = self.frame_store.new_version_id()
+        self._df_list = frames
+
+    def apply_data_change(self, df_change):
+        # The frame built by the generated code is adopted by the store, which keeps only its changed columns
+        with tracing.span('apply_data_change') as span:
+            if isinstance(df_change[-1], pd.DataFrame):
+                has_changes_to_df = not self._df_list.equals(df_change[-1])
+                if has_changes_to_df:
+                    self.commit_data(df_change[-1], adopt = True)
+            else:
+                # Only the frames that really changed get a new version
+                changed = [i for i, (current, df) in enumerate(zip(self._df_list, df_change[-1]))
+                           if df is not current and not current.equals(df)]
+                has_changes_to_df = len(changed)>0
+                if has_changes_to_df:
+                    self.commit_data([df_change[-1][i] if i in changed else current for i, current in enumerate(self._df_list)], adopt = True)
+            df_change[:] = [self._df_list]
+            if span is not None:
+                span.set(changed = has_changes_to_df, **self.data_size())
+        return has_changes_to_df
+
+    def working_copy(self, version = None):
+        # Stored columns are read-only, so a fresh checkout is as isolated as a deep copy
+        with tracing.span('working_copy'):
+            if isinstance(self._df_list, pd.DataFrame):
+                return self.frame_store.checkout(self.data_version if version is None else version)
+            # Frames of a list are checked out at their current versions
+            return [store.checkout(frame_version) for store, frame_version in zip(self.frame_stores, self.frame_versions)]
+
+    def rollback_data(self, version, frame = None):
+        """Make an earlier data version current again without copying any data.
+
+        For a list of frames, frame is the position of the frame to roll back and version is one of its own versions.
+        """
+        if isinstance(self._df_list, pd.DataFrame):
+            self._df_list = self.frame_store.rollback(version)
+            self.data_version = version
+            return self._df_list
+        if frame is None:
+            raise ValueError("Pass the position of the frame to roll back when the session holds a list of frames.")
+        frames = list(self._df_list)
+        frames[frame] = self.frame_stores[frame].rollback(version)
+        self.frame_versions[frame] = version
+        self.frame_keys[frame] = self.frame_store.new_version_id()
+        self.data_version = self.frame_store.new_version_id()
+        self._df_list = frames
+        return self._df_list
+
+    def data_version_report(self):
+        if isinstance(self._df_list, pd.DataFrame):
+            return self.frame_store.memory_report()
+        reports = [store.memory_report().assign(frame = i) for i, store in enumerate(self.frame_stores)]
+        report = pd.concat(reports, ignore_index = True)
+        return report[['frame'] + [col for col in report.columns if col != 'frame']]
+
+    def profile_key(self):
+        return (self.session_id, self.data_version)
+
+    def profile_column_keys(self):
+        # Stored columns keep their keys across versions, so a data change only profiles the columns it touched
+        if isinstance(self._df_list, pd.DataFrame):
+            return self.frame_store.column_keys(self.data_version)
+        return [store.column_keys(frame_version) for store, frame_version in zip(self.frame_stores, self.frame_versions)]
+
+    def data_size(self):
+        frames = self._df_list if isinstance(self._df_list, list) else [self._df_list]
+        return {'rows': sum(len(df) for df in frames), 'columns': sum(df.shape[1] for df in frames),
+                'data_bytes': int(sum(df.memory_usage(index = True).sum() for df in frames))}
+
+    def frame_profile_keys(self):
+        # One key per frame of a list, so only frames that changed are profiled again
+        return [(self.session_id, 'frame', frame_key) for frame_key in self.frame_keys]
+
+    def llm_config(self, emit = None):
+        # With emit, answer tokens and tool calls of the run are streamed to it
+        if emit is None:
+            return {}
+        return {'callbacks': [StreamingCallbackHandler(emit)]}
+
+    def seeded_llm(self, seed):
+        # A chat model passed in is used as it is for every seed
+        return get_shared_llm(config['CHAT_MODEL'], config['TEMP_CHAT'], seed) if self.use_shared_llm else self.llm
+
+    def reset_repl_state(self, agent_executor = None, df = None):
+        # A reused executor must not see variables left over by earlier runs
+        from langchain_experimental.tools.python.tool import PythonAstREPLTool
+        from .custom_agent import DataFramePythonREPLTool, SandboxPythonREPLTool, dataframe_locals
+        agent_executor = self.model if agent_executor is None else agent_executor
+        df = self._df_list if df is None else df
+        df_locals = dataframe_locals(df)
+        for tool in agent_executor.tools:
+            if isinstance(tool, PythonAstREPLTool):
+                tool.locals = dict(df_locals)
+                tool.globals = {}
+                if isinstance(tool, DataFramePythonREPLTool):
+                    tool.artifacts = {}
+            elif isinstance(tool, SandboxPythonREPLTool):
+                tool.reset(df_locals)
+
     def create_model(self, use_openai_llm = True, seed = 0):
-        df = self.df_list
-        prefix_df = config['DEFAULT_PREFIX_SINGLE_DF']
+        df = self._df_list
         if use_openai_llm:
-            self.llm = ChatOpenAI(temperature=config['TEMP_CHAT'], model=config['CHAT_MODEL'], seed = seed)
-        
-        prompt, agent_executor = custom_create_pandas_dataframe_agent(llm = self.llm,df = df,
-            verbose=self.show_detail,
-            return_intermediate_steps = True,
-            agent_type="tool-calling",
-            allow_dangerous_code=True,
-            prefix = prefix_df,
-            max_iterations = self.max_iterations,
-            max_execution_time=self.max_execution_time,
-            agent_executor_kwargs={'handle_parsing_errors':True}
-        )
+            self.llm = self.seeded_llm(seed)
+        self.seed = seed
+
+        # An executor only depends on the data and the client, so one is kept per client (that is, per seed)
+        # until the data changes
+        model_key = (self.profile_key(), id(self.llm))
+        with tracing.span('create_model', seed = seed):
+            if model_key in self.models:
+                tracing.annotate(cached = True)
+                self.prompt, self.model = self.models[model_key]
+                self.model_key = model_key
+                self.reset_repl_state()
+                return self.prompt, self.model
+
+            tracing.annotate(cached = False)
+            prompt, agent_executor = self.build_agent(df)
+        self.models = {key: entry for key, entry in self.models.items() if key[0] == model_key[0]}
+        self.models[model_key] = (prompt, agent_executor)
         self.model = agent_executor
+        self.model_key = model_key
+        self.prompt = prompt
         return prompt, agent_executor
 
-    def run_model(self, question):
-        for i in range(10):
+    def data_fingerprint(self):
+        # Content fingerprint of the current data, computed once per data version
+        if self.data_fingerprint_entry is None or self.data_fingerprint_entry[0] != self.data_version:
+            frames = self._df_list if isinstance(self._df_list, list) else [self._df_list]
+            fingerprints = [dataframe_fingerprint(frame) for frame in frames]
+            self.data_fingerprint_entry = (self.data_version, None if None in fingerprints else fingerprints)
+        return self.data_fingerprint_entry[1]
+
+    def get_response_cache_key(self, question_with_history, seed):
+        if self.response_cache is None:
+            return None
+        fingerprint = self.data_fingerprint()
+        if fingerprint is None:
+            return None
+        return response_cache_key(prompt_text(self.prompt), question_with_history, fingerprint, seed, model_identifier(self.llm))
+
+    def traced_run_config(self, run_config, span):
+        # LLM and tool calls of the run become child spans of span
+        if span is None:
+            return run_config
+        return {**run_config, 'callbacks': list(run_config.get('callbacks', [])) + [TracingCallbackHandler(span)]}
+
+    def invoke_agent(self, agent_executor, question_with_history, seed, run_config):
+        # Answers that pass the checks are cached; plots and data changes are rebuilt from the cached intermediate_steps
+        with tracing.span('agent', seed = seed, question_chars = len(question_with_history)) as span:
+            key = self.get_response_cache_key(question_with_history, seed)
+            if key is not None:
+                response = self.response_cache.get(key)
+                tracing.annotate(cache_hit = response is not None)
+                if response is not None:
+                    return response
+            response = agent_executor.invoke({"input": question_with_history}, config = self.traced_run_config(run_config, span))
+            if key is not None and not self.is_stopped_answer(response['output']):
+                self.response_cache.put(key, response)
+            return response
+
+    async def ainvoke_agent(self, agent_executor, question_with_history, seed, run_config):
+        loop = asyncio.get_running_loop()
+        with tracing.span('agent', seed = seed, question_chars = len(question_with_history)) as span:
+            key = await loop.run_in_executor(None, self.get_response_cache_key, question_with_history, seed)
+            if key is not None:
+                response = await loop.run_in_executor(None, self.response_cache.get, key)
+                tracing.annotate(cache_hit = response is not None)
+                if response is not None:
+                    return response
+            response = await agent_executor.ainvoke({"input": question_with_history}, config = self.traced_run_config(run_config, span))
+            if key is not None and not self.is_stopped_answer(response['output']):
+                await loop.run_in_executor(None, self.response_cache.put, key, response)
+            return response
+
+    def get_question_with_history(self, question):
+        question_with_history = question
+        with tracing.span('memory'):
+            if self.memory.is_not_empty():
+                question_with_history = f"My question is: {question}. Below is the our previous conversation and codes in chronological order, from the earliest to the latest.: {self.memory.render_last_conversation(self.memory_size)}."
+        return question_with_history
+
+    def repl_artifacts(self, agent_executor):
+        from .custom_agent import DataFramePythonREPLTool, SandboxPythonREPLTool
+        for tool in agent_executor.tools:
+            if isinstance(tool, (DataFramePythonREPLTool, SandboxPythonREPLTool)):
+                return tool.artifacts
+        return {}
+
+    def execute_in_sandbox(self, code, df):
+        # A fresh session, like exec with new globals; errors are raised as exec would
+        from .custom_agent import dataframe_locals
+        from .sandbox import SandboxError
+        captured = self.sandbox.execute(uuid.uuid4().hex, dataframe_locals(df), code)
+        if captured['error']:
+            raise SandboxError(captured['output'])
+        return captured
+
+    def execute_generated_code(self, code_list, df, image_fig_list, df_change, artifacts = None):
+        # Objects captured while the agent ran the code are used as they are; the code only runs again when nothing was captured
+        from .custom_agent import dataframe_locals
+        artifacts = {} if artifacts is None else artifacts
+        first_image = len(image_fig_list)
+        code_list_plot_wo_add_on = []
+        code_list_plot_with_add_on = []
+        code_list_datachange_wo_add_on = []
+        code_list_datachange_with_add_on = []
+
+        # Process plot into fig -------------------------------------------------------------------------------------------------------------------------
+        if len(code_list)>0:
+            code_list_plot_wo_add_on, code_list_plot_with_add_on = self.process_with_plot_code(code_list)
+
+        plot_source_list = self.select_code(code_list, self.check_plot_substring_list)
+        for source, plot_code_wo_add_on, plot_code in zip(plot_source_list, code_list_plot_wo_add_on, code_list_plot_with_add_on):
+            captured = artifacts.get(source, {})
+            if 'fig' not in captured and self.sandbox is not None:
+                with tracing.span('plot_exec', sandbox = True):
+                    captured = self.execute_in_sandbox(plot_code_wo_add_on, df)
+            if 'fig' in captured and 'ax' in captured:
+                exec(config['ADD_ON_FORMAT_LABEL_FOR_AXIS'], {}, {'ax': captured['ax']})
+                image_fig_list.append(captured['fig'])
+            elif self.sandbox is None:
+                with tracing.span('plot_exec', sandbox = False):
+                    exec(plot_code, {'image_fig_list': image_fig_list, **dataframe_locals(df)},{})
+
+        # Process data change into a new dataset --------------------------------------------------------------------------------------------------------
+        if len(code_list)>0:
+            code_list_datachange_wo_add_on, code_list_datachange_with_add_on = self.process_with_datachange_code(code_list)
+
+        datachange_source_list = self.select_code(code_list, self.check_datachange_substring_list)
+        for source, data_code_wo_add_on, data_code in zip(datachange_source_list, code_list_datachange_wo_add_on, code_list_datachange_with_add_on):
+            captured = artifacts.get(source, {})
+            if 'df_update' not in captured and self.sandbox is not None:
+                with tracing.span('datachange_exec', sandbox = True):
+                    captured = self.execute_in_sandbox(data_code_wo_add_on, df)
+            df_update_list = []
+            if isinstance(captured.get('df_update'), pd.DataFrame):
+                df_update_list.append(captured['df_update'])
+            elif self.sandbox is None:
+                with tracing.span('datachange_exec', sandbox = False):
+                    exec(data_code, {'df_change': df_update_list, **dataframe_locals(df)},{})
+            for df_update in df_update_list:
+                self.add_data_change(df_change, df, source, df_update)
+
+        with tracing.span('render', images = len(image_fig_list) - first_image):
+            image_fig_list[first_image:] = self.render_images(image_fig_list[first_image:])
+        return code_list_plot_wo_add_on, code_list_plot_with_add_on, code_list_datachange_with_add_on
+
+    def render_images(self, images):
+        # Figures are closed in pyplot and rendered in the background; without a renderer they are kept as they are
+        if self.renderer is not None:
+            images = [image if isinstance(image, ImageHandle) else self.renderer.render(image) for image in images]
+        self.retain_images(images)
+        return images
+
+    def retain_images(self, images):
+        # The session holds at most RENDER_MAX_IMAGES images; older figures are closed and older handles drop their bytes
+        with self.retained_images_lock:
+            self.retained_images.extend(images)
+            while config['RENDER_MAX_IMAGES'] is not None and len(self.retained_images) > config['RENDER_MAX_IMAGES']:
+                self.release_image(self.retained_images.popleft())
+
+    def release_image(self, image):
+        if isinstance(image, ImageHandle):
+            image.release()
+        else:
+            close_figure(image)
+
+    def discard_images(self, images):
+        # Images of an attempt whose answer was not kept are released now rather than when RENDER_MAX_IMAGES is reached
+        discarded = {id(image) for image in images}
+        with self.retained_images_lock:
+            kept = [image for image in self.retained_images if id(image) not in discarded]
+            self.retained_images.clear()
+            self.retained_images.extend(kept)
+        for image in images:
+            self.release_image(image)
+
+    def release_images(self):
+        """Close every figure and drop every rendered image this session still holds."""
+        with self.retained_images_lock:
+            while self.retained_images:
+                self.release_image(self.retained_images.popleft())
+
+    def add_data_change(self, df_change, df, code, df_update):
+        # With a list of frames, the update replaces only the frame it was copied from
+        if not isinstance(df, list):
+            df_change.append(df_update)
+            return
+        target = self.datachange_target(code, df, df_update)
+        if target is None:
+            logger.warning("Could not tell which dataframe the data change applies to; it was not applied.")
+            return
+        frames = list(df_change[-1] if len(df_change)>0 else df)
+        frames[target] = df_update
+        df_change.append(frames)
+
+    def datachange_target(self, code, df_list, df_update):
+        # The frame named in the assignment to df_update, e.g. df_update = copy.deepcopy(df2)
+        names = {f"df{i + 1}": i for i in range(len(df_list))}
+        try:
+            tree = ast.parse(code)
+        except SyntaxError:
+            tree = None
+        if tree is not None:
+            assignments = [node for node in ast.walk(tree) if isinstance(node, ast.Assign)
+                           and any(isinstance(target, ast.Name) and target.id == 'df_update' for target in node.targets)]
+            for node in sorted(assignments, key = lambda node: node.lineno):
+                for name in ast.walk(node.value):
+                    if isinstance(name, ast.Name) and name.id in names:
+                        return names[name.id]
+        # Otherwise the only frame with the same columns
+        matches = [i for i, df in enumerate(df_list) if df.columns.equals(df_update.columns)]
+        return matches[0] if len(matches) == 1 else None
+
+    def is_stopped_answer(self, answer):
+        return any(error_substring in str(answer) for error_substring in config['AGENT_STOP_SUBSTRING_LIST'])
+
+    def run_model(self, question, hedged_attempts = None):
+        # The returned tuple also carries the trace of the call as .trace and its summary as .summary
+        hedged_attempts = config['HEDGED_ATTEMPTS'] if hedged_attempts is None else hedged_attempts
+        with self.tracer.trace('run_model', question_chars = len(question), hedged_attempts = hedged_attempts, **self.data_size()) as trace:
+            if hedged_attempts > 1:
+                result = self.run_model_hedged(question, hedged_attempts)
+            else:
+                result = self.run_model_attempts(question)
+        self.last_trace = trace
+        return TracedResult(result, trace)
+
+    def run_model_attempts(self, question, emit = None):
+        # emit receives the StreamEvents of stream_model
+        emit = discard_event if emit is None else emit
+        for i in range(config['MAX_ATTEMPTS']):
             prompt, _ = self.create_model(use_openai_llm = True, seed = i)
             try:
-                # self.image_fig_list.clear()
-                self.image_fig_list.clear()
-                self.df_change.clear()
-                chat_model = self.model
-                code_list = []
-                code_list_plot_wo_add_on = []
-                code_list_plot_with_add_on = []
-
-                code_list_datachange_wo_add_on = []
-                code_list_datachange_with_add_on = []
-                has_plots = False
-                has_changes_to_df = False
-                new_prompt = None
-
-                question_with_history = copy.deepcopy(question)
-                if self.memory.is_not_empty():
-                    question_with_history = f"My question is: {question}. Below is the our previous conversation and codes in chronological order, from the earliest to the latest.: {self.memory.recall_last_conversation(self.memory_size)}."
-                
-                response = chat_model.invoke({"input": question_with_history})
-                answer = response['output']
-                code_list = self.extract_code_from_response(response)
-
-                # Process plot into fig -------------------------------------------------------------------------------------------------------------------------
-                if len(code_list)>0:
-                    code_list_plot_wo_add_on, code_list_plot_with_add_on = self.process_with_plot_code(code_list)
-
-                if len(code_list_plot_with_add_on)>0:
-                    for plot_code in code_list_plot_with_add_on:
-                        exec(plot_code, {'image_fig_list': self.image_fig_list, 'df': self.df_list},{})
-                    if len(self.image_fig_list)>0:
-                        has_plots = True
-                        # print("no plot code")
-
-                # Process data change into a new dataset --------------------------------------------------------------------------------------------------------
-                if len(code_list)>0:
-                    code_list_datachange_wo_add_on, code_list_datachange_with_add_on = self.process_with_datachange_code(code_list)
-
-                if len(code_list_datachange_with_add_on)>0:
-                    for data_code in code_list_datachange_with_add_on:
-                        exec(data_code, {'df_change': self.df_change, 'df': self.df_list},{})
-                        # data_code_exe = True
-                        # print("no plot code")
+                with tracing.span('attempt', retry = i, seed = i):
+                    emit(StreamEvent('attempt', retry = i))
+                    # self.image_fig_list.clear()
+                    self.image_fig_list.clear()
+                    self.df_change.clear()
+                    chat_model = self.model
+                    code_list = []
+                    code_list_plot_wo_add_on = []
+                    code_list_plot_with_add_on = []
+                    code_list_datachange_with_add_on = []
+                    has_plots = False
+                    has_changes_to_df = False
+                    new_prompt = None
+
+                    question_with_history = self.get_question_with_history(question)
+
+                    response = self.invoke_agent(chat_model, question_with_history, self.seed, self.llm_config(emit))
+                    answer = response['output']
+                    code_list = self.extract_code_from_response(response)
+
+                    with tracing.span('execute_code', code_blocks = len(code_list)):
+                        code_list_plot_wo_add_on, code_list_plot_with_add_on, code_list_datachange_with_add_on = self.execute_generated_code(
+                            code_list, self._df_list, self.image_fig_list, self.df_change, self.repl_artifacts(chat_model))
+                    has_plots = len(self.image_fig_list)>0
+                    for index, figure in enumerate(self.image_fig_list):
+                        emit(StreamEvent('figure', index = index, figure = figure))
                     if len(self.df_change)>0:
-                        has_changes_to_df = not self.df_list.equals(self.df_change[-1])
-                        self.df_list = copy.deepcopy(self.df_change[-1])
+                        has_changes_to_df = self.apply_data_change(self.df_change)
+                        if has_changes_to_df:
+                            emit(StreamEvent('data_changed', df = self.df_list, data_version = self.data_version))
                         new_prompt, _ = self.create_model(use_openai_llm = True, seed = i)
 
-                # Store the chat history
-                self.remember_conversation(question, answer,code_list,code_list_plot_wo_add_on)
-                if any(error_substring in str(answer) for error_substring in config['AGENT_STOP_SUBSTRING_LIST']):
-                    answer = config['AGENT_STOP_ANSWER']
-                else:
-                    break
+                    # Store the chat history
+                    self.remember_conversation(question, answer,code_list,code_list_plot_wo_add_on)
+                    if self.is_stopped_answer(answer):
+                        tracing.annotate(stopped = True)
+                        # Tokens streamed for this attempt are not the answer
+                        emit(StreamEvent('retry', retry = i, answer = answer))
+                        answer = config['AGENT_STOP_ANSWER']
+                    else:
+                        break
             except Exception as e:
                     print(f"Fail to process: {e}")
 
         return answer, has_plots, has_changes_to_df, self.image_fig_list, self.df_list, response, code_list, code_list_plot_with_add_on, code_list_datachange_with_add_on
         # return answer, self.image_fig_list, response, code_list, code_list_plot_with_add_on, new_prompt
 
+    def stream_model(self, question):
+        """Answer a question like run_model, yielding StreamEvents as they happen and a 'result' event with the run_model tuple last.
+
+        The attempts run on a background thread; attempts are made one at a time, without hedging.
+        """
+        events = queue.Queue()
+        finished = object()
+        errors = []
+
+        def produce():
+            try:
+                with self.tracer.trace('run_model', question_chars = len(question), hedged_attempts = 1, streamed = True, **self.data_size()) as trace:
+                    result = self.run_model_attempts(question, events.put)
+                self.last_trace = trace
+                result = TracedResult(result, trace)
+                events.put(StreamEvent('result', answer = result[0], result = result))
+            except BaseException as e:
+                errors.append(e)
+            finally:
+                events.put(finished)
+
+        worker = threading.Thread(target = produce, name = 'SmartDataStream', daemon = True)
+        worker.start()
+        while True:
+            event = events.get()
+            if event is finished:
+                break
+            yield event
+        worker.join()
+        if errors:
+            raise errors[0]
+
+    def build_agent(self, df, llm = None):
+        from .custom_agent import custom_create_pandas_dataframe_agent
+        with tracing.span('build_agent'):
+            return custom_create_pandas_dataframe_agent(llm = self.llm if llm is None else llm,df = df,
+                verbose=self.show_detail,
+                return_intermediate_steps = True,
+                agent_type="tool-calling",
+                allow_dangerous_code=True,
+                prefix = config['DEFAULT_PREFIX_MULTI_DF'] if isinstance(df, list) else config['DEFAULT_PREFIX_SINGLE_DF'],
+                max_iterations = self.max_iterations,
+                max_execution_time=self.max_execution_time,
+                agent_executor_kwargs={'handle_parsing_errors':True},
+                profile_cache=self.profile_cache,
+                profile_key=self.frame_profile_keys() if isinstance(df, list) else self.profile_key(),
+                profile_column_keys=self.profile_column_keys(),
+                profile_backend=config['PROFILE_BACKEND'],
+                sandbox=self.sandbox
+            )
+
+    def run_isolated_attempt(self, question_with_history, seed, cancel_event):
+        # Each attempt gets its own frame and executor, so concurrent exec of generated code cannot interfere
+        from .custom_agent import SandboxPythonREPLTool
+        with tracing.span('attempt', retry = seed, seed = seed, hedged = True):
+            df = self.working_copy()
+            _, agent_executor = self.build_agent(df, self.seeded_llm(seed))
+            for tool in agent_executor.tools:
+                if isinstance(tool, SandboxPythonREPLTool):
+                    # A sandboxed run still in progress is stopped as soon as another attempt wins
+                    tool.cancel_event = cancel_event
+            return self.run_attempt(agent_executor, df, question_with_history, seed,
+                                    run_config = {'callbacks': [CancelAttemptHandler(cancel_event)]})
+
+    def run_attempt(self, agent_executor, df, question_with_history, seed, run_config):
+        image_fig_list = []
+        df_change = []
+        response = self.invoke_agent(agent_executor, question_with_history, seed, run_config)
+        answer = response['output']
+        code_list = self.extract_code_from_response(response)
+        with tracing.span('execute_code', code_blocks = len(code_list)):
+            code_list_plot_wo_add_on, code_list_plot_with_add_on, code_list_datachange_with_add_on = self.execute_generated_code(
+                code_list, df, image_fig_list, df_change, self.repl_artifacts(agent_executor))
+        return {'seed': seed, 'answer': answer, 'response': response, 'code_list': code_list, 'image_fig_list': image_fig_list,
+                'df_change': df_change, 'code_list_plot_wo_add_on': code_list_plot_wo_add_on,
+                'code_list_plot_with_add_on': code_list_plot_with_add_on, 'code_list_datachange_with_add_on': code_list_datachange_with_add_on}
+
+    def run_model_hedged(self, question, hedged_attempts):
+        """Run up to hedged_attempts seeded attempts at once and keep the first answer that passes the checks."""
+        self.create_model(use_openai_llm = True, seed = 0)
+        question_with_history = self.get_question_with_history(question)
+        cancel_event = threading.Event()
+        pool = ThreadPoolExecutor(max_workers = hedged_attempts)
+        result = None
+        last_result = None
+        submitted = []
+        try:
+            for start in range(0, config['MAX_ATTEMPTS'], hedged_attempts):
+                seeds = range(start, min(start + hedged_attempts, config['MAX_ATTEMPTS']))
+                futures = {pool.submit(tracing.in_context(self.run_isolated_attempt), question_with_history, seed, cancel_event): seed
+                           for seed in seeds}
+                submitted.extend(futures)
+                for future in as_completed(futures):
+                    try:
+                        attempt = future.result()
+                    except Exception:
+                        logger.warning(f"Hedged attempt with seed {futures[future]} failed.", exc_info = True)
+                        continue
+                    last_result = attempt
+                    if not self.is_stopped_answer(attempt['answer']):
+                        result = attempt
+                        break
+                if result is not None:
+                    break
+        finally:
+            # Attempts still running stop at their next LLM or tool call
+            cancel_event.set()
+            pool.shutdown(wait = False, cancel_futures = True)
+
+        if result is None and last_result is None:
+            raise RuntimeError("All attempts failed to process the question.")
+        attempt = result if result is not None else last_result
+
+        def discard_losing_attempt(future):
+            # Runs now for finished attempts and when a cancelled one stops
+            if not future.cancelled() and future.exception() is None and future.result() is not attempt:
+                self.discard_images(future.result()['image_fig_list'])
+        for future in submitted:
+            future.add_done_callback(discard_losing_attempt)
+
+        answer = attempt['answer']
+        has_changes_to_df = False
+        self.image_fig_list[:] = attempt['image_fig_list']
+        self.df_change[:] = attempt['df_change']
+        if len(self.df_change)>0:
+            has_changes_to_df = self.apply_data_change(self.df_change)
+            self.create_model(use_openai_llm = True, seed = attempt['seed'])
+        self.remember_conversation(question, answer, attempt['code_list'], attempt['code_list_plot_wo_add_on'])
+        if result is None:
+            answer = config['AGENT_STOP_ANSWER']
+
+        return answer, len(self.image_fig_list)>0, has_changes_to_df, self.image_fig_list, self.df_list, attempt['response'], attempt['code_list'], attempt['code_list_plot_with_add_on'], attempt['code_list_datachange_with_add_on']
+
+    def run_many(self, questions, concurrency = None):
+        """Answer a batch of questions, running them concurrently against one snapshot of the data.
+
+        Every question sees the data as it was when the batch started. Questions that change the data are
+        applied in question order; when an earlier question has already changed the data, the later one is
+        asked again against the changed data. Returns the run_model tuple for each question, in order, and
+        the batch statistics. The batch is traced as one 'run_many' trace, kept as last_trace.
+        """
+        concurrency = config['BATCH_CONCURRENCY'] if concurrency is None else concurrency
+        with self.tracer.trace('run_many', questions = len(questions), concurrency = concurrency, **self.data_size()) as trace:
+            results, stats = self.run_many_questions(questions, concurrency)
+        self.last_trace = trace
+        return results, stats
+
+    def run_many_questions(self, questions, concurrency):
+        start_time = time.perf_counter()
+
+        # Profile and prompt are computed once for the snapshot and shared by every worker's executor
+        self.create_model(use_openai_llm = True, seed = 0)
+        snapshot = self._df_list
+        snapshot_version = self.data_version
+        questions_with_history = [self.get_question_with_history(question) for question in questions]
+        worker_state = threading.local()
+        failed_attempts = []
+
+        def answer_question(index, question_with_history):
+            if getattr(worker_state, 'agent_executors', None) is None:
+                worker_state.agent_executors = {}
+            attempt = None
+            for seed in range(config['MAX_ATTEMPTS']):
+                if seed not in worker_state.agent_executors:
+                    _, worker_state.agent_executors[seed] = self.build_agent(snapshot, self.seeded_llm(seed))
+                agent_executor = worker_state.agent_executors[seed]
+                try:
+                    with tracing.span('attempt', retry = seed, seed = seed, question = index):
+                        # Each attempt works on its own frame, so generated code cannot change what other questions see
+                        df = self.working_copy(snapshot_version)
+                        self.reset_repl_state(agent_executor, df)
+                        new_attempt = self.run_attempt(agent_executor, df, question_with_history, seed, run_config = {})
+                except Exception:
+                    logger.warning(f"Batch attempt with seed {seed} failed.", exc_info = True)
+                    # list.append is atomic, so workers can record failures without a lock
+                    failed_attempts.append(seed)
+                    continue
+                if attempt is not None:
+                    # The earlier attempt was stopped, so its figures are not returned
+                    self.discard_images(attempt['image_fig_list'])
+                attempt = new_attempt
+                if not self.is_stopped_answer(attempt['answer']):
+                    break
+            return attempt
+
+        with ThreadPoolExecutor(max_workers = max(1, concurrency)) as pool:
+            # Each worker's spans nest under the batch trace
+            futures = [pool.submit(tracing.in_context(answer_question), index, question_with_history)
+                       for index, question_with_history in enumerate(questions_with_history)]
+            attempts = [future.result() for future in futures]
+
+        results = []
+        rerun_count = 0
+        failed_count = 0
+        for question, attempt in zip(questions, attempts):
+            if attempt is not None and len(attempt['df_change'])>0 and self.data_version != snapshot_version:
+                # An earlier question changed the data after this one ran, so ask again against the current data
+                rerun_count += 1
+                result = self.run_model(question, hedged_attempts = 1)
+                results.append((result[0], result[1], result[2], list(result[3])) + tuple(result[4:]))
+                continue
+            if attempt is None:
+                failed_count += 1
+                results.append((config['AGENT_STOP_ANSWER'], False, False, [], self.df_list, None, [], [], []))
+                continue
+
+            answer = attempt['answer']
+            has_changes_to_df = False
+            if len(attempt['df_change'])>0:
+                has_changes_to_df = self.apply_data_change(attempt['df_change'])
+            self.remember_conversation(question, answer, attempt['code_list'], attempt['code_list_plot_wo_add_on'])
+            if self.is_stopped_answer(answer):
+                answer = config['AGENT_STOP_ANSWER']
+            results.append((answer, len(attempt['image_fig_list'])>0, has_changes_to_df, attempt['image_fig_list'], self.df_list,
+                            attempt['response'], attempt['code_list'], attempt['code_list_plot_with_add_on'],
+                            attempt['code_list_datachange_with_add_on']))
+
+        if self.data_version != snapshot_version:
+            self.create_model(use_openai_llm = True, seed = 0)
+        elapsed = time.perf_counter() - start_time
+        stats = {
+            'questions': len(questions),
+            'concurrency': concurrency,
+            'elapsed_seconds': elapsed,
+            'questions_per_second': len(questions) / elapsed if elapsed > 0 else 0.0,
+            'rerun_in_order': rerun_count,
+            'failed': failed_count,
+            'failed_attempts': len(failed_attempts),
+        }
+        logger.info(f"Answered {stats['questions']} questions in {elapsed:.2f}s ({stats['questions_per_second']:.2f} questions/s).")
+        return results, stats
+
     def clean_data_without_ai(self):
-        df_clean_without_ai, summary_without_ai = clean_dataframe(df = self.df_list)
+        if isinstance(self._df_list, list):
+            # Each frame is cleaned on its own; the summary has one section per frame
+            results = [clean_dataframe(df = df, workers = config['CLEAN_WORKERS'], parallel_backend = config['CLEAN_PARALLEL_BACKEND'],
+                                       backend = config['CLEAN_BACKEND'], compact = config['CLEAN_COMPACT'])
+                       for df in self._df_list]
+            self.df_list = [df_clean for df_clean, _ in results]
+            summary_without_ai = "\n\n".join(f"df{i + 1}:\n{summary}" for i, (_, summary) in enumerate(results))
+            return summary_without_ai, self.df_list
+        df_clean_without_ai, summary_without_ai = clean_dataframe(df = self._df_list, workers = config['CLEAN_WORKERS'],
+                                                                  parallel_backend = config['CLEAN_PARALLEL_BACKEND'],
+                                                                  backend = config['CLEAN_BACKEND'], compact = config['CLEAN_COMPACT'])
         self.df_list = df_clean_without_ai
-        return summary_without_ai, df_clean_without_ai
+        return summary_without_ai, self.df_list
 
     def clean_data_with_ai(self):
         # data_before_ai = self.df_list
         # self.df_list = data_before_ai
         # new_prompt, _ = self.create_model(use_openai_llm = True, seed = 0)
         # print(new_prompt)
+        if isinstance(self._df_list, list):
+            # One question per frame, so each update only touches the frame it cleans
+            answers = []
+            has_changes_to_df = False
+            for i in range(len(self._df_list)):
+                answer, has_plots, frame_changed, image_fig_list, df_new, response, code_list, code_list_plot_with_add_on, code_list_datachange_with_add_on = self.run_model(question = self.prompt_clean_frame(i))
+                answers.append(f"df{i + 1}:\n{answer}")
+                has_changes_to_df = has_changes_to_df or frame_changed
+            return "\n\n".join(answers), has_changes_to_df, self.df_list
         answer, has_plots, has_changes_to_df, image_fig_list, df_new, response, code_list, code_list_plot_with_add_on, code_list_datachange_with_add_on = self.run_model(question = self.prompt_clean_data)
         return answer, has_changes_to_df, df_new
 
+    def prompt_clean_frame(self, i):
+        return f"Only clean dataframe df{i + 1}, starting from df_update = copy.deepcopy(df{i + 1}).\n{self.prompt_clean_data}"
+
     def clean_data(self):
         summary = ""
         summary_without_ai, df_clean_without_ai = self.clean_data_without_ai()
@@ -159,7 +897,9 @@ class SmartData:
         _, final_summary = self.create_data_clean_summary(summary)
         return final_summary, has_changes_to_df, self.df_list
 
-    def create_data_clean_summary(self, result):
+    def create_data_clean_summary_chain(self):
+        from langchain.prompts import PromptTemplate
+        from langchain_core.output_parsers import StrOutputParser
         human_template = config['PROMPT_CREATE_DATA_CLEAN_SUMMARY']
         prompt_template_list = [human_template]
         prompt_template= '\n\n'.join(prompt_template_list)
@@ -167,18 +907,152 @@ class SmartData:
         summary_prompt = PromptTemplate(template = prompt_template,input_variables = ['result'])
         message = summary_prompt
     
-        summary_model = ChatOpenAI(temperature=config['TEMP_CHAT'],model=config['CHAT_MODEL'], seed = 0)
+        summary_model = get_shared_llm(config['CHAT_MODEL'], config['TEMP_CHAT'])
         
         chain = summary_prompt | summary_model | StrOutputParser()
+        return message, chain
+
+    def create_data_clean_summary(self, result):
+        message, chain = self.create_data_clean_summary_chain()
         answer = chain.invoke({"result": result,
                             })
         return message, answer
+
+    # Async API -------------------------------------------------------------------------------------------------------------------------------------------
+    # LLM calls are awaited; profiling, exec of generated code and frame copies run in the default executor.
+    # A SmartData instance holds one session, so do not run two of these calls on the same instance at once.
+
+    async def arun_model(self, question, hedged_attempts = None):
+        loop = asyncio.get_running_loop()
+        hedged_attempts = config['HEDGED_ATTEMPTS'] if hedged_attempts is None else hedged_attempts
+        with self.tracer.trace('run_model', question_chars = len(question), hedged_attempts = hedged_attempts, **self.data_size()) as trace:
+            if hedged_attempts > 1:
+                result = await loop.run_in_executor(None, tracing.in_context(self.run_model_hedged), question, hedged_attempts)
+            else:
+                result = await self.arun_model_attempts(question)
+        self.last_trace = trace
+        return TracedResult(result, trace)
+
+    async def arun_model_attempts(self, question, emit = None):
+        # Work handed to the executor is bound to the current span, so its spans nest under this trace
+        loop = asyncio.get_running_loop()
+        emit = discard_event if emit is None else emit
+        for i in range(config['MAX_ATTEMPTS']):
+            prompt, _ = await loop.run_in_executor(None, tracing.in_context(functools.partial(self.create_model, use_openai_llm = True, seed = i)))
+            try:
+                with tracing.span('attempt', retry = i, seed = i):
+                    emit(StreamEvent('attempt', retry = i))
+                    self.image_fig_list.clear()
+                    self.df_change.clear()
+                    chat_model = self.model
+                    code_list = []
+                    code_list_plot_wo_add_on = []
+                    code_list_plot_with_add_on = []
+                    code_list_datachange_with_add_on = []
+                    has_plots = False
+                    has_changes_to_df = False
+
+                    question_with_history = self.get_question_with_history(question)
+
+                    response = await self.ainvoke_agent(chat_model, question_with_history, self.seed, self.llm_config(emit))
+                    answer = response['output']
+                    code_list = self.extract_code_from_response(response)
+
+                    with tracing.span('execute_code', code_blocks = len(code_list)):
+                        code_list_plot_wo_add_on, code_list_plot_with_add_on, code_list_datachange_with_add_on = await loop.run_in_executor(
+                            None, tracing.in_context(self.execute_generated_code), code_list, self._df_list, self.image_fig_list, self.df_change,
+                            self.repl_artifacts(chat_model))
+                    has_plots = len(self.image_fig_list)>0
+                    for index, figure in enumerate(self.image_fig_list):
+                        emit(StreamEvent('figure', index = index, figure = figure))
+                    if len(self.df_change)>0:
+                        has_changes_to_df = await loop.run_in_executor(None, tracing.in_context(self.apply_data_change), self.df_change)
+                        if has_changes_to_df:
+                            emit(StreamEvent('data_changed', df = self.df_list, data_version = self.data_version))
+                        await loop.run_in_executor(None, tracing.in_context(functools.partial(self.create_model, use_openai_llm = True, seed = i)))
+
+                    # Store the chat history
+                    self.remember_conversation(question, answer,code_list,code_list_plot_wo_add_on)
+                    if self.is_stopped_answer(answer):
+                        tracing.annotate(stopped = True)
+                        # Tokens streamed for this attempt are not the answer
+                        emit(StreamEvent('retry', retry = i, answer = answer))
+                        answer = config['AGENT_STOP_ANSWER']
+                    else:
+                        break
+            except Exception:
+                    logger.warning(f"Attempt with seed {i} failed.", exc_info = True)
+
+        return answer, has_plots, has_changes_to_df, self.image_fig_list, self.df_list, response, code_list, code_list_plot_with_add_on, code_list_datachange_with_add_on
+
+    async def astream_model(self, question):
+        """Async iterator version of stream_model; the attempts run as a task on the running event loop."""
+        loop = asyncio.get_running_loop()
+        events = asyncio.Queue()
+        finished = object()
+        # Tool callbacks and executor work may run on other threads; events still reach the queue in order
+        def emit(event):
+            loop.call_soon_threadsafe(events.put_nowait, event)
+
+        async def produce():
+            try:
+                with self.tracer.trace('run_model', question_chars = len(question), hedged_attempts = 1, streamed = True, **self.data_size()) as trace:
+                    result = await self.arun_model_attempts(question, emit)
+                self.last_trace = trace
+                result = TracedResult(result, trace)
+                emit(StreamEvent('result', answer = result[0], result = result))
+            finally:
+                emit(finished)
+
+        task = asyncio.ensure_future(produce())
+        try:
+            while True:
+                event = await events.get()
+                if event is finished:
+                    break
+                yield event
+            await task
+        finally:
+            # A consumer that stops early cancels the run
+            if not task.done():
+                task.cancel()
+
+    async def aclean_data_without_ai(self):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.clean_data_without_ai)
+
+    async def aclean_data_with_ai(self):
+        if isinstance(self._df_list, list):
+            answers = []
+            has_changes_to_df = False
+            for i in range(len(self._df_list)):
+                answer, has_plots, frame_changed, image_fig_list, df_new, response, code_list, code_list_plot_with_add_on, code_list_datachange_with_add_on = await self.arun_model(question = self.prompt_clean_frame(i))
+                answers.append(f"df{i + 1}:\n{answer}")
+                has_changes_to_df = has_changes_to_df or frame_changed
+            return "\n\n".join(answers), has_changes_to_df, self.df_list
+        answer, has_plots, has_changes_to_df, image_fig_list, df_new, response, code_list, code_list_plot_with_add_on, code_list_datachange_with_add_on = await self.arun_model(question = self.prompt_clean_data)
+        return answer, has_changes_to_df, df_new
+
+    async def aclean_data(self):
+        summary_without_ai, df_clean_without_ai = await self.aclean_data_without_ai()
+        answer, has_changes_to_df, df_new = await self.aclean_data_with_ai()
+        summary = summary_without_ai + answer
+        _, final_summary = await self.acreate_data_clean_summary(summary)
+        return final_summary, has_changes_to_df, self.df_list
+
+    async def acreate_data_clean_summary(self, result):
+        message, chain = self.create_data_clean_summary_chain()
+        answer = await chain.ainvoke({"result": result,
+                                   })
+        return message, answer
     
     def remember_conversation(self, question, answer,code_list, code_list_plot_wo_add_on):
-        self.memory.remember(key = self.message_count, role = 'Human', value = question)
-        self.memory.remember(key = self.message_count, role = 'AI', value = answer)
-        # self.memory.remember(key = self.message_count, role = 'All Codes', value = code_list)
-        self.memory.remember(key = self.message_count, role = 'Plot Code Generate By AI', value = code_list_plot_wo_add_on)
+        with tracing.span('remember'):
+            self.memory.remember(key = self.message_count, role = 'Human', value = question)
+            self.memory.remember(key = self.message_count, role = 'AI', value = answer)
+            # self.memory.remember(key = self.message_count, role = 'All Codes', value = code_list)
+            self.memory.remember(key = self.message_count, role = 'Plot Code Generate By AI', value = code_list_plot_wo_add_on)
+            self.memory.flush()
         self.message_count = self.message_count + 1
 
     def recall_all_conversation(self):
@@ -207,15 +1081,13 @@ class SmartData:
             code_list = []
         return code_list
 
+    def select_code(self, string_list, substring_list):
+        # Code with all required substrings, without duplicates
+        return list(dict.fromkeys(s for s in string_list if all(substring in s for substring in substring_list)))
+
     def process_with_plot_code(self, string_list):
         # Filter only the code with all required plot substrings
-        code_list_plot_wo_add_on = [
-            s for s in string_list 
-            if all(substring in s for substring in self.check_plot_substring_list)
-        ]
-        
-        # Make sure no duplicates
-        code_list_plot_wo_add_on = list(dict.fromkeys(code_list_plot_wo_add_on))
+        code_list_plot_wo_add_on = self.select_code(string_list, self.check_plot_substring_list)
     
         # Add in the import library if they are missing from the plot to make it produce figs
         for i in range(len(code_list_plot_wo_add_on)):
@@ -241,13 +1113,7 @@ class SmartData:
 
     def process_with_datachange_code(self, string_list):
         # Filter only the code with all required plot substrings
-        code_list_datachange_wo_add_on = [
-            s for s in string_list 
-            if all(substring in s for substring in self.check_datachange_substring_list)
-        ]
-        
-        # Make sure no duplicates
-        code_list_datachange_wo_add_on = list(dict.fromkeys(code_list_datachange_wo_add_on))
+        code_list_datachange_wo_add_on = self.select_code(string_list, self.check_datachange_substring_list)
     
         # Add in the import library if they are missing
         for i in range(len(code_list_datachange_wo_add_on)):
@@ -0,0 +1,279 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import numpy as np
+
+from . import tracing
+from .backends import describe
+from .config import Config
+
+def _col_value_counts(df, scale=1):
+    # Boolean and datetime columns are counted as strings
+    # boolean_and_datetime_columns = df.select_dtypes(include=['boolean', 'datetime64[ns]', 'datetime64[ns, UTC]', 'timedelta64[ns]', 'Interval']).columns
+    boolean_and_datetime_columns = set(df.select_dtypes(include=['boolean', 'datetime64', 'Interval']).columns)
+    categorical_columns = set(df.select_dtypes(include=['object', 'category', 'string']).columns)
+
+    # Get the top 10 value counts for each categorical column, converting only the columns that need it
+    top_10_values = {}
+    for col in df.columns:
+        if col in boolean_and_datetime_columns:
+            counts = df[col].astype(str).value_counts(dropna=False).head(10)
+        elif col in categorical_columns:
+            counts = df[col].value_counts(dropna=False).head(10)
+        else:
+            continue
+        if scale != 1:
+            # Counts taken on a sample are scaled up to the full row count
+            counts = (counts * scale).round().astype(int)
+        top_10_values[col] = counts.to_dict()
+
+    return top_10_values
+
+def _get_df_col_value_counts(df, scale=1):
+    return str(_col_value_counts(df, scale))
+
+def _describe(df, backend):
+    df_describe = None if backend == 'pandas' else describe(df, backend)
+    return df.describe() if df_describe is None else df_describe
+
+def _scale_counts(df_describe, scale):
+    if scale == 1:
+        return df_describe
+    for row in ['count', 'freq']:
+        if row in df_describe.index:
+            df_describe.loc[row] = (df_describe.loc[row].astype(float) * scale).round()
+    return df_describe
+
+def _approximate_note(sample_size, rows, error, confidence):
+    return (f"\n(Approximate: estimated from a random sample of {sample_size} of {rows} rows, "
+            f"counts scaled to the full data, quantiles and shares within {error:.0%} with {confidence:.0%} confidence, "
+            f"min/max are sample extremes.)")
+
+def _sample_positions(rows, sample_size, seed=0):
+    rng = np.random.default_rng(seed)
+    return np.sort(rng.choice(rows, size=sample_size, replace=False))
+
+def build_df_profile(df, number_of_head_rows=5, backend=Config.PROFILE_BACKEND):
+    """Compute the dataframe sections that go into the agent prompt."""
+    return {
+        'df_head': str(df.head(number_of_head_rows).to_markdown()),
+        'df_describe': str(_describe(df, backend).to_markdown()),
+        'df_dtypes': str(df.dtypes.to_markdown()),
+        'df_col_unique_value_counts': _get_df_col_value_counts(df),
+    }
+
+def profile_sample_size(error=Config.PROFILE_APPROX_ERROR, confidence=Config.PROFILE_APPROX_CONFIDENCE):
+    """Sample rows needed for quantiles and value frequencies within `error` with probability `confidence`.
+
+    Uses the Dvoretzky-Kiefer-Wolfowitz bound, which does not depend on the number of rows.
+    """
+    return int(np.ceil(np.log(2 / (1 - confidence)) / (2 * error ** 2)))
+
+def build_approximate_df_profile(df, number_of_head_rows=5, error=Config.PROFILE_APPROX_ERROR,
+                                 confidence=Config.PROFILE_APPROX_CONFIDENCE, seed=0, backend=Config.PROFILE_BACKEND):
+    """Profile built from a uniform row sample, so its cost stays flat as the frame grows."""
+    sample_size = profile_sample_size(error, confidence)
+    if sample_size >= len(df):
+        return build_df_profile(df, number_of_head_rows, backend)
+
+    sample = df.take(_sample_positions(len(df), sample_size, seed))
+    scale = len(df) / sample_size
+
+    df_describe = _scale_counts(_describe(sample, backend), scale)
+    note = _approximate_note(sample_size, len(df), error, confidence)
+    return {
+        'df_head': str(df.head(number_of_head_rows).to_markdown()),
+        'df_describe': str(df_describe.to_markdown()) + note,
+        'df_dtypes': str(df.dtypes.to_markdown()),
+        'df_col_unique_value_counts': _get_df_col_value_counts(sample, scale) + note,
+    }
+
+def _column_fragments(df, scale=1, backend=Config.PROFILE_BACKEND):
+    """The per-column parts of the profile of each column of df: describe statistics and top value counts."""
+    # describe covers numeric and datetime columns, unless a frame has none; each kind is described in one
+    # call, which gives every column the same statistics as describing it alone
+    stats = {}
+    for kind in [np.number, 'datetime']:
+        frame = df.select_dtypes(include=[kind])
+        if len(frame.columns) > 0:
+            df_describe = _scale_counts(_describe(frame, backend), scale)
+            stats.update((col, df_describe[col]) for col in df_describe.columns)
+    value_counts = _col_value_counts(df, scale)
+    return [{'describe': stats.get(col), 'value_counts': value_counts.get(col)} for col in df.columns]
+
+def _assemble_describe(df, fragments):
+    # Rows and columns in the order df.describe() gives them
+    described = [(name, fragment['describe']) for name, fragment in zip(df.columns, fragments) if fragment['describe'] is not None]
+    names = []
+    for index in sorted((stats.index for _, stats in described), key=len):
+        for name in index:
+            if name not in names:
+                names.append(name)
+    df_describe = pd.concat([stats.reindex(names) for _, stats in described], axis=1, sort=False)
+    df_describe.columns = pd.Index([name for name, _ in described])
+    return df_describe
+
+def build_column_profile(df, column_keys, number_of_head_rows=5, approximate=False, cache=None,
+                         error=Config.PROFILE_APPROX_ERROR, confidence=Config.PROFILE_APPROX_CONFIDENCE, seed=0,
+                         backend=Config.PROFILE_BACKEND):
+    """Profile of df assembled from per-column fragments, profiling only the columns whose key is not cached.
+
+    column_keys holds one key per column that changes whenever the column or the index changes, such as
+    the keys of FrameStore.column_keys. The result is the same as build_df_profile or build_approximate_df_profile.
+    """
+    cache = COLUMN_PROFILE_CACHE if cache is None else cache
+    sample_size = profile_sample_size(error, confidence)
+    approximate = approximate and sample_size < len(df)
+    scale = len(df) / sample_size if approximate else 1
+    fragment_keys = [(key, approximate, backend) for key in column_keys]
+    fragments = [cache.get(key) for key in fragment_keys]
+    missing = [i for i, fragment in enumerate(fragments) if fragment is None]
+    span = tracing.current_span()
+    if span is not None:
+        span.add(columns_profiled=len(missing), columns_reused=len(fragments) - len(missing))
+
+    positions = _sample_positions(len(df), sample_size, seed) if approximate else None
+    if missing:
+        frame = df.iloc[:, missing]
+        if approximate:
+            frame = frame.take(positions)
+        for i, fragment in zip(missing, _column_fragments(frame, scale, backend)):
+            fragments[i] = fragment
+            cache.put(fragment_keys[i], fragment)
+
+    if any(fragment['describe'] is not None for fragment in fragments):
+        df_describe = _assemble_describe(df, fragments)
+    else:
+        # Without numeric or datetime columns every column is described together
+        df_describe = _scale_counts(_describe(df.take(positions) if approximate else df, backend), scale)
+    value_counts = str({name: fragment['value_counts'] for name, fragment in zip(df.columns, fragments)
+                        if fragment['value_counts'] is not None})
+    note = _approximate_note(sample_size, len(df), error, confidence) if approximate else ''
+    return {
+        'df_head': str(df.head(number_of_head_rows).to_markdown()),
+        'df_describe': str(df_describe.to_markdown()) + note,
+        'df_dtypes': str(df.dtypes.to_markdown()),
+        'df_col_unique_value_counts': value_counts + note,
+    }
+
+def dataframe_fingerprint(df):
+    """Content fingerprint of a dataframe built from one hash per column, or None if a column cannot be hashed."""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr((df.shape, list(df.columns), [str(dtype) for dtype in df.dtypes])).encode())
+    try:
+        digest.update(pd.util.hash_pandas_object(df.index).to_numpy().tobytes())
+        for col in range(df.shape[1]):
+            digest.update(pd.util.hash_pandas_object(df.iloc[:, col], index=False).to_numpy().tobytes())
+    except TypeError:
+        # Unhashable cell values such as lists
+        return None
+    return digest.hexdigest()
+
+class ProfileCache:
+    """Bounded LRU cache of dataframe profiles with hit/miss counters."""
+    def __init__(self, max_size=Config.PROFILE_CACHE_SIZE):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self.entries),
+                'max_size': self.max_size,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+PROFILE_CACHE = ProfileCache()
+# Per-column profile fragments, so a frame with a few changed columns only profiles those
+COLUMN_PROFILE_CACHE = ProfileCache(Config.PROFILE_COLUMN_CACHE_SIZE)
+
+def _profile_cache_key(df, number_of_head_rows, key, approximate, backend):
+    if approximate is None:
+        approximate = len(df) > Config.PROFILE_APPROX_ROW_THRESHOLD
+    if key is None:
+        key = dataframe_fingerprint(df)
+    return approximate, (None if key is None else (key, number_of_head_rows, approximate, backend))
+
+def get_df_profile(df, number_of_head_rows=5, cache=None, key=None, approximate=None, column_keys=None,
+                   backend=Config.PROFILE_BACKEND):
+    """Return the prompt profile of df, computing it only if the cache has no entry for the key.
+
+    key identifies the data version (e.g. a version counter kept by the caller); by default the
+    content fingerprint of df is used. approximate=None switches to the sampled profile for frames
+    above PROFILE_APPROX_ROW_THRESHOLD rows. With column_keys, one key per column, a new version
+    only profiles the columns whose key is new. backend computes describe, as in PROFILE_BACKEND.
+    """
+    return get_df_profiles([df], number_of_head_rows, cache, [key], approximate, workers=1, column_keys=[column_keys],
+                           backend=backend)[0]
+
+def get_df_profiles(dfs, number_of_head_rows=5, cache=None, keys=None, approximate=None, workers=Config.PROFILE_WORKERS,
+                    column_keys=None, backend=Config.PROFILE_BACKEND):
+    """Prompt profiles of several frames; those missing from the cache are computed in parallel.
+
+    keys holds one data-version key per frame, so a frame is only profiled again after it changes.
+    column_keys holds one list of column keys (or None) per frame for incremental profiling.
+    """
+    cache = PROFILE_CACHE if cache is None else cache
+    keys = [None] * len(dfs) if keys is None else keys
+    column_keys = [None] * len(dfs) if column_keys is None else column_keys
+    entries = [_profile_cache_key(df, number_of_head_rows, key, approximate, backend) for df, key in zip(dfs, keys)]
+    profiles = [None if cache_key is None else cache.get(cache_key) for _, cache_key in entries]
+    missing = [i for i, profile in enumerate(profiles) if profile is None]
+
+    def build(i):
+        frame_approximate, cache_key = entries[i]
+        if column_keys[i] is not None and dfs[i].columns.is_unique:
+            profile = build_column_profile(dfs[i], column_keys[i], number_of_head_rows, frame_approximate, backend=backend)
+        elif frame_approximate:
+            profile = build_approximate_df_profile(dfs[i], number_of_head_rows, backend=backend)
+        else:
+            profile = build_df_profile(dfs[i], number_of_head_rows, backend)
+        if cache_key is not None:
+            cache.put(cache_key, profile)
+        return profile
+
+    if len(missing) == 0:
+        return profiles
+    with tracing.span('profile', frames=len(missing), rows=sum(len(dfs[i]) for i in missing)):
+        if len(missing) > 1 and workers > 1:
+            with ThreadPoolExecutor(max_workers=min(workers, len(missing))) as pool:
+                # Each frame is built in its own copy of the context, nested under the profile span
+                futures = [pool.submit(tracing.in_context(build), i) for i in missing]
+                for i, future in zip(missing, futures):
+                    profiles[i] = future.result()
+        else:
+            for i in missing:
+                profiles[i] = build(i)
+    return profiles
@@ -0,0 +1,119 @@
+import atexit
+import base64
+import io
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from .config import Config
+
+# pyplot's figure manager is global state and not thread-safe
+PYPLOT_LOCK = threading.Lock()
+
+MEDIA_TYPES = {'png': 'image/png', 'svg': 'image/svg+xml'}
+
+def close_figure(fig):
+    """Remove a figure from pyplot's figure manager; the Figure object itself can still be drawn."""
+    import matplotlib.pyplot as plt
+    with PYPLOT_LOCK:
+        plt.close(fig)
+
+def _render_figure(fig, format, dpi):
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    # A closed figure may still hold a GUI canvas; drawing goes through a plain Agg canvas instead
+    FigureCanvasAgg(fig)
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format=format, dpi=dpi)
+    return buffer.getvalue()
+
+class ImageHandle:
+    """A figure rendered in the background, holding only its encoded bytes once rendering finishes."""
+    def __init__(self, future, format, dpi):
+        self.id = uuid.uuid4().hex
+        self.format = format
+        self.dpi = dpi
+        self.media_type = MEDIA_TYPES[format]
+        self._future = future
+        self._data = None
+        self.released = False
+
+    def done(self):
+        return self._data is not None or (self._future is not None and self._future.done())
+
+    @property
+    def data(self):
+        """Encoded image bytes; waits for rendering to finish."""
+        if self.released:
+            raise ValueError(f"Image {self.id} was released.")
+        if self._data is None:
+            self._data = self._future.result()
+            self._future = None
+        return self._data
+
+    @property
+    def nbytes(self):
+        return 0 if self.released or not self.done() else len(self.data)
+
+    def base64(self):
+        return base64.b64encode(self.data).decode('ascii')
+
+    def data_uri(self):
+        return f"data:{self.media_type};base64,{self.base64()}"
+
+    def save(self, path):
+        with open(path, 'wb') as file:
+            file.write(self.data)
+
+    def release(self):
+        """Drop the rendered bytes; the handle can no longer be read."""
+        self.released = True
+        self._future = None
+        self._data = None
+
+    def __getstate__(self):
+        # Pickled with its bytes, once rendering has finished
+        state = dict(self.__dict__)
+        state['_data'] = None if self.released else self.data
+        state['_future'] = None
+        return state
+
+    def _repr_png_(self):
+        return self.data if self.format == 'png' and not self.released else None
+
+    def _repr_svg_(self):
+        return self.data.decode('utf-8') if self.format == 'svg' and not self.released else None
+
+    def __repr__(self):
+        state = 'released' if self.released else ('rendered' if self.done() else 'pending')
+        return f"ImageHandle(id={self.id!r}, format={self.format!r}, {state})"
+
+class FigureRenderer:
+    """Thread pool that renders matplotlib figures to PNG or SVG bytes off the caller's thread."""
+    def __init__(self, workers=Config.RENDER_WORKERS, format=Config.RENDER_FORMAT, dpi=Config.RENDER_DPI):
+        if format not in MEDIA_TYPES:
+            raise ValueError(f"Unknown render format {format!r}; use 'png' or 'svg'.")
+        self.format = format
+        self.dpi = dpi
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='smartdata-render')
+
+    def render(self, fig, format=None, dpi=None):
+        """Close fig in pyplot right away and return a handle to its rendered bytes."""
+        format = self.format if format is None else format
+        dpi = self.dpi if dpi is None else dpi
+        close_figure(fig)
+        return ImageHandle(self.executor.submit(_render_figure, fig, format, dpi), format, dpi)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+_FIGURE_RENDERER = None
+_FIGURE_RENDERER_LOCK = threading.Lock()
+
+def get_figure_renderer():
+    """Process-wide renderer built from Config on first use."""
+    global _FIGURE_RENDERER
+    with _FIGURE_RENDERER_LOCK:
+        if _FIGURE_RENDERER is None:
+            _FIGURE_RENDERER = FigureRenderer()
+            atexit.register(_FIGURE_RENDERER.close)
+        return _FIGURE_RENDERER
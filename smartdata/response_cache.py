@@ -0,0 +1,157 @@
+import functools
+import hashlib
+import json
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from .config import Config
+
+def prompt_text(prompt):
+    """Stable text of an agent prompt, including the dataframe sections filled in as partial variables."""
+    if prompt is None:
+        return None
+    return json.dumps(prompt.to_json(), sort_keys=True, default=str)
+
+def model_identifier(llm):
+    # Configurable wrappers keep the underlying chat model in `default`
+    bound = getattr(llm, 'default', llm)
+    return repr((type(bound).__name__, getattr(bound, 'model_name', None), getattr(bound, 'temperature', None)))
+
+def response_cache_key(system_prompt, question_with_history, data_fingerprint, seed, model):
+    payload = json.dumps([system_prompt, question_with_history, data_fingerprint, seed, model], default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+class ResponseCache:
+    """Agent responses (output and intermediate_steps) stored pickled, with TTL, a size bound and hit counters."""
+    def __init__(self, max_size=Config.RESPONSE_CACHE_SIZE, ttl=Config.RESPONSE_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            blob = self._get(key, time.time())
+            if blob is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return pickle.loads(blob)
+
+    def put(self, key, response):
+        """Store a response; returns False if it holds objects that cannot be pickled."""
+        try:
+            blob = pickle.dumps(response)
+        except Exception:
+            return False
+        now = time.time()
+        with self.lock:
+            self._put(key, blob, now, now + self.ttl if self.ttl is not None else None)
+        return True
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'size': self._size(),
+                'max_size': self.max_size,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+class MemoryResponseCache(ResponseCache):
+    """In-process LRU backend."""
+    def __init__(self, max_size=Config.RESPONSE_CACHE_SIZE, ttl=Config.RESPONSE_CACHE_TTL):
+        super().__init__(max_size, ttl)
+        self.entries = OrderedDict()
+
+    def _get(self, key, now):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        blob, expires = entry
+        if expires is not None and expires < now:
+            del self.entries[key]
+            self.expirations += 1
+            return None
+        self.entries.move_to_end(key)
+        return blob
+
+    def _put(self, key, blob, now, expires):
+        self.entries[key] = (blob, expires)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def _size(self):
+        return len(self.entries)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+class SQLiteResponseCache(ResponseCache):
+    """On-disk backend that survives restarts and can be shared by processes on one machine."""
+    def __init__(self, path=Config.RESPONSE_CACHE_PATH, max_size=Config.RESPONSE_CACHE_SIZE, ttl=Config.RESPONSE_CACHE_TTL):
+        super().__init__(max_size, ttl)
+        self.path = path
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS responses "
+                                    "(key TEXT PRIMARY KEY, value BLOB, expires REAL, last_access REAL)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+
+    def _get(self, key, now):
+        row = self.connection.execute("SELECT value, expires FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        blob, expires = row
+        with self.connection:
+            if expires is not None and expires < now:
+                self.connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.expirations += 1
+                return None
+            self.connection.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+        return blob
+
+    def _put(self, key, blob, now, expires):
+        with self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO responses (key, value, expires, last_access) VALUES (?, ?, ?, ?)",
+                                    (key, blob, expires, now))
+            self.expirations += self.connection.execute("DELETE FROM responses WHERE expires < ?", (now,)).rowcount
+            overflow = self._size() - self.max_size
+            if overflow > 0:
+                # Least recently used entries go first
+                self.evictions += self.connection.execute(
+                    "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY last_access LIMIT ?)",
+                    (overflow,)).rowcount
+
+    def _size(self):
+        return self.connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def clear(self):
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM responses")
+
+@functools.lru_cache(maxsize=None)
+def create_response_cache(backend=Config.RESPONSE_CACHE, path=Config.RESPONSE_CACHE_PATH,
+                          max_size=Config.RESPONSE_CACHE_SIZE, ttl=Config.RESPONSE_CACHE_TTL):
+    """Process-wide cache for a backend ('memory' or 'sqlite'), so every session shares it; None disables caching."""
+    if backend is None:
+        return None
+    if backend == 'memory':
+        return MemoryResponseCache(max_size=max_size, ttl=ttl)
+    if backend == 'sqlite':
+        return SQLiteResponseCache(path=path, max_size=max_size, ttl=ttl)
+    raise ValueError(f"Unknown response cache backend {backend!r}; use 'memory', 'sqlite' or None.")
@@ -0,0 +1,357 @@
+import ast
+import atexit
+import gc
+import io
+import multiprocessing
+import pickle
+import threading
+import time
+import weakref
+import zlib
+from collections import OrderedDict
+from contextlib import redirect_stdout
+from multiprocessing import shared_memory
+
+from .config import Config
+
+SANDBOX_PRELOAD_MODULES = ['pandas', 'numpy', 'matplotlib', 'matplotlib.pyplot', 'pyarrow', __name__]
+SANDBOX_ARTIFACT_NAMES = ('fig', 'ax', 'df_update')
+
+class SandboxError(Exception):
+    pass
+
+class SandboxTimeoutError(SandboxError):
+    pass
+
+class SandboxCancelledError(SandboxError):
+    pass
+
+class SandboxWorkerError(SandboxError):
+    pass
+
+def _frame_to_shared_memory(df):
+    """Write df into a new shared memory segment as an Arrow IPC stream, or pickled if Arrow cannot hold it."""
+    import pyarrow as pa
+    try:
+        table = pa.Table.from_pandas(df)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+        table = None
+    if table is None:
+        payload = pickle.dumps(df, protocol=pickle.HIGHEST_PROTOCOL)
+        segment = shared_memory.SharedMemory(create=True, size=max(len(payload), 1))
+        segment.buf[:len(payload)] = payload
+        return segment, ('pickle', segment.name, len(payload))
+
+    sink = pa.MockOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    size = sink.size()
+    segment = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    buffer = pa.py_buffer(segment.buf)
+    stream = pa.FixedSizeBufferWriter(buffer)
+    with pa.ipc.new_stream(stream, table.schema) as writer:
+        writer.write_table(table)
+    stream.close()
+    # The writer and stream export segment.buf, which would stop segment.close()
+    del writer, stream, buffer
+    return segment, ('arrow', segment.name, size)
+
+def _frame_from_shared_memory(segment, handle, zero_copy):
+    """Read a frame written by _frame_to_shared_memory; with zero_copy the frame may keep pointing at the segment."""
+    kind, _, size = handle
+    if kind == 'pickle':
+        return pickle.loads(segment.buf[:size])
+    import pandas as pd
+    import pyarrow as pa
+    data = pa.py_buffer(segment.buf[:size]) if zero_copy else pa.py_buffer(bytes(segment.buf[:size]))
+    table = pa.ipc.open_stream(data).read_all()
+    df = table.to_pandas(split_blocks=zero_copy)
+    # Arrow string columns (e.g. from compact_dataframe) would come back as StringDtype, so restore their dtype
+    metadata = table.schema.pandas_metadata or {}
+    for column in metadata.get('columns', []):
+        if column['numpy_type'] == 'string[pyarrow]' and column['name'] in df.columns:
+            df[column['name']] = df[column['name']].astype(pd.ArrowDtype(pa.string()))
+    return df
+
+def _apply_memory_limit(memory_limit):
+    if memory_limit is None:
+        return
+    try:
+        import resource
+    except ImportError:
+        # No rlimits on this platform
+        return
+    resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+
+def _run_code(code, namespace_globals, namespace_locals):
+    # Same evaluation as PythonAstREPLTool: exec everything but the last statement, then eval it if possible
+    tree = ast.parse(code)
+    exec(ast.unparse(ast.Module(tree.body[:-1], type_ignores=[])), namespace_globals, namespace_locals)
+    module_end_str = ast.unparse(ast.Module(tree.body[-1:], type_ignores=[]))
+    io_buffer = io.StringIO()
+    try:
+        with redirect_stdout(io_buffer):
+            ret = eval(module_end_str, namespace_globals, namespace_locals)
+        return io_buffer.getvalue() if ret is None else str(ret)
+    except Exception:
+        with redirect_stdout(io_buffer):
+            exec(module_end_str, namespace_globals, namespace_locals)
+        return io_buffer.getvalue()
+
+def _worker_main(connection, memory_limit, max_cached):
+    """Sandbox worker loop: runs one code snippet at a time and keeps a namespace per session."""
+    _apply_memory_limit(memory_limit)
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    frames = OrderedDict()
+    namespaces = OrderedDict()
+    retired_segments = []
+
+    def close_retired_segments():
+        for segment in list(retired_segments):
+            try:
+                segment.close()
+                retired_segments.remove(segment)
+            except BufferError:
+                # A namespace still holds a frame backed by this segment
+                pass
+
+    def load_frame(handle):
+        name = handle[1]
+        if name not in frames:
+            # Workers share the parent's resource tracker, so attaching does not change who unlinks the segment
+            segment = shared_memory.SharedMemory(name=name)
+            frames[name] = (segment, _frame_from_shared_memory(segment, handle, zero_copy=True))
+            while len(frames) > max_cached:
+                _, (old_segment, _) = frames.popitem(last=False)
+                retired_segments.append(old_segment)
+            close_retired_segments()
+        frames.move_to_end(name)
+        return frames[name][1]
+
+    while True:
+        try:
+            message = connection.recv()
+        except EOFError:
+            break
+        if message is None:
+            break
+        session_id, frame_handles, code = message
+
+        if session_id not in namespaces:
+            namespaces[session_id] = ({}, {})
+            while len(namespaces) > max_cached:
+                namespaces.popitem(last=False)
+        namespaces.move_to_end(session_id)
+        namespace_globals, namespace_locals = namespaces[session_id]
+
+        result = {'output': '', 'error': False, 'figure': None, 'df_update': None}
+        try:
+            for variable, handle in frame_handles.items():
+                namespace_locals[variable] = load_frame(handle)
+            before = {name: namespace_locals.get(name) for name in SANDBOX_ARTIFACT_NAMES}
+            result['output'] = _run_code(code, namespace_globals, namespace_locals)
+
+            fig = namespace_locals.get('fig')
+            if fig is not None and fig is not before['fig'] and 'ax' in namespace_locals:
+                # Pickled together so ax still belongs to fig in the parent
+                result['figure'] = pickle.dumps((fig, namespace_locals['ax']))
+                plt.close(fig)
+            df_update = namespace_locals.get('df_update')
+            if df_update is not None and 'df_update' in code:
+                # The parent reads and unlinks the segment
+                segment, handle = _frame_to_shared_memory(df_update)
+                segment.close()
+                result['df_update'] = handle
+        except BaseException as e:
+            result['output'] = "{}: {}".format(type(e).__name__, str(e))
+            result['error'] = True
+        connection.send(result)
+
+    # Frames go before their segments, so closing a segment does not find its buffer still exported
+    namespaces.clear()
+    retired_segments.extend(segment for segment, _ in frames.values())
+    frames.clear()
+    gc.collect()
+    close_retired_segments()
+
+def _multiprocessing_context():
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        # Workers fork from a clean server that has the data libraries imported already
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload(SANDBOX_PRELOAD_MODULES)
+        return context
+    return multiprocessing.get_context('spawn')
+
+class SandboxWorker:
+    def __init__(self, context, memory_limit, max_cached):
+        self.context = context
+        self.memory_limit = memory_limit
+        self.max_cached = max_cached
+        self.lock = threading.Lock()
+        self.process = None
+        self.connection = None
+        self.start()
+
+    def start(self):
+        parent_connection, child_connection = self.context.Pipe()
+        self.process = self.context.Process(target=_worker_main, args=(child_connection, self.memory_limit, self.max_cached),
+                                            daemon=True)
+        self.process.start()
+        child_connection.close()
+        self.connection = parent_connection
+
+    def restart(self):
+        self.stop(kill=True)
+        self.start()
+
+    def stop(self, kill=False):
+        if self.process is None:
+            return
+        if kill:
+            self.process.kill()
+        else:
+            try:
+                self.connection.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        self.process.join(timeout=5)
+        self.connection.close()
+        self.process = None
+
+class SandboxPool:
+    """Warm pool of worker processes that run generated code with a timeout, a memory limit and cancellation.
+
+    Frames are written once into shared memory as Arrow IPC streams and read by the workers without
+    pickling. Each session id is pinned to one worker, which keeps the session's variables between runs.
+    A worker that times out, is cancelled or dies is replaced by a fresh one.
+    """
+    def __init__(self, workers=Config.SANDBOX_WORKERS, timeout=Config.SANDBOX_TIMEOUT,
+                 memory_limit=Config.SANDBOX_MEMORY_LIMIT, max_shared_frames=Config.SANDBOX_MAX_SHARED_FRAMES):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError as e:
+            raise ImportError("`pyarrow` package not found, please install with `pip install pyarrow`") from e
+        self.timeout = timeout
+        self.max_shared_frames = max_shared_frames
+        self.context = _multiprocessing_context()
+        self.workers = [SandboxWorker(self.context, memory_limit, max_shared_frames) for _ in range(workers)]
+        self.shared_frames = OrderedDict()
+        self.cancelled = set()
+        self.lock = threading.Lock()
+        self.closed = False
+
+    def share(self, df):
+        """Shared memory handle of df, written on first use and kept while df is alive."""
+        with self.lock:
+            entry = self.shared_frames.get(id(df))
+            if entry is not None and entry[0]() is df:
+                self.shared_frames.move_to_end(id(df))
+                return entry[2]
+        segment, handle = _frame_to_shared_memory(df)
+        with self.lock:
+            entry = self.shared_frames.get(id(df))
+            if entry is not None and entry[0]() is df:
+                # Another thread shared it meanwhile
+                self._unlink(segment)
+                return entry[2]
+            self.shared_frames[id(df)] = (weakref.ref(df), segment, handle)
+            weakref.finalize(df, self._release, id(df), handle[1])
+            while len(self.shared_frames) > self.max_shared_frames:
+                _, (_, old_segment, _) = self.shared_frames.popitem(last=False)
+                self._unlink(old_segment)
+            return handle
+
+    def _release(self, frame_id, name):
+        with self.lock:
+            entry = self.shared_frames.get(frame_id)
+            if entry is not None and entry[2][1] == name:
+                del self.shared_frames[frame_id]
+                self._unlink(entry[1])
+
+    def _unlink(self, segment):
+        # Workers that already mapped the segment keep their mapping
+        segment.close()
+        segment.unlink()
+
+    def worker_for(self, session_id):
+        return self.workers[zlib.crc32(session_id.encode()) % len(self.workers)]
+
+    def cancel(self, session_id):
+        """Stop the run in progress for session_id; its worker is replaced."""
+        with self.lock:
+            self.cancelled.add(session_id)
+
+    def execute(self, session_id, frames, code, timeout=None, cancel_event=None):
+        """Run code for a session with frames ({variable name: DataFrame}) bound in its namespace.
+
+        Returns a dict with the printed or evaluated 'output', an 'error' flag, and the 'fig', 'ax' and
+        'df_update' objects the code created.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        frame_handles = {variable: self.share(df) for variable, df in frames.items()}
+        worker = self.worker_for(session_id)
+        with worker.lock:
+            with self.lock:
+                self.cancelled.discard(session_id)
+            try:
+                worker.connection.send((session_id, frame_handles, code))
+            except (BrokenPipeError, OSError):
+                worker.restart()
+                worker.connection.send((session_id, frame_handles, code))
+
+            deadline = time.monotonic() + timeout if timeout is not None else None
+            while True:
+                try:
+                    if worker.connection.poll(0.05):
+                        result = worker.connection.recv()
+                        break
+                except (EOFError, OSError):
+                    worker.restart()
+                    raise SandboxWorkerError("The sandbox worker exited while running the code, probably after reaching the memory limit.")
+                if not worker.process.is_alive():
+                    worker.restart()
+                    raise SandboxWorkerError("The sandbox worker exited while running the code, probably after reaching the memory limit.")
+                if deadline is not None and time.monotonic() > deadline:
+                    worker.restart()
+                    raise SandboxTimeoutError(f"The code did not finish within {timeout} seconds.")
+                if session_id in self.cancelled or (cancel_event is not None and cancel_event.is_set()):
+                    worker.restart()
+                    raise SandboxCancelledError("The run was cancelled.")
+
+        captured = {'output': result['output'], 'error': result['error']}
+        if result['figure'] is not None:
+            captured['fig'], captured['ax'] = pickle.loads(result['figure'])
+        if result['df_update'] is not None:
+            segment = shared_memory.SharedMemory(name=result['df_update'][1])
+            try:
+                captured['df_update'] = _frame_from_shared_memory(segment, result['df_update'], zero_copy=False)
+            finally:
+                segment.close()
+                segment.unlink()
+        return captured
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        for worker in self.workers:
+            worker.stop()
+        with self.lock:
+            for _, segment, _ in self.shared_frames.values():
+                self._unlink(segment)
+            self.shared_frames.clear()
+
+_SANDBOX_POOL = None
+_SANDBOX_POOL_LOCK = threading.Lock()
+
+def get_sandbox_pool():
+    """Process-wide sandbox pool built from Config on first use."""
+    global _SANDBOX_POOL
+    with _SANDBOX_POOL_LOCK:
+        if _SANDBOX_POOL is None:
+            _SANDBOX_POOL = SandboxPool()
+            atexit.register(_SANDBOX_POOL.close)
+        return _SANDBOX_POOL
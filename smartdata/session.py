@@ -0,0 +1,264 @@
+import contextlib
+import logging
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import pandas as pd
+
+from .config import Config
+from .memory import Memory
+from .render import ImageHandle
+
+logger = logging.getLogger('SessionManager')
+
+def _write_frame(df, path, spill_format):
+    """Write df as Feather or Parquet, or pickle it if Arrow cannot hold its columns; returns the file written."""
+    import pyarrow as pa
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=True)
+    except (pa.ArrowException, TypeError, ValueError):
+        # Object columns with mixed types, for example
+        df.to_pickle(path + '.pkl')
+        return path + '.pkl'
+    if spill_format == 'parquet':
+        import pyarrow.parquet as pq
+        pq.write_table(table, path + '.parquet')
+        return path + '.parquet'
+    import pyarrow.feather as feather
+    feather.write_feather(table, path + '.arrow')
+    return path + '.arrow'
+
+def _read_frame(path):
+    if path.endswith('.pkl'):
+        return pd.read_pickle(path)
+    if path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        return pq.read_table(path).to_pandas()
+    import pyarrow.feather as feather
+    return feather.read_table(path, memory_map=True).to_pandas()
+
+def _figure_bytes(fig):
+    # Size of the Agg buffer the figure is drawn into
+    width, height = fig.get_size_inches() * fig.dpi
+    return int(width * height * 4)
+
+def session_bytes(smartdata):
+    """Estimated resident bytes of a session: its data versions, conversation memory and images."""
+    if isinstance(smartdata._df_list, pd.DataFrame):
+        total = smartdata.frame_store.stored_bytes()
+    else:
+        total = sum(store.stored_bytes() for store in smartdata.frame_stores)
+    if type(smartdata.memory) is Memory:
+        total += len(smartdata.memory.recall_all())
+    with smartdata.retained_images_lock:
+        images = list(smartdata.retained_images)
+    for image in images:
+        total += image.nbytes if isinstance(image, ImageHandle) else _figure_bytes(image)
+    return total
+
+class SessionManager:
+    """SmartData sessions by id, keeping their resident size under max_bytes by spilling idle ones to disk.
+
+    The least recently used sessions are spilled first: their frames go to Feather or Parquet files, and an
+    in-process conversation memory and the retained figures are pickled. The next access reloads them. Only
+    the current data version is spilled, so versions before it can no longer be rolled back to.
+    """
+    def __init__(self, max_bytes=Config.SESSION_MAX_BYTES, spill_dir=Config.SESSION_SPILL_DIR,
+                 spill_format=Config.SESSION_SPILL_FORMAT):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError as e:
+            raise ImportError("`pyarrow` package not found, please install with `pip install pyarrow`") from e
+        if spill_format not in ('feather', 'parquet'):
+            raise ValueError(f"Unknown spill format {spill_format!r}; use 'feather' or 'parquet'.")
+        self.max_bytes = max_bytes
+        self.spill_format = spill_format
+        self.owns_spill_dir = spill_dir is None
+        self.spill_dir = tempfile.mkdtemp(prefix='smartdata-sessions-') if spill_dir is None else spill_dir
+        os.makedirs(self.spill_dir, exist_ok=True)
+        self.sessions = OrderedDict()
+        self.sizes = {}
+        self.stale = set()
+        self.spilled = {}
+        self.in_use = {}
+        self.lock = threading.RLock()
+        self.evictions = 0
+        self.reloads = 0
+        self.reload_seconds = []
+        self.spill_seconds = 0.0
+
+    def create(self, df_list, session_id=None, **kwargs):
+        """Start a SmartData session on df_list and return its id; kwargs go to SmartData."""
+        from .modeler import SmartData
+        smartdata = SmartData(df_list, **kwargs)
+        session_id = smartdata.session_id if session_id is None else session_id
+        self.add(session_id, smartdata)
+        return session_id
+
+    def add(self, session_id, smartdata):
+        with self.lock:
+            if session_id in self.sessions:
+                raise KeyError(f"Session {session_id} already exists.")
+            self.sessions[session_id] = smartdata
+            self.stale.add(session_id)
+            self._enforce(keep=session_id)
+
+    def _get(self, session_id):
+        # The caller must hold the lock and have pinned the session in in_use, or a later _enforce may spill it
+        with self.lock:
+            smartdata = self.sessions[session_id]
+            if session_id in self.spilled:
+                self._reload(session_id, smartdata)
+            self.sessions.move_to_end(session_id)
+            # Its size is measured again once the caller has used it
+            self.stale.add(session_id)
+            self._enforce(keep=session_id)
+            return smartdata
+
+    @contextlib.contextmanager
+    def session(self, session_id):
+        """Use a session without it being spilled meanwhile; its size is measured when the block exits."""
+        with self.lock:
+            self.in_use[session_id] = self.in_use.get(session_id, 0) + 1
+            try:
+                smartdata = self._get(session_id)
+            except BaseException:
+                self._done_with(session_id)
+                raise
+        try:
+            yield smartdata
+        finally:
+            with self.lock:
+                self._done_with(session_id)
+                self._enforce()
+
+    def _done_with(self, session_id):
+        self.in_use[session_id] -= 1
+        if self.in_use[session_id] == 0:
+            del self.in_use[session_id]
+
+    def remove(self, session_id):
+        with self.lock:
+            smartdata = self.sessions.pop(session_id)
+            self.sizes.pop(session_id, None)
+            self.stale.discard(session_id)
+            spill_path = self.spilled.pop(session_id, None)
+        if spill_path is not None:
+            shutil.rmtree(spill_path, ignore_errors=True)
+        else:
+            smartdata.release_images()
+
+    def measure(self):
+        """Measure every resident session again and spill until the total fits in max_bytes."""
+        with self.lock:
+            self.stale.update(session_id for session_id in self.sessions if session_id not in self.spilled)
+            self._enforce()
+
+    def _enforce(self, keep=None):
+        for session_id in list(self.stale):
+            if session_id != keep and session_id not in self.spilled:
+                self.sizes[session_id] = session_bytes(self.sessions[session_id])
+                self.stale.discard(session_id)
+        if keep is not None and keep not in self.spilled:
+            self.sizes[keep] = session_bytes(self.sessions[keep])
+        for session_id in list(self.sessions):
+            if self.resident_bytes() <= self.max_bytes:
+                break
+            if session_id == keep or session_id in self.spilled or session_id in self.in_use:
+                continue
+            self._spill(session_id, self.sessions[session_id])
+
+    def resident_bytes(self):
+        return sum(size for session_id, size in self.sizes.items() if session_id not in self.spilled)
+
+    def _spill(self, session_id, smartdata):
+        start = time.perf_counter()
+        path = os.path.join(self.spill_dir, f"{session_id}-{uuid.uuid4().hex[:8]}")
+        os.makedirs(path)
+        frames = smartdata._df_list if isinstance(smartdata._df_list, list) else [smartdata._df_list]
+        frame_files = [_write_frame(df, os.path.join(path, f"frame{i}"), self.spill_format) for i, df in enumerate(frames)]
+        state = {
+            'frame_files': frame_files,
+            'is_list': isinstance(smartdata._df_list, list),
+            'images': (smartdata.image_fig_list, list(smartdata.retained_images)),
+            'memory': None,
+        }
+        smartdata.memory.flush()
+        if type(smartdata.memory) is Memory:
+            state['memory'] = smartdata.memory
+        try:
+            with open(os.path.join(path, 'state.pkl'), 'wb') as file:
+                pickle.dump(state, file)
+        except (pickle.PicklingError, TypeError, AttributeError):
+            # A memory with an unpicklable token counter stays in the process
+            state['memory'] = None
+            with open(os.path.join(path, 'state.pkl'), 'wb') as file:
+                pickle.dump(state, file)
+
+        # Drop everything the files now hold, as well as the executor, which is rebuilt on the next question
+        for image in list(smartdata.retained_images):
+            if not isinstance(image, ImageHandle):
+                smartdata.release_image(image)
+        smartdata.retained_images.clear()
+        smartdata.image_fig_list = []
+        smartdata.df_change = []
+        smartdata.frame_store.clear()
+        for store in smartdata.frame_stores:
+            store.clear()
+        smartdata._df_list = None
+        smartdata._df_list_copy = None
+        smartdata.model = None
+        smartdata.model_key = None
+        smartdata.models = {}
+        smartdata.prompt = None
+        if state['memory'] is not None:
+            smartdata.memory = None
+        self.spilled[session_id] = path
+        self.evictions += 1
+        self.spill_seconds += time.perf_counter() - start
+        logger.info(f"Spilled session {session_id} ({self.sizes.get(session_id, 0)} bytes) to {path}.")
+
+    def _reload(self, session_id, smartdata):
+        start = time.perf_counter()
+        path = self.spilled.pop(session_id)
+        with open(os.path.join(path, 'state.pkl'), 'rb') as file:
+            state = pickle.load(file)
+        frames = [_read_frame(frame_file) for frame_file in state['frame_files']]
+        smartdata.commit_data(frames if state['is_list'] else frames[0], adopt = True)
+        smartdata.image_fig_list, retained_images = state['images']
+        smartdata.retained_images.extend(retained_images)
+        if state['memory'] is not None:
+            smartdata.memory = state['memory']
+        shutil.rmtree(path, ignore_errors=True)
+        elapsed = time.perf_counter() - start
+        self.reloads += 1
+        self.reload_seconds.append(elapsed)
+        logger.info(f"Reloaded session {session_id} in {elapsed:.3f}s.")
+
+    def metrics(self):
+        with self.lock:
+            return {
+                'sessions': len(self.sessions),
+                'resident_sessions': len(self.sessions) - len(self.spilled),
+                'spilled_sessions': len(self.spilled),
+                'resident_bytes': self.resident_bytes(),
+                'max_bytes': self.max_bytes,
+                'evictions': self.evictions,
+                'reloads': self.reloads,
+                'spill_seconds_total': self.spill_seconds,
+                'reload_seconds_mean': sum(self.reload_seconds) / len(self.reload_seconds) if self.reload_seconds else 0.0,
+                'reload_seconds_max': max(self.reload_seconds, default=0.0),
+            }
+
+    def close(self):
+        with self.lock:
+            for session_id in list(self.sessions):
+                self.remove(session_id)
+        if self.owns_spill_dir:
+            shutil.rmtree(self.spill_dir, ignore_errors=True)
@@ -0,0 +1,43 @@
+from langchain_core.callbacks import BaseCallbackHandler
+
+# Event types of stream_model, in the order they usually arrive
+EVENT_TYPES = ('attempt', 'token', 'tool_start', 'tool_end', 'figure', 'data_changed', 'retry', 'result')
+
+class StreamEvent:
+    """An event of stream_model; its fields are attributes, e.g. event.text of a 'token' event."""
+    def __init__(self, type, **data):
+        self.type = type
+        self.__dict__.update(data)
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+    def __repr__(self):
+        fields = ', '.join(f"{key}={value!r:.60}" for key, value in self.__dict__.items() if key != 'type')
+        return f"StreamEvent({self.type!r}{', ' if fields else ''}{fields})"
+
+def discard_event(event):
+    pass
+
+class StreamingCallbackHandler(BaseCallbackHandler):
+    """Passes answer tokens and tool calls of an agent run to emit as they happen."""
+    # Called on the thread or event loop of the run, so events keep their order
+    run_inline = True
+
+    def __init__(self, emit):
+        self.emit = emit
+
+    def on_llm_new_token(self, token, **kwargs):
+        # Chunks of a tool call have no text; the call is reported by on_tool_start
+        if token:
+            self.emit(StreamEvent('token', text = token))
+
+    def on_tool_start(self, serialized, input_str, *, inputs = None, **kwargs):
+        code = inputs.get('query', input_str) if isinstance(inputs, dict) else input_str
+        self.emit(StreamEvent('tool_start', tool = (serialized or {}).get('name', kwargs.get('name')), code = code))
+
+    def on_tool_end(self, output, **kwargs):
+        self.emit(StreamEvent('tool_end', output = str(output), error = None))
+
+    def on_tool_error(self, error, **kwargs):
+        self.emit(StreamEvent('tool_end', output = '', error = f"{type(error).__name__}: {error}"))
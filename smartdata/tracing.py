@@ -0,0 +1,232 @@
+import contextlib
+import contextvars
+import functools
+import json
+import logging
+import threading
+import time
+import uuid
+
+from .config import Config
+
+logger = logging.getLogger('SmartDataTrace')
+
+# Span that new spans are nested under, per thread or task
+_CURRENT_SPAN = contextvars.ContextVar('smartdata_current_span', default=None)
+
+class Span:
+    """A timed phase of a trace with its attributes (token counts, retry index, data size...)."""
+    def __init__(self, trace, name, parent_id=None, attributes=None):
+        self.trace = trace
+        self.name = name
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.attributes = dict(attributes or {})
+        self.start_time = time.time()
+        self.start = time.perf_counter()
+        self.seconds = None
+        self.error = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def add(self, **counts):
+        # Adds to numeric attributes, e.g. tokens over several LLM calls
+        for key, value in counts.items():
+            self.attributes[key] = self.attributes.get(key, 0) + value
+
+    def end(self, error=None):
+        if self.seconds is None:
+            self.seconds = time.perf_counter() - self.start
+            self.error = None if error is None else f"{type(error).__name__}: {error}"
+
+    def to_dict(self):
+        return {
+            'trace_id': self.trace.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'start_time': self.start_time,
+            'seconds': self.seconds,
+            'error': self.error,
+            'attributes': self.attributes,
+        }
+
+class Trace:
+    """Spans of one traced call, such as a run_model question."""
+    def __init__(self, name, attributes=None):
+        self.trace_id = uuid.uuid4().hex
+        self.lock = threading.Lock()
+        self.spans = []
+        self.root = self.start_span(name, None, attributes)
+
+    def start_span(self, name, parent=None, attributes=None):
+        """Open a span that the caller ends; used where a with block does not fit, e.g. in callbacks."""
+        span = Span(self, name, None if parent is None else parent.span_id, attributes)
+        with self.lock:
+            self.spans.append(span)
+        return span
+
+    def find(self, name):
+        with self.lock:
+            return [span for span in self.spans if span.name == name]
+
+    def summary(self):
+        """Seconds and counts per phase, LLM tokens, attempts and errors of the trace."""
+        with self.lock:
+            spans = list(self.spans)
+        phases = {}
+        for span in spans[1:]:
+            phase = phases.setdefault(span.name, {'count': 0, 'seconds': 0.0})
+            phase['count'] += 1
+            phase['seconds'] += span.seconds or 0.0
+        llm_spans = [span for span in spans if span.name == 'llm']
+        return {
+            'trace_id': self.trace_id,
+            'name': self.root.name,
+            'seconds': self.root.seconds,
+            'phases': phases,
+            'attempts': sum(1 for span in spans if span.name == 'attempt'),
+            'llm_calls': len(llm_spans),
+            'prompt_tokens': sum(span.attributes.get('prompt_tokens', 0) for span in llm_spans),
+            'completion_tokens': sum(span.attributes.get('completion_tokens', 0) for span in llm_spans),
+            'total_tokens': sum(span.attributes.get('total_tokens', 0) for span in llm_spans),
+            'tool_calls': sum(1 for span in spans if span.name == 'tool'),
+            'response_cache_hits': sum(1 for span in spans if span.attributes.get('cache_hit')),
+            'errors': sum(1 for span in spans if span.error is not None),
+        }
+
+    def to_dict(self):
+        with self.lock:
+            spans = list(self.spans)
+        return {'trace_id': self.trace_id, 'summary': self.summary(), 'spans': [span.to_dict() for span in spans]}
+
+class Tracer:
+    """Starts traces and hands each finished trace to its exporters."""
+    def __init__(self, exporters=None):
+        self.exporters = list(exporters or [])
+
+    @contextlib.contextmanager
+    def trace(self, name, **attributes):
+        trace = Trace(name, attributes)
+        token = _CURRENT_SPAN.set(trace.root)
+        error = None
+        try:
+            yield trace
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            _CURRENT_SPAN.reset(token)
+            trace.root.end(error)
+            self.export(trace)
+
+    def export(self, trace):
+        for exporter in self.exporters:
+            try:
+                exporter.export(trace)
+            except Exception as e:
+                # A failing exporter must not fail the traced call
+                logger.warning(f"Trace exporter {type(exporter).__name__} failed: {e}")
+
+class LogExporter:
+    """Logs one summary line per trace, and every span at DEBUG level."""
+    def __init__(self, level=logging.INFO):
+        self.level = level
+
+    def export(self, trace):
+        summary = trace.summary()
+        phases = ', '.join(f"{name} {phase['seconds']:.3f}s" + (f" x{phase['count']}" if phase['count'] > 1 else '')
+                           for name, phase in summary['phases'].items())
+        logger.log(self.level, f"{summary['name']} {trace.trace_id} took {summary['seconds']:.3f}s "
+                               f"({summary['attempts']} attempts, {summary['llm_calls']} LLM calls, "
+                               f"{summary['total_tokens']} tokens): {phases}")
+        if logger.isEnabledFor(logging.DEBUG):
+            for span in trace.spans:
+                logger.debug(json.dumps(span.to_dict(), default=str))
+
+class JSONLinesExporter:
+    """Appends each trace, with its summary and spans, as one JSON line."""
+    def __init__(self, path=Config.TRACE_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def export(self, trace):
+        line = json.dumps(trace.to_dict(), default=str)
+        with self.lock, open(self.path, 'a', encoding='utf-8') as file:
+            file.write(line + '\n')
+
+class InMemoryExporter:
+    """Keeps finished traces in a list, e.g. for tests."""
+    def __init__(self):
+        self.traces = []
+        self.lock = threading.Lock()
+
+    def export(self, trace):
+        with self.lock:
+            self.traces.append(trace)
+
+    def spans(self, name=None):
+        with self.lock:
+            traces = list(self.traces)
+        return [span for trace in traces for span in trace.spans if name is None or span.name == name]
+
+    def clear(self):
+        with self.lock:
+            self.traces.clear()
+
+class TracedResult(tuple):
+    """The run_model tuple, with the trace of the call as .trace and its summary as .summary."""
+    def __new__(cls, values, trace=None):
+        result = super().__new__(cls, values)
+        result.trace = trace
+        return result
+
+    @property
+    def summary(self):
+        return None if self.trace is None else self.trace.summary()
+
+@functools.lru_cache(maxsize=None)
+def get_tracer(exporter=Config.TRACE_EXPORTER, path=Config.TRACE_PATH):
+    """Process-wide tracer for an exporter ('log', 'jsonl' or 'memory'); None still traces, without exporting."""
+    if exporter is None:
+        return Tracer()
+    if exporter == 'log':
+        return Tracer([LogExporter()])
+    if exporter == 'jsonl':
+        return Tracer([JSONLinesExporter(path)])
+    if exporter == 'memory':
+        return Tracer([InMemoryExporter()])
+    raise ValueError(f"Unknown trace exporter {exporter!r}; use 'log', 'jsonl', 'memory' or None.")
+
+def current_span():
+    return _CURRENT_SPAN.get()
+
+@contextlib.contextmanager
+def span(name, **attributes):
+    """Time a phase as a child of the current span; does nothing outside a trace."""
+    parent = _CURRENT_SPAN.get()
+    if parent is None:
+        yield None
+        return
+    child = parent.trace.start_span(name, parent, attributes)
+    token = _CURRENT_SPAN.set(child)
+    error = None
+    try:
+        yield child
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        _CURRENT_SPAN.reset(token)
+        child.end(error)
+
+def annotate(**attributes):
+    """Set attributes on the current span, if there is one."""
+    current = _CURRENT_SPAN.get()
+    if current is not None:
+        current.set(**attributes)
+
+def in_context(function):
+    """Bind function to the current span, so it nests its spans there when run on another thread."""
+    return functools.partial(contextvars.copy_context().run, function)
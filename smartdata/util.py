@@ -1,17 +1,89 @@
 import pandas as pd
 import numpy as np
 
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import shared_memory
+
+INVALID_VALUE_LIST = ['na', 'nan', 'not applicable', 'n/a', 'n.a.', 'null', 'empty', 'blank']
+
+# Share of distinct values up to which compact_dataframe stores a string column as category
+COMPACT_CATEGORY_RATIO = 0.5
+# Smallest integer size compact_dataframe uses, so arithmetic in generated code (e.g. df['x'] * 1000) does not wrap
+COMPACT_MIN_INT_BYTES = 4
+
+CLEAN_SUMMARY_NEXT_STEP = "Next, we review and standardize categorical fields, identifying any unreasonable values.\n"
+
 def replace_invalid_values(x):
     # Attempt to convert the value to a string and check for invalid values
     if isinstance(x, str) or isinstance(x, (int, float)):
-        if str(x).strip().lower() in ['na', 'nan', 'not applicable', 'n/a', 'n.a.', 'null', 'empty', 'blank']:
+        if str(x).strip().lower() in INVALID_VALUE_LIST:
             return np.nan
     # If x is a valid numeric value, return it as is
     return x
 
-def clean_dataframe(df):
-    df_update = df.copy()
-    summary = {
+def invalid_value_mask(series, token_mask=None):
+    """Vectorized version of replace_invalid_values: True where the value would be replaced by NaN."""
+    if token_mask is None:
+        _, token_mask = stripped_text_and_invalid_mask(series)
+    mask = (token_mask & series.notnull()).to_numpy()
+    # Only str/int/float values are checked, so recheck the (usually few) matches element-wise
+    positions = np.flatnonzero(mask)
+    if len(positions) > 0:
+        values = series.to_numpy()
+        mask[positions] = [isinstance(values[i], (str, int, float)) for i in positions]
+    return pd.Series(mask, index=series.index)
+
+def stripped_text_and_invalid_mask(series):
+    """Return series.astype(str).str.strip() and its INVALID_VALUE_LIST mask."""
+    if pd.api.types.infer_dtype(series, skipna=True) != 'string':
+        stripped = series.astype(str).str.strip()
+        invalid = stripped.str.lower().isin(INVALID_VALUE_LIST)
+        if series.dtype == object:
+            # The legacy apply re-infers the dtype after the first pass, so e.g. numbers with NaN are written as floats ('7.0')
+            inferred = series.mask(invalid_value_mask(series, invalid)).infer_objects()
+            if inferred.dtype != object:
+                stripped = inferred.astype(str).str.strip()
+                invalid = stripped.str.lower().isin(INVALID_VALUE_LIST)
+        return stripped, invalid
+
+    # Pure string columns: do the string work once per distinct value and broadcast back
+    codes, uniques = pd.factorize(series)
+    stripped_uniques = uniques.str.strip()
+    invalid_uniques = stripped_uniques.str.lower().isin(INVALID_VALUE_LIST)
+    stripped = stripped_uniques.to_numpy(dtype=object).take(codes)
+    invalid = invalid_uniques.take(codes)
+    null_positions = np.flatnonzero(codes == -1)
+    if len(null_positions) > 0:
+        # Missing values become 'nan'/'None'/... exactly as astype(str) would render them
+        null_text = series.iloc[null_positions].astype(str).str.strip()
+        stripped[null_positions] = null_text.to_numpy()
+        invalid[null_positions] = null_text.str.lower().isin(INVALID_VALUE_LIST).to_numpy()
+    return pd.Series(stripped, index=series.index), pd.Series(invalid, index=series.index)
+
+def legacy_numeric_dtype(series):
+    """dtype a numeric column has after the legacy loop's per-value apply of replace_invalid_values.
+
+    The apply turns values into Python numbers, so floats come back as float64 and integers as int64, or
+    float64 when they have missing values (e.g. Int64 with NA).
+    """
+    dtype = series.dtype
+    if len(series) == 0 or dtype.kind not in 'iuf':
+        return dtype
+    if dtype.kind == 'f' or series.hasnans:
+        return np.dtype(np.float64)
+    if dtype.kind == 'u' and dtype.itemsize == 8 and series.max() > np.iinfo(np.int64).max:
+        return np.dtype(np.uint64)
+    return np.dtype(np.int64)
+
+def upcast_numeric_columns(df_update, columns):
+    """Give numeric columns their legacy_numeric_dtype in place, so every cleaning path returns the same dtypes."""
+    for col in columns:
+        dtype = legacy_numeric_dtype(df_update[col])
+        if df_update[col].dtype != dtype:
+            df_update[col] = df_update[col].to_numpy(dtype=dtype, na_value=np.nan) if dtype.kind == 'f' else df_update[col].astype(dtype)
+
+def new_clean_summary():
+    return {
         'numeric_columns_filled': {},
         'numeric_outliers_capped': {},
         'categorical_columns_filled': {},
@@ -21,7 +93,7 @@ def clean_dataframe(df):
         'columns_removed': 0
     }
 
-    # 1. Remove empty rows and columns
+def remove_empty_rows_and_columns(df_update, summary):
     rows_before = df_update.shape[0]
     df_update.dropna(how='all', inplace=True)
     rows_after = df_update.shape[0]
@@ -31,6 +103,268 @@ def clean_dataframe(df):
     df_update.dropna(axis=1, how='all', inplace=True)
     columns_after = df_update.shape[1]
     summary['columns_removed'] = columns_before - columns_after
+
+def clean_numeric_columns(df_update, columns, summary):
+    """Fill missing values with the mean and cap outliers for a block of numeric columns."""
+    if len(columns) == 0:
+        return
+    # replace_invalid_values never changes a numeric value; its dtype changes come from upcast_numeric_columns
+
+    # Fill missing values with the mean
+    missing_counts = df_update[columns].isnull().sum()
+    filled_columns = missing_counts[missing_counts > 0].index
+    if len(filled_columns) > 0:
+        df_update[filled_columns] = df_update[filled_columns].fillna(df_update[filled_columns].mean())
+
+    # Compute the 1st and 99th percentiles of all columns in one call
+    bounds = df_update[columns].quantile([0.01, 0.99])
+    lower_bounds = bounds.loc[0.01]
+    upper_bounds = bounds.loc[0.99]
+    outliers_lower = df_update[columns].lt(lower_bounds).sum()
+    outliers_upper = df_update[columns].gt(upper_bounds).sum()
+
+    for col in columns:
+        if missing_counts[col] > 0:
+            summary['numeric_columns_filled'][col] = missing_counts[col]
+        if outliers_lower[col] > 0 or outliers_upper[col] > 0:
+            lower_bound, upper_bound = lower_bounds[col], upper_bounds[col]
+            df_update[col] = np.where(df_update[col] < lower_bound, lower_bound, df_update[col])
+            df_update[col] = np.where(df_update[col] > upper_bound, upper_bound, df_update[col])
+            summary['numeric_outliers_capped'][col] = {'lower_capped': outliers_lower[col], 'upper_capped': outliers_upper[col]}
+
+def clean_categorical_columns(df_update, columns, summary):
+    """Trim, mark invalid values as missing and fill or drop a block of object columns."""
+    for col in columns:
+        series = df_update[col]
+        # Both replace_invalid_values passes look at the same stripped, lowercased text
+        stripped, invalid = stripped_text_and_invalid_mask(series)
+
+        # Missing share after the first pass, before every value is turned into a string
+        missing_percentage = (series.isnull() | invalid_value_mask(series, invalid)).mean()
+        if missing_percentage > 0.9:
+            df_update.drop(columns=[col], inplace=True)
+            summary['categorical_columns_removed'].append(col)
+        else:
+            missing_count = invalid.sum()
+            if missing_count > 0:
+                df_update[col] = stripped.mask(invalid, 'Not Specified')
+                summary['categorical_columns_filled'][col] = missing_count
+            else:
+                df_update[col] = stripped
+
+def clean_datetime_columns(df_update, summary):
+    for col in df_update.select_dtypes(include=['datetime']).columns:
+        try:
+            df_update[col] = pd.to_datetime(df_update[col], errors='coerce')
+            # Replace missing values with mode
+            missing_count = df_update[col].isnull().sum()
+            if missing_count > 0:
+                mode_value = df_update[col].mode()[0]
+                df_update[col] = df_update[col].fillna(mode_value)
+                summary['datetime_columns_filled'][col] = missing_count
+        except Exception:
+            continue
+
+def clean_dataframe_vectorized(df):
+    """Same rules and summary as clean_dataframe, using column-wide operations instead of per-value apply."""
+    df_update = df.copy()
+    summary = new_clean_summary()
+
+    # 1. Remove empty rows and columns
+    remove_empty_rows_and_columns(df_update, summary)
+
+    # 2. Clean numeric columns
+    numeric_columns = df_update.select_dtypes(include=[np.number]).columns
+    upcast_numeric_columns(df_update, numeric_columns)
+    clean_numeric_columns(df_update, numeric_columns, summary)
+
+    # 3. Clean categorical/string/object columns
+    clean_categorical_columns(df_update, df_update.select_dtypes(include=['object']).columns, summary)
+
+    # 4. Clean datetime columns
+    clean_datetime_columns(df_update, summary)
+
+    return df_update, build_clean_summary_md(summary)
+
+def split_columns(columns, parts):
+    """Split columns into at most `parts` contiguous blocks, keeping their order."""
+    columns = list(columns)
+    size = -(-len(columns) // max(parts, 1))
+    return [columns[i:i + size] for i in range(0, len(columns), size)] if size > 0 else []
+
+def merge_clean_summaries(summary, parts, column_order):
+    """Merge per-block summaries into summary, ordered by column position so scheduling never changes the result."""
+    position = {col: i for i, col in enumerate(column_order)}
+    for key in ['numeric_columns_filled', 'numeric_outliers_capped', 'categorical_columns_filled', 'datetime_columns_filled']:
+        merged = {col: value for part in parts for col, value in part[key].items()}
+        summary[key].update(sorted(merged.items(), key=lambda item: position[item[0]]))
+    removed = [col for part in parts for col in part['categorical_columns_removed']]
+    summary['categorical_columns_removed'].extend(sorted(removed, key=position.get))
+
+def clean_numeric_block(block):
+    summary = new_clean_summary()
+    clean_numeric_columns(block, block.columns, summary)
+    return block, summary
+
+def clean_categorical_block(block):
+    summary = new_clean_summary()
+    clean_categorical_columns(block, block.columns, summary)
+    return block, summary
+
+def clean_numeric_shared_block(columns, length):
+    """Process worker: clean numeric columns whose buffers live in shared memory.
+
+    columns holds (name, input buffer, dtype, output buffer) tuples. Cleaned values of changed columns
+    are written to the float64 output buffer and their final dtypes are returned with the summary.
+    """
+    handles = {}
+    try:
+        data = {}
+        for col, input_name, dtype, output_name in columns:
+            handles[input_name] = shared_memory.SharedMemory(name=input_name)
+            data[col] = np.ndarray(length, dtype=dtype, buffer=handles[input_name].buf)
+        # The frame gets its own copy of the values, so the buffers can be overwritten below
+        block = pd.DataFrame(data, copy=True)
+        del data
+        block, summary = clean_numeric_block(block)
+
+        dtypes = {}
+        for col, input_name, dtype, output_name in columns:
+            if col in summary['numeric_columns_filled'] or col in summary['numeric_outliers_capped']:
+                if output_name not in handles:
+                    handles[output_name] = shared_memory.SharedMemory(name=output_name)
+                output = np.ndarray(length, dtype=np.float64, buffer=handles[output_name].buf)
+                output[:] = block[col].to_numpy(dtype=np.float64)
+                del output
+                dtypes[col] = block[col].dtype.str
+        return dtypes, summary
+    finally:
+        for handle in handles.values():
+            handle.close()
+
+def _clean_numeric_blocks_in_processes(pool, df_update, blocks):
+    """Share numeric columns with process workers through shared memory instead of pickling them."""
+    length = len(df_update)
+    segments = []
+    try:
+        futures = []
+        for block in blocks:
+            columns = []
+            for col in block:
+                values = df_update[col].to_numpy()
+                input_segment = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+                segments.append(input_segment)
+                np.ndarray(length, dtype=values.dtype, buffer=input_segment.buf)[:] = values
+                output_segment = input_segment
+                if values.dtype != np.float64:
+                    output_segment = shared_memory.SharedMemory(create=True, size=max(length * 8, 1))
+                    segments.append(output_segment)
+                columns.append((col, input_segment.name, values.dtype.str, output_segment.name))
+            futures.append((columns, pool.submit(clean_numeric_shared_block, columns, length)))
+
+        parts = []
+        for columns, future in futures:
+            dtypes, part = future.result()
+            for col, input_name, dtype, output_name in columns:
+                if col in dtypes:
+                    output = next(segment for segment in segments if segment.name == output_name)
+                    df_update[col] = np.ndarray(length, dtype=np.float64, buffer=output.buf).astype(dtypes[col])
+            parts.append(part)
+        return parts
+    finally:
+        for segment in segments:
+            segment.close()
+            segment.unlink()
+
+def process_context():
+    # Forking a host process that may be running other threads can copy held locks into the workers, so workers
+    # start from the sandbox's forkserver, which has pandas imported already, or are spawned
+    from .sandbox import _multiprocessing_context
+    return _multiprocessing_context()
+
+def clean_dataframe_parallel(df, workers, parallel_backend='thread'):
+    """Same result as clean_dataframe, with numeric and categorical column blocks cleaned on a worker pool.
+
+    The 'thread' backend cleans a copy of each column block and writes the cleaned columns back. The
+    'process' backend passes numeric columns through shared memory and pickles the other column blocks.
+    """
+    if parallel_backend == 'thread':
+        pool = ThreadPoolExecutor(max_workers=workers)
+    elif parallel_backend == 'process':
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=process_context())
+    else:
+        raise ValueError(f"Unsupported parallel_backend {parallel_backend}. It must be one of 'thread' or 'process'.")
+
+    df_update = df.copy()
+    summary = new_clean_summary()
+
+    # 1. Remove empty rows and columns
+    remove_empty_rows_and_columns(df_update, summary)
+
+    numeric_columns = df_update.select_dtypes(include=[np.number]).columns
+    object_columns = df_update.select_dtypes(include=['object']).columns
+    upcast_numeric_columns(df_update, numeric_columns)
+
+    def column_block(block):
+        # Threads get their own copy: df_update[block] may be a view, and writing to it would not reach df_update
+        return df_update[block].copy() if parallel_backend == 'thread' else df_update[block]
+
+    with pool:
+        # 2. Clean numeric columns
+        if parallel_backend == 'process':
+            # Extension dtypes (e.g. Int64) have no plain buffer to share, so they go through pickling
+            shared = [col for col in numeric_columns if isinstance(df_update[col].dtype, np.dtype)]
+            others = [col for col in numeric_columns if col not in shared]
+            parts = _clean_numeric_blocks_in_processes(pool, df_update, split_columns(shared, workers))
+            futures = [pool.submit(clean_numeric_block, column_block(block)) for block in split_columns(others, workers)]
+        else:
+            parts = []
+            futures = [pool.submit(clean_numeric_block, column_block(block)) for block in split_columns(numeric_columns, workers)]
+        for future in futures:
+            block, part = future.result()
+            for col in block.columns:
+                df_update[col] = block[col]
+            parts.append(part)
+
+        # 3. Clean categorical/string/object columns
+        futures = [pool.submit(clean_categorical_block, column_block(block)) for block in split_columns(object_columns, workers)]
+        for future in futures:
+            block, part = future.result()
+            df_update.drop(columns=part['categorical_columns_removed'], inplace=True)
+            for col in block.columns:
+                df_update[col] = block[col]
+            parts.append(part)
+
+    merge_clean_summaries(summary, parts, list(numeric_columns) + list(object_columns))
+
+    # 4. Clean datetime columns
+    clean_datetime_columns(df_update, summary)
+
+    return df_update, build_clean_summary_md(summary)
+
+def clean_dataframe(df, vectorized=True, workers=None, parallel_backend='thread', backend='pandas', compact=False):
+    """Clean df and return it with a markdown summary; compact=True also shrinks the column dtypes with compact_dataframe."""
+    df_update, summary_md = _clean_dataframe(df, vectorized, workers, parallel_backend, backend)
+    if compact:
+        df_update, compaction = compact_dataframe(df_update)
+        summary_md = add_compaction_summary_md(summary_md, compaction)
+    return df_update, summary_md
+
+def _clean_dataframe(df, vectorized, workers, parallel_backend, backend):
+    if backend != 'pandas':
+        # Polars and Arrow run their own threads, so workers does not apply
+        from .backends import clean_dataframe_backend
+        return clean_dataframe_backend(df, backend)
+    if workers is not None and workers > 1:
+        return clean_dataframe_parallel(df, workers, parallel_backend)
+    if vectorized:
+        return clean_dataframe_vectorized(df)
+
+    df_update = df.copy()
+    summary = new_clean_summary()
+
+    # 1. Remove empty rows and columns
+    remove_empty_rows_and_columns(df_update, summary)
     
     # 2. Clean numeric columns
     for col in df_update.select_dtypes(include=[np.number]).columns:
@@ -99,6 +433,107 @@ def clean_dataframe(df):
         except Exception:
             continue
     
+    return df_update, build_clean_summary_md(summary)
+
+def _smallest_int_dtype(low, high, kind='i'):
+    for dtype in (np.dtype(f"{kind}{size}") for size in (1, 2, 4, 8) if size >= COMPACT_MIN_INT_BYTES):
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return dtype
+    return None
+
+def _nullable_int_dtype(int_dtype):
+    # int8 -> Int8, uint8 -> UInt8
+    return pd.api.types.pandas_dtype('U' + int_dtype.name[1:].capitalize() if int_dtype.kind == 'u' else int_dtype.name.capitalize())
+
+def _string_dtype():
+    try:
+        import pyarrow as pa
+    except ImportError:
+        return None
+    # Unlike StringDtype('pyarrow'), ArrowDtype is recorded in Arrow metadata, so the sandbox can restore it
+    return pd.ArrowDtype(pa.string())
+
+def compact_dtype(series, category_ratio=COMPACT_CATEGORY_RATIO):
+    """Smallest dtype that holds every value of series unchanged, or None to keep its dtype.
+
+    Whole-number floats become the smallest integer type of at least COMPACT_MIN_INT_BYTES, or a nullable Int type
+    when they have missing values. Integers are only narrowed down to COMPACT_MIN_INT_BYTES. Other floats become float32 only if no value changes. String columns with at most category_ratio distinct
+    values per row become category, and the others Arrow strings when pyarrow is installed.
+    """
+    dtype = series.dtype
+    if isinstance(dtype, np.dtype) and dtype.kind == 'f':
+        values = series.to_numpy()
+        present = values[~np.isnan(values)]
+        if len(present) == 0 or not np.isfinite(present).all():
+            return None
+        if (present == np.trunc(present)).all() and -2.0 ** 63 <= present.min() and present.max() < 2.0 ** 63:
+            int_dtype = _smallest_int_dtype(present.min(), present.max())
+            return int_dtype if len(present) == len(values) else _nullable_int_dtype(int_dtype)
+        if dtype.itemsize > 4:
+            with np.errstate(over='ignore'):
+                if np.array_equal(values.astype(np.float32).astype(dtype), values, equal_nan=True):
+                    return np.dtype(np.float32)
+        return None
+    if isinstance(dtype, np.dtype) and dtype.kind in 'iu' or isinstance(series.array, pd.arrays.IntegerArray):
+        present = series.dropna()
+        if len(present) == 0:
+            return None
+        int_dtype = _smallest_int_dtype(present.min(), present.max(), dtype.kind)
+        if int_dtype.itemsize >= dtype.itemsize:
+            return None
+        return int_dtype if isinstance(dtype, np.dtype) else _nullable_int_dtype(int_dtype)
+    if (dtype == object or isinstance(dtype, pd.StringDtype)) and len(series) > 0:
+        if pd.api.types.infer_dtype(series, skipna=True) != 'string':
+            return None
+        if series.nunique(dropna=False) <= category_ratio * len(series):
+            return pd.CategoricalDtype()
+        string_dtype = _string_dtype()
+        return string_dtype if string_dtype is not None and dtype != string_dtype else None
+    return None
+
+def compact_dataframe(df, category_ratio=COMPACT_CATEGORY_RATIO):
+    """Copy of df with every column in its compact_dtype, and a report of the converted columns and the bytes saved."""
+    df_compact = df.copy(deep=False)
+    column_bytes = df.memory_usage(deep=True, index=False).to_numpy()
+    index_bytes = int(df.index.memory_usage(deep=True))
+    report = {'bytes_before': index_bytes + int(column_bytes.sum()), 'columns': {}}
+    for position, col in enumerate(df.columns):
+        series = df.iloc[:, position]
+        new_dtype = compact_dtype(series, category_ratio)
+        if new_dtype is None:
+            continue
+        compacted = series.astype(new_dtype)
+        # On short columns the categories of a category column can outweigh the strings they replace
+        compacted_bytes = compacted.memory_usage(deep=True, index=False)
+        if compacted_bytes < column_bytes[position]:
+            df_compact.isetitem(position, compacted)
+            column_bytes[position] = compacted_bytes
+            report['columns'][col] = (str(series.dtype), str(compacted.dtype))
+    report['bytes_after'] = index_bytes + int(column_bytes.sum())
+    return df_compact, report
+
+def format_bytes(size):
+    for unit in ('B', 'KB', 'MB'):
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+def add_compaction_summary_md(summary_md, report):
+    """Insert the column types changed by compact_dataframe and the memory they saved into a cleaning summary."""
+    compaction_md = ""
+    if report['columns']:
+        compaction_md += "- Columns converted to more compact types:\n  "
+        compaction_md += ', '.join([f"{col} ({old} to {new})" for col, (old, new) in report['columns'].items()]) + "\n\n"
+    ratio = report['bytes_before'] / report['bytes_after'] if report['bytes_after'] else 1.0
+    compaction_md += f"- Memory usage: {format_bytes(report['bytes_before'])} before, {format_bytes(report['bytes_after'])} after ({ratio:.1f}x smaller)\n\n"
+    head, next_step, tail = summary_md.rpartition(CLEAN_SUMMARY_NEXT_STEP)
+    if not next_step:
+        return summary_md + "\n" + compaction_md
+    return head + compaction_md + next_step + tail
+
+def build_clean_summary_md(summary):
     # Build the markdown summary string dynamically
     summary_md = "**Data Cleaning Result:**\n\n"
     
@@ -125,9 +560,9 @@ def clean_dataframe(df):
     summary_md += f"- Total number of rows removed: {summary['rows_removed']}\n"
     summary_md += f"- Total number of columns removed: {summary['columns_removed']}\n\n"
     
-    summary_md += "Next, we review and standardize categorical fields, identifying any unreasonable values.\n"
+    summary_md += CLEAN_SUMMARY_NEXT_STEP
 
     # Output the summary
     # print(summary_md)
     
-    return df_update, summary_md
\ No newline at end of file
+    return summary_md
\ No newline at end of file
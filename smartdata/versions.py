@@ -0,0 +1,248 @@
+import sys
+import threading
+import time
+import uuid
+
+import pandas as pd
+import numpy as np
+
+from .config import Config
+
+def _column_values(series):
+    # The array backing the column, without copying
+    if isinstance(series.dtype, np.dtype):
+        return series.to_numpy()
+    return series.array
+
+def _backing_arrays(values):
+    if isinstance(values, np.ndarray):
+        return [values]
+    if isinstance(values, pd.arrays.ArrowExtensionArray):
+        # Arrow-backed arrays, Arrow strings included, have no numpy buffers
+        return []
+    return [getattr(values, attr) for attr in ('_ndarray', '_data', '_mask') if isinstance(getattr(values, attr, None), np.ndarray)]
+
+def _freeze(values):
+    """Make the numpy buffers behind values read-only; returns False if values has buffers this cannot reach."""
+    arrays = _backing_arrays(values)
+    if not arrays:
+        # Arrow-backed arrays are immutable already
+        return isinstance(values, pd.arrays.ArrowExtensionArray)
+    for array in arrays:
+        array.flags.writeable = False
+    return True
+
+def _buffer_id(values):
+    arrays = _backing_arrays(values)
+    if not arrays:
+        return ('object', id(values))
+    return (type(values).__name__, str(values.dtype)) + tuple(
+        (array.__array_interface__['data'][0], array.shape, array.strides) for array in arrays)
+
+class FrameVersion:
+    """One committed version: an index and the pool keys of its columns, in order."""
+    def __init__(self, version, parent, index_key, column_keys, columns, label):
+        self.version = version
+        self.parent = parent
+        self.index_key = index_key
+        self.column_keys = column_keys
+        self.columns = columns
+        self.label = label
+        self.created = time.time()
+
+class FrameStore:
+    """Versioned dataframe store with column-level structural sharing.
+
+    A commit stores only the columns that differ from the head version; every other column is shared
+    with it. Stored arrays are read-only, so frames returned by checkout share
+    memory with the store and cannot change it: in-place writes raise and a copy has to be taken first.
+    Rolling back moves the head pointer and copies no data.
+    """
+    def __init__(self, max_versions=Config.MAX_DATA_VERSIONS):
+        self.max_versions = max_versions
+        # Pool keys are only unique within a store
+        self.store_id = uuid.uuid4().hex
+        self.versions = {}
+        self.pool = {}
+        self.buffer_keys = {}
+        self.head = None
+        self.next_version = 1
+        self.next_key = 0
+        self.lock = threading.RLock()
+
+    def new_version_id(self):
+        with self.lock:
+            version = self.next_version
+            self.next_version += 1
+            return version
+
+    def _new_key(self, kind):
+        self.next_key += 1
+        return (kind, self.next_key)
+
+    def _store(self, key, values, adopt):
+        entry = self.pool.get(key)
+        if entry is None:
+            # A view into a 2D block would keep the whole block alive, so it is copied even when adopted
+            if not adopt or (isinstance(values, np.ndarray) and values.base is not None):
+                values = values.copy()
+            entry = {'values': values, 'frozen': _freeze(values), 'refs': 0, 'bytes': None,
+                     'buffer_id': _buffer_id(values)}
+            self.pool[key] = entry
+            self.buffer_keys[entry['buffer_id']] = key
+        entry['refs'] += 1
+        return key
+
+    def _column_key(self, series, adopt, head_key):
+        values = _column_values(series)
+        # Columns taken from a checkout still point at the stored buffers
+        key = self.buffer_keys.get(_buffer_id(values))
+        if key is None and head_key is not None:
+            # A copied but unchanged column is shared with the head version
+            stored = self.pool[head_key]['values']
+            if stored.dtype == series.dtype and pd.Series(stored, copy=False).equals(pd.Series(values, copy=False)):
+                key = head_key
+        if key is None:
+            key = self._new_key('column')
+        return self._store(key, values, adopt)
+
+    def _index_key(self, index, head_key):
+        key = self.buffer_keys.get(('index', id(index)))
+        if key is None and head_key is not None:
+            stored = self.pool[head_key]['values']
+            if type(stored) is type(index) and stored.dtype == index.dtype and stored.equals(index):
+                key = head_key
+        if key is None:
+            key = self._new_key('index')
+        entry = self.pool.get(key)
+        if entry is None:
+            # Index objects are immutable and shared as they are
+            entry = {'values': index, 'frozen': True, 'refs': 0, 'bytes': None, 'buffer_id': ('index', id(index))}
+            self.pool[key] = entry
+            self.buffer_keys[entry['buffer_id']] = key
+        entry['refs'] += 1
+        return key
+
+    def commit(self, df, adopt=False, label=None):
+        """Store df as a new version on top of the head and return its version id.
+
+        With adopt=True the store takes ownership of df's new column arrays and makes them read-only instead of
+        copying them; only use it for frames nothing else will write to.
+        """
+        with self.lock:
+            version = self.new_version_id()
+            head = self.versions.get(self.head)
+            head_index_key = head.index_key if head is not None else None
+            head_column_keys = {}
+            if head is not None and head.columns.is_unique:
+                head_column_keys = dict(zip(head.columns, head.column_keys))
+            index_key = self._index_key(df.index, head_index_key)
+            column_keys = [self._column_key(df.iloc[:, col], adopt, head_column_keys.get(df.columns[col]) if df.columns.is_unique else None)
+                           for col in range(df.shape[1])]
+            self.versions[version] = FrameVersion(version, self.head, index_key, column_keys, df.columns, label)
+            self.head = version
+            self._prune()
+            return version
+
+    def checkout(self, version=None):
+        """Frame of a version (the head by default) that shares the stored column arrays."""
+        with self.lock:
+            record = self.versions[self.head if version is None else version]
+            index = self.pool[record.index_key]['values']
+            series_list = []
+            for position, key in enumerate(record.column_keys):
+                entry = self.pool[key]
+                values = entry['values'] if entry['frozen'] else entry['values'].copy()
+                series_list.append(pd.Series(values, index=index, name=position, copy=False))
+        if not series_list:
+            return pd.DataFrame(index=index, columns=record.columns)
+        df = pd.concat(series_list, axis=1, copy=False)
+        df.columns = record.columns
+        return df
+
+    def column_keys(self, version=None):
+        """Keys of the columns of a version that stay the same while a column and the index are unchanged."""
+        with self.lock:
+            record = self.versions[self.head if version is None else version]
+            return [(self.store_id, record.index_key, key) for key in record.column_keys]
+
+    def rollback(self, version):
+        """Make an earlier version the head; later commits branch from it."""
+        with self.lock:
+            if version not in self.versions:
+                raise KeyError(f"Version {version} is not in the store.")
+            self.head = version
+        return self.checkout(version)
+
+    def clear(self):
+        """Drop every version; version ids keep counting up, so an id is never given to different data."""
+        with self.lock:
+            self.versions.clear()
+            self.pool.clear()
+            self.buffer_keys.clear()
+            self.head = None
+
+    def _release(self, key):
+        entry = self.pool[key]
+        entry['refs'] -= 1
+        if entry['refs'] == 0:
+            del self.pool[key]
+            self.buffer_keys.pop(entry['buffer_id'], None)
+
+    def _prune(self):
+        if self.max_versions is None:
+            return
+        for version in sorted(self.versions):
+            if len(self.versions) <= self.max_versions:
+                break
+            if version == self.head:
+                continue
+            record = self.versions.pop(version)
+            self._release(record.index_key)
+            for key in record.column_keys:
+                self._release(key)
+
+    def _entry_bytes(self, key):
+        entry = self.pool[key]
+        if entry['bytes'] is None:
+            values = entry['values']
+            if isinstance(values, pd.Index):
+                entry['bytes'] = int(values.memory_usage(deep=True))
+            else:
+                entry['bytes'] = int(values.nbytes)
+                # Python objects are counted one by one, like memory_usage(deep=True), which needs writable buffers
+                for array in _backing_arrays(values):
+                    if array.dtype == object:
+                        entry['bytes'] += sum(map(sys.getsizeof, array))
+        return entry['bytes']
+
+    def memory_report(self):
+        """Bytes per version: total as materialized, new in that version, and shared with its parent."""
+        rows = []
+        with self.lock:
+            for version in sorted(self.versions):
+                record = self.versions[version]
+                keys = [record.index_key] + record.column_keys
+                parent = self.versions.get(record.parent)
+                parent_keys = set([parent.index_key] + parent.column_keys) if parent is not None else set()
+                total_bytes = sum(self._entry_bytes(key) for key in keys)
+                shared_bytes = sum(self._entry_bytes(key) for key in set(keys) & parent_keys)
+                rows.append({
+                    'version': version,
+                    'parent': record.parent,
+                    'label': record.label,
+                    'head': version == self.head,
+                    'rows': len(self.pool[record.index_key]['values']),
+                    'columns': len(record.column_keys),
+                    'total_bytes': total_bytes,
+                    'new_bytes': total_bytes - shared_bytes,
+                    'shared_bytes': shared_bytes,
+                })
+        report = pd.DataFrame(rows, columns=['version', 'parent', 'label', 'head', 'rows', 'columns',
+                                             'total_bytes', 'new_bytes', 'shared_bytes'])
+        return report.astype({'parent': 'Int64'})
+
+    def stored_bytes(self):
+        """Bytes actually held by the store, counting every shared array once."""
+        with self.lock:
+            return sum(self._entry_bytes(key) for key in self.pool)
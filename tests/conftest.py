@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+import pytest
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+import smartdata.modeler as modeler
+
+def make_dirty_frame(rows=300, seed=0):
+    """Columns of every dtype the cleaning rules treat differently, with missing values, invalid tokens and outliers."""
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        'float64': rng.normal(50.0, 10.0, rows),
+        'float32': rng.normal(50.0, 10.0, rows).astype('float32'),
+        'int64': rng.integers(18, 65, rows),
+        'int32': rng.integers(18, 65, rows).astype('int32'),
+        'uint8': rng.integers(0, 200, rows).astype('uint8'),
+        'Int64': pd.array(rng.integers(0, 100, rows), dtype='Int64'),
+        'Int64_na': pd.array(rng.integers(0, 100, rows), dtype='Int64'),
+        'object_numeric': pd.Series(list(rng.integers(0, 9, rows)), dtype=object),
+        'text': rng.choice(np.array(['alpha', ' beta ', 'N/A', 'null', 'Gamma', None], dtype=object), rows),
+        'mostly_missing': np.where(rng.random(rows) < 0.95, None, 'x').astype(object),
+        'date': pd.Timestamp('2020-01-01') + pd.to_timedelta(rng.integers(0, 1000, rows), unit='D'),
+    })
+    df.loc[::17, 'float64'] = np.nan
+    df.loc[::19, 'float32'] = np.nan
+    df.loc[::5, 'float64'] *= 100
+    df.loc[::13, 'Int64_na'] = pd.NA
+    df.loc[::11, 'object_numeric'] = 'N/A'
+    df.loc[::23, 'date'] = pd.NaT
+    return df
+
+@pytest.fixture
+def dirty_frame():
+    return make_dirty_frame()
+
+STOPPED = 'Agent stopped due to iteration limit.'
+ANSWER = 'The mean of a is 2.'
+
+def fake_chat_openai(monkeypatch, answer):
+    """Make ChatOpenAI answer every request with answer; returns the list of seeds the requests were sent with."""
+    from langchain_openai import ChatOpenAI
+    monkeypatch.setenv('OPENAI_API_KEY', 'sk-test')
+    monkeypatch.setitem(modeler.config, 'MAX_ATTEMPTS', 3)
+    seeds = []
+
+    def record(self, messages, stop, kwargs):
+        payload = self._get_request_payload(messages, stop=stop, **kwargs)
+        assert payload.get('tools'), 'tools must be sent with every request'
+        seeds.append(payload['seed'])
+
+    def generate(self, messages, stop=None, run_manager=None, **kwargs):
+        record(self, messages, stop, kwargs)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=answer))])
+
+    def stream(self, messages, stop=None, run_manager=None, **kwargs):
+        record(self, messages, stop, kwargs)
+        yield ChatGenerationChunk(message=AIMessageChunk(content=answer))
+
+    async def agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        return generate(self, messages, stop, **kwargs)
+
+    async def astream(self, messages, stop=None, run_manager=None, **kwargs):
+        for chunk in stream(self, messages, stop, **kwargs):
+            yield chunk
+
+    monkeypatch.setattr(ChatOpenAI, '_generate', generate)
+    monkeypatch.setattr(ChatOpenAI, '_stream', stream)
+    monkeypatch.setattr(ChatOpenAI, '_agenerate', agenerate)
+    monkeypatch.setattr(ChatOpenAI, '_astream', astream)
+    return seeds
+
+@pytest.fixture
+def sent_seeds(monkeypatch):
+    """Seeds of the requests the shared ChatOpenAI would send; every answer is a stopped one, so every attempt runs."""
+    return fake_chat_openai(monkeypatch, STOPPED)
+
+@pytest.fixture
+def answered_seeds(monkeypatch):
+    """Like sent_seeds, but every request is answered with ANSWER, so the first attempt is kept."""
+    return fake_chat_openai(monkeypatch, ANSWER)
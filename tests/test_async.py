@@ -0,0 +1,23 @@
+import asyncio
+
+import pandas as pd
+
+from smartdata import SmartData
+
+def test_failed_async_attempt_is_logged(sent_seeds, monkeypatch, caplog, capsys):
+    sd = SmartData(pd.DataFrame({'a': [1, 2, 3]}))
+    calls = []
+
+    async def ainvoke_agent(agent_executor, question_with_history, seed, run_config):
+        calls.append(seed)
+        if len(calls) == 1:
+            raise RuntimeError('connection reset')
+        return {'output': 'The mean is 2.', 'intermediate_steps': []}
+
+    monkeypatch.setattr(sd, 'ainvoke_agent', ainvoke_agent)
+    with caplog.at_level('WARNING', logger='SmartData'):
+        result = asyncio.run(sd.arun_model('Mean of a?'))
+    assert result[0] == 'The mean is 2.'
+    [record] = [record for record in caplog.records if 'seed 0' in record.getMessage()]
+    assert 'connection reset' in str(record.exc_info[1])
+    assert 'Fail to process' not in capsys.readouterr().out
@@ -0,0 +1,34 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from smartdata.backends import describe
+from smartdata.profiler import build_df_profile
+from smartdata.util import clean_dataframe
+
+BACKENDS = ['polars', 'arrow']
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_backend_clean_matches_pandas(dirty_frame, backend):
+    expected, expected_summary = clean_dataframe(dirty_frame)
+    result, summary = clean_dataframe(dirty_frame, backend=backend)
+    # Quantiles may differ in the last bit, so compare values with a tolerance and dtypes exactly
+    pd.testing.assert_series_equal(result.dtypes, expected.dtypes)
+    pd.testing.assert_frame_equal(result, expected, check_exact=False, rtol=1e-12)
+    assert summary == expected_summary
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_backend_describe_matches_pandas(backend):
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({'float64': rng.normal(0.0, 1.0, 500), 'int64': rng.integers(0, 100, 500),
+                       'text': rng.choice(['a', 'b'], 500)})
+    df.loc[::7, 'float64'] = np.nan
+    pd.testing.assert_frame_equal(describe(df, backend), df.describe(), check_exact=False, rtol=1e-12)
+
+def test_profile_uses_given_backend(monkeypatch):
+    df = pd.DataFrame({'a': [1.0, 2.0, 3.0]})
+    used = []
+    monkeypatch.setattr('smartdata.profiler.describe', lambda frame, backend: used.append(backend) or frame.describe())
+    build_df_profile(df, backend='polars')
+    build_df_profile(df, backend='pandas')
+    assert used == ['polars']
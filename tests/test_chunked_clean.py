@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from smartdata.chunked_clean import clean_file
+from smartdata.util import clean_dataframe
+
+from .conftest import make_dirty_frame
+
+def test_int_column_missing_only_in_later_chunks(tmp_path):
+    # Chunks without nulls are read as int64, so the writer must not take the first chunk's schema
+    values = [1, 2] * 50 + [None] * 5
+    pq.write_table(pa.table({'a': pa.array(values, type=pa.int64()), 'b': list(range(105))}), tmp_path / 'in.parquet')
+    clean_file(tmp_path / 'in.parquet', tmp_path / 'out.parquet', chunksize=25)
+    result = pd.read_parquet(tmp_path / 'out.parquet')
+    assert result['a'].dtype == np.float64
+    assert (result['a'].iloc[100:] == 1.5).all()
+
+def test_nullable_int_column(tmp_path):
+    pd.DataFrame({'a': pd.array([1, 2, None, 4] * 10, dtype='Int64'), 'b': range(40)}).to_parquet(tmp_path / 'in.parquet', index=False)
+    clean_file(tmp_path / 'in.parquet', tmp_path / 'out.parquet', chunksize=8)
+    result = pd.read_parquet(tmp_path / 'out.parquet')
+    assert result['a'].dtype == np.float64
+    assert (result['a'].iloc[2::4] == 7 / 3).all()
+
+@pytest.mark.filterwarnings('ignore')
+@pytest.mark.parametrize('file_format', ['csv', 'parquet'])
+def test_clean_file_matches_clean_dataframe(tmp_path, file_format):
+    df = make_dirty_frame()
+    input_path, output_path = tmp_path / f'in.{file_format}', tmp_path / f'out.{file_format}'
+    if file_format == 'csv':
+        df.to_csv(input_path, index=False)
+        read = pd.read_csv
+    else:
+        # Parquet cannot store a column mixing numbers and strings
+        df.drop(columns='object_numeric').to_parquet(input_path, index=False)
+        read = pd.read_parquet
+
+    summary = clean_file(input_path, output_path, chunksize=64)
+    expected, expected_summary = clean_dataframe(read(input_path))
+    expected_path = tmp_path / f'expected.{file_format}'
+    if file_format == 'csv':
+        expected.to_csv(expected_path, index=False)
+    else:
+        expected.to_parquet(expected_path, index=False)
+    pd.testing.assert_frame_equal(read(output_path), read(expected_path))
+    assert summary == expected_summary
@@ -0,0 +1,41 @@
+import warnings
+
+import pandas as pd
+import pytest
+
+from smartdata.util import clean_dataframe, legacy_numeric_dtype
+
+def clean_legacy(df):
+    with warnings.catch_warnings():
+        # The legacy loop uses chained inplace fillna, which pandas warns about
+        warnings.simplefilter('ignore')
+        return clean_dataframe(df, vectorized=False)
+
+def test_vectorized_matches_legacy(dirty_frame):
+    legacy, legacy_summary = clean_legacy(dirty_frame)
+    vectorized, vectorized_summary = clean_dataframe(dirty_frame)
+    pd.testing.assert_frame_equal(vectorized, legacy)
+    assert vectorized_summary == legacy_summary
+
+def test_vectorized_upcasts_numeric_columns_like_legacy(dirty_frame):
+    vectorized, _ = clean_dataframe(dirty_frame)
+    assert vectorized['float32'].dtype == 'float64'
+    assert vectorized['Int64_na'].dtype == 'float64'
+
+@pytest.mark.parametrize('series, dtype', [
+    (pd.Series([1.5, None], dtype='float32'), 'float64'),
+    (pd.Series([1, 2], dtype='int8'), 'int64'),
+    (pd.Series([1, 2], dtype='Int64'), 'int64'),
+    (pd.Series([1, None], dtype='Int64'), 'float64'),
+    (pd.Series([1.5, None], dtype='Float32'), 'float64'),
+    (pd.Series([2 ** 63 + 5], dtype='uint64'), 'uint64'),
+])
+def test_legacy_numeric_dtype_matches_apply(series, dtype):
+    from smartdata.util import replace_invalid_values
+    assert legacy_numeric_dtype(series) == dtype
+    assert series.apply(replace_invalid_values).dtype == dtype
+
+def test_clean_dataframe_keeps_input(dirty_frame):
+    before = dirty_frame.copy()
+    clean_dataframe(dirty_frame)
+    pd.testing.assert_frame_equal(dirty_frame, before)
@@ -0,0 +1,28 @@
+import numpy as np
+import pandas as pd
+
+from smartdata.util import compact_dataframe, compact_dtype
+
+def test_compaction_keeps_every_value(dirty_frame):
+    df_compact, report = compact_dataframe(dirty_frame)
+    assert report['columns']
+    assert report['bytes_after'] < report['bytes_before']
+    for col in dirty_frame.columns:
+        restored = df_compact[col].astype(object) if isinstance(df_compact[col].dtype, pd.CategoricalDtype) else df_compact[col]
+        restored = restored.astype(dirty_frame[col].dtype)
+        pd.testing.assert_series_equal(restored, dirty_frame[col], check_exact=True)
+
+def test_small_integers_are_not_narrowed_below_32_bits():
+    df = pd.DataFrame({
+        'int64': np.arange(100, dtype='int64'),
+        'whole_float': np.arange(100, dtype='float64'),
+        'whole_float_na': np.where(np.arange(100) % 7 == 0, np.nan, np.arange(100)),
+        'Int64': pd.array(np.arange(100), dtype='Int64'),
+    })
+    df_compact, _ = compact_dataframe(df)
+    for col in df.columns:
+        assert df_compact[col].dtype.itemsize >= 4
+        # int8 would wrap around here
+        np.testing.assert_array_equal((df_compact[col] * 1000).astype('float64'), (df[col] * 1000).astype('float64'))
+    assert compact_dtype(df['int64']) == np.dtype('int32')
+    assert compact_dtype(pd.Series(np.arange(10), dtype='int32')) is None
@@ -0,0 +1,54 @@
+import gc
+import weakref
+
+import pandas as pd
+import pytest
+
+from smartdata import SmartData
+
+def frame():
+    return pd.DataFrame({'a': [1, 2, 3], 'b': ['x', 'y', 'z']})
+
+def test_df_list_is_writable():
+    sd = SmartData(frame())
+    df = sd.df_list
+    df['a'] += 1
+    df.loc[0, 'a'] = 10
+    assert df['a'].tolist() == [10, 3, 4]
+    # The session data only changes once the frame is assigned back
+    assert sd.working_copy()['a'].tolist() == [1, 2, 3]
+    sd.df_list = df
+    assert sd.working_copy()['a'].tolist() == [10, 3, 4]
+
+def test_agent_frames_stay_read_only():
+    sd = SmartData(frame())
+    df = sd.working_copy()
+    with pytest.raises(ValueError):
+        df.loc[0, 'a'] = 10
+
+def test_session_does_not_keep_copies():
+    sd = SmartData(frame())
+    df = sd.df_list
+    assert sd.df_list is df
+    ref = weakref.ref(df)
+    del df
+    gc.collect()
+    assert ref() is None
+    assert sd.df_list['a'].tolist() == [1, 2, 3]
+
+def test_list_frames_are_writable():
+    sd = SmartData([frame(), frame()])
+    for df in sd.df_list:
+        df.loc[0, 'a'] = 10
+
+def test_run_model_returns_writable_frame(sent_seeds):
+    sd = SmartData(frame())
+    df = sd.run_model('What is the mean of a?')[4]
+    df['a'] += 1
+
+@pytest.mark.filterwarnings('ignore')
+def test_clean_data_without_ai_returns_writable_frame():
+    sd = SmartData(frame())
+    _, df = sd.clean_data_without_ai()
+    assert df is sd.df_list
+    df.loc[0, 'a'] = 10
@@ -0,0 +1,60 @@
+import threading
+import time
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import pandas as pd
+
+from smartdata import SmartData
+
+def test_hedged_run_closes_losing_figures(sent_seeds, monkeypatch):
+    sd = SmartData(pd.DataFrame({'a': [1, 2, 3]}))
+    figures = {}
+    finished = threading.Event()
+
+    def attempt(question_with_history, seed, cancel_event):
+        # Seed 0 is stopped, seed 1 wins and seed 2 only finishes after it has been cancelled
+        if seed == 1:
+            time.sleep(0.2)
+        if seed == 2:
+            cancel_event.wait(5)
+        figures[seed] = plt.figure()
+        images = sd.render_images([figures[seed]])
+        if seed == 2:
+            finished.set()
+        return {'seed': seed, 'answer': 'Agent stopped' if seed == 0 else f'answer {seed}', 'response': {}, 'code_list': [],
+                'image_fig_list': images, 'df_change': [], 'code_list_plot_wo_add_on': [], 'code_list_plot_with_add_on': [],
+                'code_list_datachange_with_add_on': []}
+
+    monkeypatch.setattr(sd, 'run_isolated_attempt', attempt)
+    result = sd.run_model('Plot a', hedged_attempts=3)
+    assert finished.wait(5)
+    # The cancelled attempt's figure is closed once its future is done, just after it returns
+    deadline = time.monotonic() + 5
+    while plt.fignum_exists(figures[2].number) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert result[0] == 'answer 1'
+    assert result[3] == [figures[1]]
+    assert plt.fignum_exists(figures[1].number)
+    assert not plt.fignum_exists(figures[0].number)
+    assert not plt.fignum_exists(figures[2].number)
+    assert list(sd.retained_images) == [figures[1]]
+    sd.release_images()
+
+def test_failed_hedged_attempt_is_logged(sent_seeds, monkeypatch, caplog, capsys):
+    sd = SmartData(pd.DataFrame({'a': [1, 2, 3]}))
+
+    def attempt(question_with_history, seed, cancel_event):
+        if seed == 0:
+            raise RuntimeError('connection reset')
+        time.sleep(0.1)
+        return {'seed': seed, 'answer': 'answer', 'response': {}, 'code_list': [], 'image_fig_list': [], 'df_change': [],
+                'code_list_plot_wo_add_on': [], 'code_list_plot_with_add_on': [], 'code_list_datachange_with_add_on': []}
+
+    monkeypatch.setattr(sd, 'run_isolated_attempt', attempt)
+    with caplog.at_level('WARNING', logger='SmartData'):
+        assert sd.run_model('Mean of a?', hedged_attempts=2)[0] == 'answer'
+    [record] = [record for record in caplog.records if 'seed 0' in record.getMessage()]
+    assert 'connection reset' in str(record.exc_info[1])
+    assert 'Fail to process' not in capsys.readouterr().out
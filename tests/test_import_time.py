@@ -0,0 +1,36 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Same budget as benchmarks/bench_import.py
+IMPORT_BUDGET_MS = 50
+LAZY_MODULES = ['langchain_openai', 'openai', 'langchain.agents', 'langchain_experimental']
+
+def run_importtime(statement):
+    """Cumulative import milliseconds per module from python -X importtime, and the lazy modules statement loaded."""
+    code = f"{statement}\nimport sys\nprint(','.join(m for m in {LAZY_MODULES!r} if m in sys.modules))"
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=ROOT, capture_output=True, text=True, check=True)
+    cumulative = {}
+    for line in process.stderr.splitlines():
+        if line.startswith('import time:') and 'cumulative' not in line:
+            _, microseconds, name = line.split('|')
+            cumulative[name.strip()] = int(microseconds) / 1000
+    loaded = [name for name in process.stdout.strip().split(',') if name]
+    return cumulative, loaded
+
+def test_import_smartdata_within_budget():
+    cumulative, loaded = run_importtime('import smartdata')
+    assert cumulative['smartdata'] <= IMPORT_BUDGET_MS
+    assert loaded == []
+
+@pytest.mark.parametrize('statement', [
+    'from smartdata import SmartData',
+    'import pandas as pd\nfrom smartdata import SmartData\nSmartData(pd.DataFrame({"a": [1]}))',
+])
+def test_smartdata_does_not_load_agent_stack(statement):
+    _, loaded = run_importtime(statement)
+    assert loaded == []
@@ -0,0 +1,93 @@
+import threading
+import time
+
+import pytest
+
+from smartdata.memory import Memory, SQLiteMemory, _sqlite_connection, compact_memory, estimate_tokens
+
+def remember_turn(memory, key, question, answer):
+    memory.remember(key, 'Human', question)
+    memory.remember(key, 'AI', answer)
+
+def test_history_fits_budget():
+    memory = Memory(token_budget=200, truncate_chars=100)
+    for key in range(1, 6):
+        remember_turn(memory, key, f'question {key}', 'answer ' * 20)
+    history = memory.render_last_conversation(5)
+    assert estimate_tokens(history) <= 200 + 1
+    assert '5:' in history
+
+def test_newest_turn_over_budget_is_cut_not_dropped():
+    memory = Memory(token_budget=50, truncate_chars=1000)
+    remember_turn(memory, 1, 'older question', 'older answer')
+    remember_turn(memory, 2, 'q' * 2000, 'a' * 2000)
+    history = memory.render_last_conversation(2)
+    assert history != '{}'
+    assert history.startswith('{2:')
+    assert 'older' not in history
+    assert estimate_tokens(history) <= 50 + 1
+
+def test_newest_turn_kept_under_tiny_budget():
+    memory = Memory(token_budget=1)
+    remember_turn(memory, 1, 'question', 'answer')
+    history = memory.render_last_conversation(1)
+    assert history.startswith('{1:')
+    assert 'Human' in history
+
+@pytest.fixture
+def memory_path(tmp_path):
+    path = str(tmp_path / 'memory.sqlite')
+    yield path
+    _sqlite_connection(path)[0].close()
+    _sqlite_connection.cache_clear()
+
+def test_sqlite_memory_persists_across_instances(memory_path):
+    memory = SQLiteMemory(session_id='s', path=memory_path, compact_interval=None)
+    remember_turn(memory, 1, 'question 1', 'answer 1')
+    remember_turn(memory, 2, 'question 2', 'answer 2')
+    memory.flush()
+    history = memory.render_last_conversation(2)
+    # A new connection, as after a restart
+    _sqlite_connection(memory_path)[0].close()
+    _sqlite_connection.cache_clear()
+    resumed = SQLiteMemory(session_id='s', path=memory_path, compact_interval=None)
+    assert resumed.recall(2) == {'Human': 'question 2', 'AI': 'answer 2', 'Plot Code Generate By AI': []}
+    assert resumed.next_key() == 3
+    assert resumed.render_last_conversation(2) == history
+    assert not SQLiteMemory(session_id='other', path=memory_path, compact_interval=None).is_not_empty()
+
+def test_sqlite_memory_evicts_beyond_max_turns(memory_path):
+    memory = SQLiteMemory(session_id='s', path=memory_path, max_turns=3, batch_size=1, compact_interval=None)
+    for key in range(1, 6):
+        remember_turn(memory, key, f'question {key}', f'answer {key}')
+    assert list(memory.recall_last_conversation(10)) == [3, 4, 5]
+
+def test_compaction_racing_writes_keeps_live_turns(memory_path):
+    stale = SQLiteMemory(session_id='stale', path=memory_path, batch_size=1, compact_interval=None)
+    remember_turn(stale, 1, 'stale question', 'stale answer')
+    live = SQLiteMemory(session_id='live', path=memory_path, batch_size=1, compact_interval=None)
+    remember_turn(live, 1, 'question 1', 'answer 1')
+    connection, lock = _sqlite_connection(memory_path)
+    with lock, connection:
+        connection.execute("UPDATE sessions SET updated = 0")
+
+    done = threading.Event()
+    removed = []
+
+    def compact():
+        while not done.is_set():
+            removed.append(compact_memory(memory_path, session_ttl=60))
+            time.sleep(0.001)
+
+    compactor = threading.Thread(target=compact)
+    compactor.start()
+    try:
+        for key in range(2, 102):
+            remember_turn(live, key, f'question {key}', f'answer {key}')
+    finally:
+        done.set()
+        compactor.join()
+    # The first write refreshes the live session; every turn written after it survives compaction
+    assert list(live.recall_last_conversation(200))[-100:] == list(range(2, 102))
+    assert not stale.is_not_empty()
+    assert sum(removed) <= 2
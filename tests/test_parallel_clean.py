@@ -0,0 +1,19 @@
+import pandas as pd
+import pytest
+
+from smartdata.util import clean_dataframe, process_context
+
+@pytest.mark.filterwarnings('error::pandas.errors.SettingWithCopyWarning')
+@pytest.mark.parametrize('parallel_backend', ['thread', 'process'])
+def test_parallel_matches_serial(dirty_frame, parallel_backend):
+    serial, serial_summary = clean_dataframe(dirty_frame)
+    parallel, parallel_summary = clean_dataframe(dirty_frame, workers=3, parallel_backend=parallel_backend)
+    pd.testing.assert_frame_equal(parallel, serial)
+    assert parallel_summary == serial_summary
+
+def test_process_workers_are_not_forked():
+    assert process_context().get_start_method() in ('forkserver', 'spawn')
+
+def test_unknown_parallel_backend(dirty_frame):
+    with pytest.raises(ValueError):
+        clean_dataframe(dirty_frame, workers=2, parallel_backend='gpu')
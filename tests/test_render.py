@@ -0,0 +1,85 @@
+import pickle
+import struct
+
+import matplotlib
+import pandas as pd
+import pytest
+
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+
+import smartdata.modeler as modeler
+from smartdata import SmartData
+from smartdata.render import FigureRenderer, ImageHandle
+
+@pytest.fixture
+def renderer():
+    renderer = FigureRenderer(workers=2, format='png', dpi=50)
+    yield renderer
+    renderer.close()
+
+def make_figure():
+    fig, ax = plt.subplots(figsize=(4, 3))
+    ax.plot([1, 2, 3])
+    return fig
+
+def png_size(data):
+    assert data[:8] == b'\x89PNG\r\n\x1a\n'
+    return struct.unpack('>II', data[16:24])
+
+def test_png_size_follows_dpi(renderer):
+    assert png_size(renderer.render(make_figure()).data) == (200, 150)
+    assert png_size(renderer.render(make_figure(), dpi=100).data) == (400, 300)
+
+def test_svg_output(renderer):
+    image = renderer.render(make_figure(), format='svg')
+    assert image.media_type == 'image/svg+xml'
+    assert b'<svg' in image.data
+    assert image._repr_png_() is None
+    assert image.data_uri().startswith('data:image/svg+xml;base64,')
+
+def test_unknown_format_is_rejected():
+    with pytest.raises(ValueError):
+        FigureRenderer(format='jpeg')
+
+def test_render_closes_figure_in_pyplot(renderer):
+    fig = make_figure()
+    image = renderer.render(fig)
+    assert not plt.fignum_exists(fig.number)
+    assert image.data
+
+def test_released_image_drops_its_bytes(renderer):
+    image = renderer.render(make_figure())
+    data = image.data
+    assert image.nbytes == len(data) > 0
+    copy = pickle.loads(pickle.dumps(image))
+    image.release()
+    assert image.nbytes == 0
+    with pytest.raises(ValueError):
+        image.data
+    # A pickled copy keeps the bytes it was pickled with
+    assert png_size(copy.data) == (200, 150)
+
+def test_session_keeps_at_most_max_images(renderer, monkeypatch):
+    monkeypatch.setitem(modeler.config, 'RENDER_MAX_IMAGES', 2)
+    sd = SmartData(pd.DataFrame({'a': [1, 2, 3]}), renderer=renderer)
+    images = sd.render_images([make_figure() for _ in range(3)])
+    assert all(isinstance(image, ImageHandle) for image in images)
+    assert images[0].released
+    assert not any(image.released for image in images[1:])
+    assert list(sd.retained_images) == images[1:]
+    sd.release_images()
+    assert all(image.released for image in images)
+    assert not sd.retained_images
+
+def test_session_without_renderer_closes_old_figures(monkeypatch):
+    monkeypatch.setitem(modeler.config, 'RENDER_MAX_IMAGES', 1)
+    monkeypatch.setitem(modeler.config, 'RENDER_FORMAT', None)
+    sd = SmartData(pd.DataFrame({'a': [1, 2, 3]}))
+    figures = [make_figure() for _ in range(2)]
+    assert sd.render_images(figures) == figures
+    assert not plt.fignum_exists(figures[0].number)
+    assert plt.fignum_exists(figures[1].number)
+    sd.discard_images(figures[1:])
+    assert not plt.fignum_exists(figures[1].number)
+    assert not sd.retained_images
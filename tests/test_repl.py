@@ -0,0 +1,28 @@
+import threading
+
+import pandas as pd
+
+from smartdata.custom_agent import DataFramePythonREPLTool
+
+def test_concurrent_queries_capture_their_own_output():
+    # Both queries wait for each other inside exec, which only works if runs are not serialized
+    barrier = threading.Barrier(2, timeout=5)
+    tools = [DataFramePythonREPLTool(locals={'df': pd.DataFrame({'a': [i]}), 'barrier': barrier}) for i in range(2)]
+    results = [None, None]
+
+    def run(i):
+        results[i] = tools[i].run("barrier.wait()\nprint(f'session {df.a[0]}' * 100)")
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == ['session 0' * 100 + '\n', 'session 1' * 100 + '\n']
+
+def test_output_outside_queries_is_not_captured(capsys):
+    tool = DataFramePythonREPLTool(locals={})
+    assert tool.run("print('captured')") == 'captured\n'
+    print('not captured')
+    assert 'not captured' in capsys.readouterr().out
+    assert tool.run('1 + 1') == 2
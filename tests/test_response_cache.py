@@ -0,0 +1,90 @@
+import threading
+
+import pandas as pd
+import pytest
+
+from smartdata import SmartData
+from smartdata.response_cache import MemoryResponseCache, SQLiteResponseCache
+
+from .conftest import ANSWER
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def make_cache(request, tmp_path):
+    caches = []
+
+    def make(max_size=10, ttl=None):
+        if request.param == 'memory':
+            cache = MemoryResponseCache(max_size=max_size, ttl=ttl)
+        else:
+            cache = SQLiteResponseCache(path=str(tmp_path / f'responses{len(caches)}.db'), max_size=max_size, ttl=ttl)
+        caches.append(cache)
+        return cache
+
+    yield make
+    for cache in caches:
+        if isinstance(cache, SQLiteResponseCache):
+            cache.connection.close()
+
+def test_hit_across_sessions_on_same_data(answered_seeds, make_cache):
+    cache = make_cache()
+    first = SmartData(pd.DataFrame({'a': [1, 2, 3]}), response_cache=cache)
+    assert first.run_model('What is the mean of a?')[0] == ANSWER
+    requests = len(answered_seeds)
+    second = SmartData(pd.DataFrame({'a': [1, 2, 3]}), response_cache=cache)
+    assert second.run_model('What is the mean of a?')[0] == ANSWER
+    assert len(answered_seeds) == requests
+    assert cache.stats()['hits'] == 1
+
+def test_miss_after_data_changes(answered_seeds, make_cache):
+    cache = make_cache()
+    SmartData(pd.DataFrame({'a': [1, 2, 3]}), response_cache=cache).run_model('What is the mean of a?')
+    requests = len(answered_seeds)
+    SmartData(pd.DataFrame({'a': [1, 2, 4]}), response_cache=cache).run_model('What is the mean of a?')
+    assert len(answered_seeds) > requests
+    assert cache.stats()['hits'] == 0
+
+def test_stopped_answers_are_not_stored(sent_seeds, make_cache):
+    cache = make_cache()
+    SmartData(pd.DataFrame({'a': [1, 2, 3]}), response_cache=cache).run_model('What is the mean of a?')
+    assert cache.stats()['size'] == 0
+    SmartData(pd.DataFrame({'a': [1, 2, 3]}), response_cache=cache).run_model('What is the mean of a?')
+    assert sent_seeds == [0, 1, 2, 0, 1, 2]
+
+def test_ttl_expiry(make_cache, monkeypatch):
+    import smartdata.response_cache as response_cache
+    now = [1000.0]
+    monkeypatch.setattr(response_cache.time, 'time', lambda: now[0])
+    cache = make_cache(ttl=60)
+    cache.put('key', {'output': ANSWER})
+    now[0] += 59
+    assert cache.get('key') == {'output': ANSWER}
+    now[0] += 2
+    assert cache.get('key') is None
+    assert cache.stats()['expirations'] == 1
+    assert cache.stats()['size'] == 0
+
+def test_lru_eviction_past_max_size(make_cache, monkeypatch):
+    import smartdata.response_cache as response_cache
+    now = [1000.0]
+    # Distinct timestamps, so the SQLite backend orders accesses the same way
+    monkeypatch.setattr(response_cache.time, 'time', lambda: now[0])
+    cache = make_cache(max_size=2)
+    for key in ['a', 'b']:
+        now[0] += 1
+        cache.put(key, {'output': key})
+    now[0] += 1
+    cache.get('a')
+    now[0] += 1
+    cache.put('c', {'output': 'c'})
+    assert cache.get('b') is None
+    assert cache.get('a') == {'output': 'a'}
+    assert cache.get('c') == {'output': 'c'}
+    stats = cache.stats()
+    assert stats['evictions'] == 1
+    assert stats['size'] == 2
+
+def test_unpicklable_response_is_skipped(make_cache):
+    cache = make_cache()
+    assert not cache.put('key', {'output': ANSWER, 'intermediate_steps': [threading.Lock()]})
+    assert cache.get('key') is None
+    assert cache.stats()['size'] == 0
@@ -0,0 +1,86 @@
+import gc
+import os
+from multiprocessing import shared_memory
+
+import pandas as pd
+import pytest
+
+from smartdata.custom_agent import SandboxPythonREPLTool
+from smartdata.sandbox import SandboxPool, SandboxTimeoutError, SandboxWorkerError
+
+pytest.importorskip('pyarrow')
+
+MEMORY_LIMIT = 2 * 1024 ** 3
+
+@pytest.fixture(scope='module')
+def pool():
+    pool = SandboxPool(workers=1, timeout=10, memory_limit=MEMORY_LIMIT)
+    yield pool
+    pool.close()
+
+def segment_exists(name):
+    try:
+        segment = shared_memory.SharedMemory(name=name)
+    except FileNotFoundError:
+        return False
+    segment.close()
+    return True
+
+def test_frame_round_trips(pool, dirty_frame):
+    df = dirty_frame.dropna(axis=1, how='all')
+    result = pool.execute('round-trip', {'df': df}, "df_update = df.copy()\nlen(df_update)")
+    assert not result['error']
+    assert result['output'] == str(len(df))
+    pd.testing.assert_frame_equal(result['df_update'], df)
+
+def test_infinite_loop_is_killed_and_reported(pool):
+    worker = pool.workers[0]
+    process = worker.process
+    with pytest.raises(SandboxTimeoutError):
+        pool.execute('loop', {}, "while True:\n    pass", timeout=1)
+    assert not process.is_alive()
+    tool = SandboxPythonREPLTool(pool=pool, session_id='loop')
+    pool.timeout, timeout = 1, pool.timeout
+    try:
+        assert tool.run("while True:\n    pass").startswith('SandboxTimeoutError')
+    finally:
+        pool.timeout = timeout
+    assert pool.execute('loop', {}, "1 + 1")['output'] == '2'
+
+def test_memory_limit_is_enforced_and_reported(pool):
+    result = pool.execute('memory', {}, f"x = bytearray({2 * MEMORY_LIMIT})")
+    assert result['error']
+    assert result['output'].startswith('MemoryError')
+    tool = SandboxPythonREPLTool(pool=pool, session_id='memory')
+    assert tool.run(f"x = bytearray({2 * MEMORY_LIMIT})").startswith('MemoryError')
+    assert pool.execute('memory', {}, "1 + 1")['output'] == '2'
+
+def test_crashed_worker_is_replaced(pool):
+    process = pool.workers[0].process
+    with pytest.raises(SandboxWorkerError):
+        pool.execute('crash', {}, "import os\nos._exit(1)")
+    assert pool.workers[0].process is not process
+    assert pool.workers[0].process.is_alive()
+    assert pool.execute('crash', {}, "1 + 1")['output'] == '2'
+
+def test_shared_memory_is_unlinked(pool):
+    before = set(os.listdir('/dev/shm')) if os.path.isdir('/dev/shm') else None
+    df = pd.DataFrame({'a': range(1000)})
+    name = pool.share(df)[1]
+    pool.execute('unlink', {'df': df}, "df_update = df * 2")
+    assert segment_exists(name)
+    if before is not None:
+        # The df_update segment written by the worker is gone once the result is read
+        assert set(os.listdir('/dev/shm')) - before == {name.lstrip('/')}
+    del df
+    gc.collect()
+    assert not segment_exists(name)
+    assert all(ref() is not None for ref, _, _ in pool.shared_frames.values())
+
+def test_close_unlinks_shared_frames():
+    pool = SandboxPool(workers=1)
+    df = pd.DataFrame({'a': range(10)})
+    name = pool.share(df)[1]
+    pool.close()
+    assert not segment_exists(name)
+    assert all(worker.process is None for worker in pool.workers)
@@ -0,0 +1,50 @@
+import pandas as pd
+import pytest
+
+from smartdata import SmartData
+
+@pytest.mark.parametrize('hedged_attempts', [1, 2])
+def test_each_attempt_sends_its_seed(sent_seeds, hedged_attempts):
+    sd = SmartData(pd.DataFrame({'a': [1, 2, 3]}))
+    sd.run_model('What is the mean of a?', hedged_attempts=hedged_attempts)
+    assert sorted(sent_seeds) == [0, 1, 2]
+
+def test_batch_attempts_send_their_seed(sent_seeds):
+    sd = SmartData(pd.DataFrame({'a': [1, 2, 3]}))
+    sd.run_many(['What is the mean of a?'], concurrency=1)
+    assert sent_seeds == [0, 1, 2]
+
+def test_retries_reuse_executor_per_seed(sent_seeds):
+    sd = SmartData(pd.DataFrame({'a': [1, 2, 3]}))
+    sd.run_model('What is the mean of a?')
+    executors = {key: executor for key, (_, executor) in sd.models.items()}
+    sd.run_model('What is the max of a?')
+    assert len(executors) == 3
+    assert {key: executor for key, (_, executor) in sd.models.items()} == executors
+    assert sent_seeds == [0, 1, 2, 0, 1, 2]
+
+def test_chat_model_passed_in_is_kept(sent_seeds):
+    from langchain_openai import ChatOpenAI
+    llm = ChatOpenAI(model='gpt-4o-mini', seed=7)
+    sd = SmartData(pd.DataFrame({'a': [1, 2, 3]}), llm=llm)
+    sd.run_model('What is the mean of a?')
+    assert sd.llm is llm
+    assert sent_seeds == [7, 7, 7]
+
+def test_failed_batch_attempt_is_logged_and_counted(sent_seeds, monkeypatch, caplog, capsys):
+    sd = SmartData(pd.DataFrame({'a': [1, 2, 3]}))
+    run_attempt = sd.run_attempt
+
+    def failing_first_seed(agent_executor, df, question_with_history, seed, run_config):
+        if seed == 0:
+            raise RuntimeError('connection reset')
+        return run_attempt(agent_executor, df, question_with_history, seed, run_config)
+
+    monkeypatch.setattr(sd, 'run_attempt', failing_first_seed)
+    with caplog.at_level('WARNING', logger='SmartData'):
+        _, stats = sd.run_many(['What is the mean of a?'], concurrency=1)
+    assert stats['failed_attempts'] == 1
+    assert stats['failed'] == 0
+    [record] = [record for record in caplog.records if 'seed 0' in record.getMessage()]
+    assert 'connection reset' in str(record.exc_info[1])
+    assert 'Fail to process' not in capsys.readouterr().out
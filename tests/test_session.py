@@ -0,0 +1,68 @@
+import gc
+import threading
+import weakref
+
+import pandas as pd
+import pytest
+
+from smartdata.session import SessionManager
+
+def frame(rows=1000):
+    return pd.DataFrame({'a': range(rows), 'b': [f'value {i}' for i in range(rows)]})
+
+@pytest.fixture
+def manager():
+    manager = SessionManager(max_bytes=1)
+    yield manager
+    for session_id in list(manager.sessions):
+        manager.remove(session_id)
+
+def test_spill_frees_frames_and_reloads(manager, sent_seeds):
+    session_id = manager.create(frame())
+    with manager.session(session_id) as smartdata:
+        smartdata.create_model()
+        ref = weakref.ref(smartdata._df_list)
+    # Leaving the block spills the session, as it is over max_bytes
+    assert session_id in manager.spilled
+    assert manager.resident_bytes() == 0
+    gc.collect()
+    assert ref() is None
+
+    with manager.session(session_id) as smartdata:
+        pd.testing.assert_frame_equal(smartdata.working_copy(), frame())
+        smartdata.create_model()
+    assert manager.reloads == 1
+
+def test_session_in_use_is_not_spilled_by_other_requests(manager):
+    # Other threads open sessions, which spills every session not in use, while the first one is being used
+    first = manager.create(frame())
+    others = [manager.create(frame()) for _ in range(4)]
+    inside = threading.Event()
+    done = threading.Event()
+    errors = []
+
+    def use_others():
+        inside.wait(5)
+        try:
+            for _ in range(3):
+                for session_id in others:
+                    with manager.session(session_id):
+                        pass
+        except Exception as e:
+            errors.append(e)
+        done.set()
+
+    thread = threading.Thread(target=use_others)
+    thread.start()
+    with manager.session(first) as smartdata:
+        inside.set()
+        assert done.wait(10)
+        assert first not in manager.spilled
+        assert smartdata._df_list is not None and smartdata.memory is not None
+        pd.testing.assert_frame_equal(smartdata.working_copy(), frame())
+    thread.join()
+    assert errors == []
+    assert first in manager.spilled
+
+def test_no_unpinned_access(manager):
+    assert not hasattr(manager, 'get')
@@ -0,0 +1,44 @@
+import asyncio
+
+import pandas as pd
+
+import smartdata.modeler as modeler
+from smartdata import SmartData
+
+from .conftest import ANSWER, STOPPED
+
+def event_types(events):
+    # Consecutive tokens are collapsed, since the model may send its answer in several chunks
+    types = []
+    for event in events:
+        if not (event.type == 'token' and types and types[-1] == 'token'):
+            types.append(event.type)
+    return types
+
+def collect_async(sd, question):
+    async def collect():
+        return [event async for event in sd.astream_model(question)]
+    return asyncio.run(collect())
+
+def test_stream_events_in_order(sent_seeds):
+    sd = SmartData(pd.DataFrame({'a': [1, 2, 3]}))
+    events = list(sd.stream_model('What is the mean of a?'))
+    assert event_types(events) == ['attempt', 'token', 'retry'] * 3 + ['result']
+    assert ''.join(event.text for event in events if event.type == 'token') == STOPPED * 3
+    assert [event.retry for event in events if event.type == 'retry'] == [0, 1, 2]
+    assert events[-1].answer == modeler.config['AGENT_STOP_ANSWER']
+    assert events[-1].result.trace.root.attributes['streamed']
+
+def test_astream_events_in_order(sent_seeds):
+    sd = SmartData(pd.DataFrame({'a': [1, 2, 3]}))
+    events = collect_async(sd, 'What is the mean of a?')
+    assert event_types(events) == ['attempt', 'token', 'retry'] * 3 + ['result']
+    assert [event.retry for event in events if event.type == 'attempt'] == [0, 1, 2]
+    assert events[-1].answer == modeler.config['AGENT_STOP_ANSWER']
+
+def test_stream_stops_after_an_accepted_answer(answered_seeds):
+    sd = SmartData(pd.DataFrame({'a': [1, 2, 3]}))
+    events = list(sd.stream_model('What is the mean of a?'))
+    assert event_types(events) == ['attempt', 'token', 'result']
+    assert events[-1].answer == ANSWER
+    assert event_types(collect_async(sd, 'What is the max of a?')) == ['attempt', 'token', 'result']
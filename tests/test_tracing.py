@@ -0,0 +1,115 @@
+import json
+import logging
+import threading
+
+import pandas as pd
+import pytest
+
+from smartdata import SmartData, tracing
+from smartdata.tracing import InMemoryExporter, JSONLinesExporter, LogExporter, Tracer
+
+@pytest.fixture
+def exporter():
+    return InMemoryExporter()
+
+def spans_by_id(trace):
+    return {span.span_id: span for span in trace.spans}
+
+def assert_nested(trace):
+    """Attempts hang off the root, and every agent and LLM span off an attempt or agent span of the same trace."""
+    spans = spans_by_id(trace)
+    assert trace.root.parent_id is None
+    for span in trace.spans[1:]:
+        assert span.parent_id in spans
+    for span in trace.find('attempt'):
+        assert span.parent_id == trace.root.span_id
+    for span in trace.find('agent'):
+        assert spans[span.parent_id].name == 'attempt'
+    for span in trace.find('llm'):
+        assert spans[span.parent_id].name == 'agent'
+
+def test_hedged_attempts_nest_under_the_call(sent_seeds, exporter):
+    sd = SmartData(pd.DataFrame({'a': [1, 2, 3]}), tracer=Tracer([exporter]))
+    result = sd.run_model('What is the mean of a?', hedged_attempts=2)
+    [trace] = exporter.traces
+    assert result.trace is trace is sd.last_trace
+    assert sorted(span.attributes['seed'] for span in trace.find('attempt')) == [0, 1, 2]
+    assert all(span.attributes['hedged'] for span in trace.find('attempt'))
+    assert len(trace.find('llm')) == len(sent_seeds) == 3
+    assert_nested(trace)
+    assert result.summary['attempts'] == 3
+
+def test_batch_workers_nest_under_the_batch(answered_seeds, exporter):
+    sd = SmartData(pd.DataFrame({'a': [1, 2, 3]}), tracer=Tracer([exporter]))
+    sd.run_many(['What is the mean of a?', 'What is the max of a?'], concurrency=2)
+    [trace] = [trace for trace in exporter.traces if trace.root.name == 'run_many']
+    assert sd.last_trace is trace
+    assert sorted(span.attributes['question'] for span in trace.find('attempt')) == [0, 1]
+    assert len(trace.find('llm')) == len(answered_seeds)
+    assert_nested(trace)
+
+def test_in_context_nests_spans_from_another_thread():
+    def open_child(children):
+        with tracing.span('child') as child:
+            children.append(child)
+
+    tracer = Tracer()
+    with tracer.trace('call') as trace:
+        with tracing.span('parent') as parent:
+            bound, unbound = [], []
+            threads = [threading.Thread(target=tracing.in_context(open_child), args=(bound,)),
+                       threading.Thread(target=open_child, args=(unbound,))]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+    assert bound[0].parent_id == parent.span_id
+    assert bound[0].trace is trace
+    # Without in_context the thread starts outside the trace and records nothing
+    assert unbound == [None]
+
+def test_jsonl_exporter_writes_one_line_per_trace(tmp_path):
+    path = tmp_path / 'traces.jsonl'
+    tracer = Tracer([JSONLinesExporter(str(path))])
+    for _ in range(2):
+        with tracer.trace('call', rows=3):
+            with tracing.span('llm') as span:
+                span.add(total_tokens=5)
+    lines = [json.loads(line) for line in path.read_text().splitlines()]
+    assert len(lines) == 2
+    root, llm = lines[0]['spans']
+    assert llm['parent_id'] == root['span_id']
+    assert root['attributes'] == {'rows': 3}
+    assert lines[0]['summary']['total_tokens'] == 5
+
+def test_log_exporter_logs_a_summary_line(caplog):
+    tracer = Tracer([LogExporter()])
+    with caplog.at_level(logging.INFO, logger='SmartDataTrace'):
+        with tracer.trace('call'):
+            with tracing.span('attempt'):
+                pass
+    [record] = caplog.records
+    assert record.getMessage().startswith('call ')
+    assert '1 attempts' in record.getMessage()
+
+def test_failing_exporter_does_not_fail_the_call(caplog, exporter):
+    class FailingExporter:
+        def export(self, trace):
+            raise OSError('disk full')
+
+    tracer = Tracer([FailingExporter(), exporter])
+    with caplog.at_level(logging.WARNING, logger='SmartDataTrace'):
+        with tracer.trace('call'):
+            pass
+    assert len(exporter.traces) == 1
+    assert 'disk full' in caplog.text
+
+def test_error_is_recorded_on_the_span(exporter):
+    tracer = Tracer([exporter])
+    with pytest.raises(ValueError):
+        with tracer.trace('call'):
+            with tracing.span('attempt'):
+                raise ValueError('bad code')
+    [attempt] = exporter.spans('attempt')
+    assert attempt.error == 'ValueError: bad code'
+    assert exporter.traces[0].summary()['errors'] == 2